@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Cache of the data bootstrapping the dashboard and explore views
+
+``Dashboard.data`` and the ``data`` of the datasources involve the whole
+object graph of a dashboard, and were recomputed on every page load
+though they rarely change. They are cached here along with a version made
+of two parts. The first is a generation, replaced in the cache after every
+commit that inserts, updates or deletes a dashboard, a slice, a
+datasource, a column or a metric. The second is the latest ``changed_on``
+of the dashboard, its slices, their datasources and the columns and
+metrics of those, read with a single aggregate query, for the changes
+made outside of the ORM. As ``changed_on`` only has a precision of a
+second on some databases, it can't tell changes made within the same
+second apart, which the generation does. A payload cached for an older
+version is recomputed. Saving a dashboard also drops its payload, and
+deleting a column or a metric bumps the ``changed_on`` of its datasource,
+as the deletion wouldn't show otherwise. Without a configured cache, the
+payloads are computed on every load.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime
+import logging
+import uuid
+
+import simplejson as json
+from sqlalchemy import and_, event, func, select, union_all
+from sqlalchemy.orm import join, object_session, Session
+
+from superset import app, cache
+from superset.connectors.connector_registry import ConnectorRegistry
+from superset.models.core import Dashboard, dashboard_slices, Slice
+
+config = app.config
+stats_logger = config.get('STATS_LOGGER')
+
+
+GENERATION_KEY = 'bootstrap/generation'
+
+
+def dashboard_key(dashboard_id):
+    return 'bootstrap/dashboard/{}'.format(dashboard_id)
+
+
+def datasource_key(datasource):
+    return 'bootstrap/datasource/{}'.format(datasource.uid)
+
+
+def datasource_relations(datasource_class):
+    return (
+        (datasource_class.columns, datasource_class.column_class),
+        (datasource_class.metrics, datasource_class.metric_class),
+    )
+
+
+def datasource_changed_on_selects(datasource_class, datasource_ids):
+    """Selects of the ``changed_on`` of datasources, their columns and
+    their metrics"""
+    selects = [
+        select([datasource_class.changed_on.label('changed_on')])
+        .where(datasource_class.id.in_(datasource_ids)),
+    ]
+    for relation, child_class in datasource_relations(datasource_class):
+        selects.append(
+            select([child_class.changed_on.label('changed_on')])
+            .select_from(join(datasource_class, child_class, relation))
+            .where(datasource_class.id.in_(datasource_ids)))
+    return selects
+
+
+def latest_changed_on(session, selects):
+    changed_on = union_all(*selects).alias('changed_on')
+    latest = session.query(func.max(changed_on.c.changed_on)).scalar()
+    return latest.isoformat() if latest else None
+
+
+def dashboard_version(session, dashboard_id):
+    slice_ids = (
+        select([dashboard_slices.c.slice_id])
+        .where(dashboard_slices.c.dashboard_id == dashboard_id)
+    )
+    selects = [
+        select([Dashboard.changed_on.label('changed_on')])
+        .where(Dashboard.id == dashboard_id),
+        select([Slice.changed_on.label('changed_on')])
+        .where(Slice.id.in_(slice_ids)),
+    ]
+    for datasource_type, datasource_class in ConnectorRegistry.sources.items():
+        datasource_ids = select([Slice.datasource_id]).where(and_(
+            Slice.id.in_(slice_ids), Slice.datasource_type == datasource_type))
+        selects.extend(
+            datasource_changed_on_selects(datasource_class, datasource_ids))
+    return latest_changed_on(session, selects)
+
+
+def datasource_version(session, datasource):
+    return latest_changed_on(
+        session, datasource_changed_on_selects(type(datasource), [datasource.id]))
+
+
+def new_generation():
+    generation = uuid.uuid4().hex
+    try:
+        cache.set(GENERATION_KEY, generation, timeout=0)
+    except Exception as e:
+        logging.exception(e)
+    return generation
+
+
+def get_generation():
+    """The current generation, a new one if it was evicted so that no
+    payload cached for an older one is taken for current"""
+    try:
+        generation = cache.get(GENERATION_KEY)
+    except Exception as e:
+        logging.exception(e)
+        generation = None
+    return generation or new_generation()
+
+
+def get_cached(key, get_version, compute):
+    """Value cached under ``key`` for the generation and the version
+    ``get_version()`` returns, else ``compute()``"""
+    if not cache:
+        return compute()
+    # read before computing, so that a payload computed while changes get
+    # committed is recomputed on the next load
+    version = (get_generation(), get_version())
+    try:
+        cached = cache.get(key)
+    except Exception as e:
+        logging.exception(e)
+        cached = None
+    if cached is not None and cached[0] == version:
+        stats_logger.incr('bootstrap_cache_hit')
+        return cached[1]
+    stats_logger.incr('bootstrap_cache_miss')
+    value = compute()
+    try:
+        cache.set(
+            key, (version, value),
+            timeout=config.get('BOOTSTRAP_CACHE_TIMEOUT'))
+    except Exception as e:
+        logging.exception(e)
+    return value
+
+
+def get_dashboard_payload(session, dash):
+    """The user independent part of the dashboard bootstrap data:
+    ``dashboard_data`` and the ``datasources``, keyed by uid"""
+    def compute():
+        datasources = dash.prefetch_datasources(session)
+        return {
+            'dashboard_data': dash.data,
+            'datasources': {ds.uid: ds.data for ds in datasources},
+        }
+    return get_cached(
+        dashboard_key(dash.id),
+        lambda: dashboard_version(session, dash.id),
+        compute)
+
+
+def get_datasource_json(session, datasource):
+    """``datasource.data``, serialized"""
+    return get_cached(
+        datasource_key(datasource),
+        lambda: datasource_version(session, datasource),
+        lambda: json.dumps(datasource.data))
+
+
+def invalidate_dashboard(mapper, connection, target):
+    if not cache:
+        return
+    try:
+        cache.delete(dashboard_key(target.id))
+    except Exception as e:
+        logging.exception(e)
+
+
+def mark_changed(mapper, connection, target):
+    session = object_session(target)
+    if session is not None:
+        session.info['bootstrap_changed'] = True
+
+
+def bump_generation(session):
+    """Starts a new generation once the changes marked are committed"""
+    if session.info.pop('bootstrap_changed', False) and cache:
+        new_generation()
+
+
+def touch_datasource(mapper, connection, target):
+    """Bumps the ``changed_on`` of the datasource of a deleted column or
+    metric"""
+    for datasource_class in ConnectorRegistry.sources.values():
+        for relation, child_class in datasource_relations(datasource_class):
+            if not isinstance(target, child_class):
+                continue
+            (id_col, foreign_key), = relation.property.local_remote_pairs
+            connection.execute(
+                id_col.table.update()
+                .where(id_col == getattr(target, foreign_key.key))
+                .values(changed_on=datetime.now()))
+
+
+event.listen(Dashboard, 'after_update', invalidate_dashboard)
+event.listen(Dashboard, 'after_delete', invalidate_dashboard)
+changed_classes = [Dashboard, Slice]
+for datasource_class in ConnectorRegistry.sources.values():
+    event.listen(datasource_class.column_class, 'after_delete', touch_datasource)
+    event.listen(datasource_class.metric_class, 'after_delete', touch_datasource)
+    changed_classes += [
+        datasource_class,
+        datasource_class.column_class,
+        datasource_class.metric_class,
+    ]
+for changed_class in changed_classes:
+    for event_name in ('after_insert', 'after_update', 'after_delete'):
+        event.listen(changed_class, event_name, mark_changed)
+event.listen(Session, 'after_commit', bump_generation)
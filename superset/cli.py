@@ -73,6 +73,35 @@ def console_log_run(app, port, use_reloader):
     run()
 
 
+@manager.option(
+    '-t', '--table', default=None,
+    help='Only prune this table, query or logs')
+@manager.option(
+    '-D', '--days', default=None, type=int,
+    help='Prune the rows older than this many days, instead of RETENTION_DAYS')
+def prune_tables(table, days):
+    """Archive and delete the old rows of the query and logs tables"""
+    from superset import retention
+    if table is None and days is None:
+        retention.prune_tables()
+        return
+    retention_days = config.get('RETENTION_DAYS') or {}
+    for table_name in [table] if table else sorted(retention.TIME_COLUMNS):
+        table_days = days if days is not None else retention_days.get(table_name)
+        if table_days is None:
+            print('No retention set for {}'.format(table_name))
+            continue
+        deleted = retention.prune_table(db.session(), table_name, table_days)
+        print('Pruned {} rows from {}'.format(deleted, table_name))
+
+
+@manager.command
+def partition_logs():
+    """Partition the logs table by month, on PostgreSQL 11 and later"""
+    from superset import retention
+    retention.partition_logs(db.session())
+
+
 @manager.option(
     '-d', '--debug', action='store_true',
     help='Start the web server in debug mode')
@@ -327,6 +356,13 @@ def update_datasources_cache():
             print('{}'.format(str(e)))
 
 
+@manager.command
+def refresh_filter_values_index():
+    """Refresh the materialized index of the filter values"""
+    from superset import filter_values
+    filter_values.refresh_filter_values_index()
+
+
 @manager.option(
     '-w', '--workers',
     type=int,
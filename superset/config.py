@@ -22,7 +22,11 @@ from flask_appbuilder.security.manager import AUTH_DB
 
 from superset.stats_logger import DummyStatsLogger
 
-# Realtime stats logger, a StatsD implementation exists
+# Realtime stats logger, a StatsD implementation exists. The
+# HistogramStatsLogger keeps the stats in process, including percentiles of
+# the timings, and serves them to admins at /superset/stats/. It can pass
+# them on to another stats logger, e.g.
+# STATS_LOGGER = HistogramStatsLogger(StatsdStatsLogger('localhost', 8125))
 STATS_LOGGER = DummyStatsLogger()
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
@@ -43,6 +47,20 @@ ROW_LIMIT = 50000
 VIZ_ROW_LIMIT = 10000
 # max rows retrieved by filter select auto complete
 FILTER_SELECT_ROW_LIMIT = 10000
+# Materialized index of the distinct values (and row counts) of the
+# filterable columns, kept in the RESULTS_BACKEND. It is maintained by the
+# `refresh_filter_values_index` celery task, to schedule with celery beat,
+# or the `superset refresh_filter_values_index` command. The filter
+# endpoint and the filter box read it while it is younger than
+# FILTER_VALUES_INDEX_MAX_AGE seconds.
+FILTER_VALUES_INDEX_ENABLED = False
+FILTER_VALUES_INDEX_MAX_AGE = 60 * 60
+# Refreshes only count anew the rows since the start of the latest day
+# indexed on the main time column, a full rebuild happens past this age
+# (in seconds)
+FILTER_VALUES_INDEX_REBUILD_AGE = 60 * 60 * 24
+# Columns with more distinct values than this don't get indexed
+FILTER_VALUES_INDEX_MAX_VALUES = 100000
 SUPERSET_WORKERS = 2  # deprecated
 SUPERSET_CELERY_WORKERS = 32  # deprecated
 
@@ -71,9 +89,51 @@ SQLALCHEMY_DATABASE_URI = 'sqlite:///' + os.path.join(DATA_DIR, 'superset.db')
 #     return 'secret'
 # SQLALCHEMY_CUSTOM_PASSWORD_STORE = lookup_password
 
-# The limit of queries fetched for query search
+# Connection pooling for the databases queried by Superset. When disabled,
+# each query opens, then closes, its own connection. When enabled, a pool
+# is kept per database, effective user and schema. The pool settings only
+# apply to the dialects pooling with a QueuePool, and can be overridden
+# per database through the `engine_params` of its extra.
+DATABASE_POOL_ENABLED = False
+DATABASE_POOL_SIZE = 5
+DATABASE_POOL_MAX_OVERFLOW = 10
+# Connections older than this (in seconds) are recycled
+DATABASE_POOL_RECYCLE = 3600
+# Test connections with a `SELECT 1` on checkout, replacing stale ones
+DATABASE_POOL_PRE_PING = True
+# Bounds on the engines kept, one per database, effective user and schema.
+# Engines evicted, or older than the TTL (in seconds), are disposed of.
+DATABASE_ENGINE_CACHE_SIZE = 128
+DATABASE_ENGINE_CACHE_TTL = 60 * 60 * 6
+
+# The limit of queries fetched for query search, the size of its pages
 QUERY_SEARCH_LIMIT = 1000
 
+# Retention of the query and logs tables. The rows older than the number
+# of days set for their table are deleted RETENTION_BATCH_SIZE rows at a
+# time, by the `prune_tables` celery task, to schedule with celery beat, or
+# the `superset prune_tables` command. When RETENTION_ARCHIVE_PATH is set,
+# e.g. to os.path.join(DATA_DIR, 'archive'), they are first archived there
+# as parquet files, which requires pyarrow (the `parquet` extra).
+RETENTION_DAYS = {
+    'query': None,
+    'logs': None,
+}
+RETENTION_ARCHIVE_PATH = None
+RETENTION_ARCHIVE_COMPRESSION = 'gzip'
+RETENTION_BATCH_SIZE = 10000
+# Once the logs table is partitioned by month with `superset partition_logs`
+# (PostgreSQL 11 and later), the partitions of this many months ahead are
+# kept created by the `prune_tables` task
+LOGS_PARTITIONS_AHEAD = 3
+
+# How long (in seconds) a user's permission snapshot, the set of
+# (permission, view_menu) pairs granted through their roles, is reused
+# across requests. Changes to roles invalidate it on the local process,
+# the TTL bounds staleness on other processes. Set to 0 to only reuse the
+# snapshot within a request.
+PERMISSIONS_SNAPSHOT_TTL = 60
+
 # Flask-WTF flag for CSRF
 WTF_CSRF_ENABLED = True
 
@@ -183,6 +243,11 @@ IMG_UPLOAD_URL = '/static/uploads/'
 # IMG_SIZE = (300, 200, True)
 
 CACHE_DEFAULT_TIMEOUT = 60 * 60 * 24
+
+# The data bootstrapping the dashboard view, and the datasource metadata
+# fetched by the explore view, are cached for this many seconds. They are
+# recomputed sooner whenever the objects they are made of change.
+BOOTSTRAP_CACHE_TIMEOUT = 60 * 60 * 24
 CACHE_CONFIG = {'CACHE_TYPE': 'null'}
 TABLE_NAMES_CACHE_CONFIG = {'CACHE_TYPE': 'null'}
 
@@ -194,6 +259,17 @@ CORS_OPTIONS = {}
 # TODO: Add processing of other spreadsheet formats (xls, xlsx etc)
 ALLOWED_EXTENSIONS = set(['csv'])
 
+# Uploaded CSV files are read CSV_UPLOAD_CHUNK_SIZE rows at a time, each
+# chunk being inserted while the next ones are read, by up to
+# CSV_UPLOAD_INSERT_THREADS threads. With CSV_UPLOAD_ASYNC, celery and a
+# results backend set, the uploads run on the workers, which need access
+# to the UPLOAD_FOLDER, and report their progress every
+# CSV_UPLOAD_PROGRESS_INTERVAL seconds.
+CSV_UPLOAD_CHUNK_SIZE = 10000
+CSV_UPLOAD_INSERT_THREADS = 2
+CSV_UPLOAD_ASYNC = False
+CSV_UPLOAD_PROGRESS_INTERVAL = 1
+
 # CSV Options: key/value pairs that will be passed as argument to DataFrame.to_csv method
 # note: index option should not be overridden
 CSV_EXPORT = {
@@ -268,8 +344,20 @@ WARNING_MSG = None
 # Example:
 class CeleryConfig(object):
   BROKER_URL = 'sqla+sqlite:///celerydb.sqlite'
-  CELERY_IMPORTS = ('superset.sql_lab', )
+  CELERY_IMPORTS = (
+      'superset.sql_lab', 'superset.filter_values', 'superset.retention',
+      'superset.csv_upload')
   CELERY_RESULT_BACKEND = 'db+sqlite:///celery_results.sqlite'
+  CELERYBEAT_SCHEDULE = {
+      'refresh_filter_values_index': {
+          'task': 'refresh_filter_values_index',
+          'schedule': 60 * 15,
+      },
+      'prune_tables': {
+          'task': 'prune_tables',
+          'schedule': 60 * 60 * 24,
+      },
+  }
   CELERY_ANNOTATIONS = {'tasks.add': {'rate_limit': '10/s'}}
   CELERYD_LOG_LEVEL = 'DEBUG'
   CELERYD_PREFETCH_MULTIPLIER = 1
@@ -306,6 +394,32 @@ SQLLAB_ASYNC_TIME_LIMIT_SEC = 60 * 60 * 6
 # in SQL Lab by using the "Run Async" button/feature
 RESULTS_BACKEND = None
 
+# SQL Lab results are stored in the results backend in chunks of this many
+# rows, so that paging and CSV export only decode the chunks they need
+RESULTS_BACKEND_CHUNK_SIZE = 10000
+
+# Results of async queries are fetched in batches of
+# RESULTS_BACKEND_CHUNK_SIZE rows, each written to the results backend as
+# it comes, rather than fetched as a whole. Postgres uses a server side
+# cursor to do so. The column types are inferred from the first batch, so
+# this is off by default: a later batch can disagree with them.
+SQLLAB_STREAM_RESULTS = False
+
+# While polling a running Presto or Hive query, its progress is committed
+# to the metadata database at most every this many seconds. Stops are
+# signaled through the results backend and checked on each poll, the
+# query status is only read from the metadata database every
+# SQLLAB_STATUS_CHECK_INTERVAL seconds.
+SQLLAB_PROGRESS_UPDATE_INTERVAL = 5
+SQLLAB_STATUS_CHECK_INTERVAL = 30
+
+# /superset/poll_queries/ can hold a poll until a query of the user changes,
+# for up to SQLLAB_POLL_MAX_TIMEOUT seconds. The workers and web servers
+# publish the changes to the redis server at SQLLAB_POLL_REDIS_URL, e.g.
+# 'redis://localhost:6379/1', without it polls return right away.
+SQLLAB_POLL_REDIS_URL = None
+SQLLAB_POLL_MAX_TIMEOUT = 30
+
 # The S3 bucket where you want to store your external hive tables created
 # from CSV files. For example, 'companyname-superset'
 CSV_TO_HIVE_UPLOAD_S3_BUCKET = None
@@ -378,6 +492,33 @@ BLUEPRINTS = []
 # into a proxied one
 TRACKING_URL_TRANSFORMER = lambda x: x  # noqa: E731
 
+# Actions logged by Log.log_this are written to the metadata database
+# from a background thread when ACTION_LOG_ASYNC is set, rather than
+# before the response is returned. They are inserted in batches of up to
+# ACTION_LOG_BATCH_SIZE records, at most ACTION_LOG_FLUSH_INTERVAL seconds
+# after being logged. Once ACTION_LOG_QUEUE_SIZE records are waiting, a
+# request waits up to ACTION_LOG_PUT_TIMEOUT seconds per record before
+# dropping it, the drops are reported as the action_log.dropped gauge.
+ACTION_LOG_ASYNC = False
+ACTION_LOG_QUEUE_SIZE = 10000
+ACTION_LOG_BATCH_SIZE = 500
+ACTION_LOG_FLUSH_INTERVAL = 0.5
+ACTION_LOG_PUT_TIMEOUT = 0.1
+
+# Times the phases of SQL Lab queries and of the viz requests (template
+# rendering, parsing, execution, fetching...). The timings of a SQL Lab
+# query are stored along with it and returned in its payload, those of a
+# viz request are returned in its payload. See superset.tracing
+TRACING_ENABLED = False
+
+# SQL Lab queries posted with profile=true, and this fraction of all the
+# others, are profiled: the stack of the thread running them is sampled
+# every SQLLAB_PROFILING_INTERVAL seconds. The samples are stored in the
+# results backend, admins can fetch them as collapsed stacks (the input of
+# flamegraph.pl) from /superset/query_profile/<query_id>/
+SQLLAB_PROFILING_SAMPLE_RATE = 0
+SQLLAB_PROFILING_INTERVAL = 0.01
+
 # Interval between consecutive polls when using Hive Engine
 HIVE_POLL_INTERVAL = 5
 
@@ -12,7 +12,7 @@ from sqlalchemy import (
     and_, Boolean, Column, Integer, String, Text,
 )
 from sqlalchemy.ext.declarative import declared_attr
-from sqlalchemy.orm import foreign, relationship
+from sqlalchemy.orm import foreign, relationship, selectinload
 
 from superset import utils
 from superset.models.core import Slice
@@ -238,10 +238,41 @@ class BaseDatasource(AuditMixinNullable, ImportMixin):
         values in filters in the explore view"""
         raise NotImplementedError()
 
+    def value_counts_for_column(self, column_name, since=None, limit=None):
+        """Counts the rows of each distinct value of a column
+
+        When ``since`` is set, only the rows since then are counted.
+        Returns a list of ``(value, count)`` tuples along with the latest
+        time covered by the counts, if known. This is used to build the
+        materialized index of the filter values."""
+        raise NotImplementedError()
+
+    def values_cache_params(self):
+        """Returns a dict of what, besides the datasource and the column,
+        affects the values returned by ``values_for_column``
+
+        It is part of the key the values get cached under."""
+        return {}
+
     @staticmethod
     def default_query(qry):
         return qry
 
+    @classmethod
+    def eager_load_options(cls):
+        """Loader options fetching, along with the datasources, what their
+        ``data`` is made of, in a fixed number of queries"""
+        return [selectinload(cls.columns), selectinload(cls.metrics)]
+
+    @classmethod
+    def query_perm_names(cls, session):
+        """Returns the ``(permission, view_menu)`` names needed by all the
+        datasources of this type and their restricted metrics
+
+        Only the columns involved are read, the ORM objects aren't loaded.
+        """
+        raise NotImplementedError()
+
     def get_column(self, column_name):
         for col in self.columns:
             if col.column_name == column_name:
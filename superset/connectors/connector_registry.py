@@ -76,6 +76,18 @@ class ConnectorRegistry(object):
             .one()
         )
 
+    @classmethod
+    def get_eager_datasources(cls, session, datasource_type, datasource_ids):
+        """Returns the datasources of a type with the given ids, along with
+        everything their ``data`` is made of"""
+        datasource_class = ConnectorRegistry.sources[datasource_type]
+        return (
+            session.query(datasource_class)
+            .options(*datasource_class.eager_load_options())
+            .filter(datasource_class.id.in_(datasource_ids))
+            .all()
+        )
+
     @classmethod
     def query_datasources_by_name(
             cls, session, database, datasource_name, schema=None):
@@ -34,9 +34,9 @@ import sqlalchemy as sa
 from sqlalchemy import (
     Boolean, Column, DateTime, ForeignKey, Integer, String, Text, UniqueConstraint,
 )
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, joinedload, relationship
 
-from superset import conf, db, import_util, security_manager, utils
+from superset import conf, db, import_util, security_manager, tracing, utils
 from superset.connectors.base.models import BaseColumn, BaseDatasource, BaseMetric
 from superset.exceptions import MetricPermException, SupersetException
 from superset.models.helpers import (
@@ -502,8 +502,11 @@ class DruidDatasource(Model, BaseDatasource):
 
     @property
     def schema(self):
-        ds_name = self.datasource_name or ''
-        name_pieces = ds_name.split('.')
+        return self.schema_from_name(self.datasource_name)
+
+    @staticmethod
+    def schema_from_name(datasource_name):
+        name_pieces = (datasource_name or '').split('.')
         if len(name_pieces) > 1:
             return name_pieces[0]
         else:
@@ -928,6 +931,36 @@ class DruidDatasource(Model, BaseDatasource):
         df = client.export_pandas()
         return [row[column_name] for row in df.to_records(index=False)]
 
+    def value_counts_for_column(self, column_name, since=None, limit=None):
+        if since:
+            from_dttm = since
+        elif self.fetch_values_from:
+            from_dttm = utils.parse_human_datetime(self.fetch_values_from)
+        else:
+            from_dttm = datetime(1970, 1, 1)
+        to_dttm = datetime.now()
+
+        qry = dict(
+            datasource=self.datasource_name,
+            granularity='all',
+            intervals=from_dttm.isoformat() + '/' + to_dttm.isoformat(),
+            aggregations=dict(count=count('count')),
+            dimension=column_name,
+            metric='count',
+            threshold=limit or conf.get('FILTER_VALUES_INDEX_MAX_VALUES'),
+        )
+
+        client = self.cluster.get_pydruid_client()
+        client.topn(**qry)
+        df = client.export_pandas()
+        if df is None or df.empty:
+            return [], to_dttm
+        value_counts = list(zip(df[column_name].tolist(), df['count'].tolist()))
+        return value_counts, to_dttm
+
+    def values_cache_params(self):
+        return {'fetch_values_from': self.fetch_values_from}
+
     def get_query_str(self, query_obj, phase=1, client=None):
         return self.run_query(client=client, phase=phase, **query_obj)
 
@@ -1329,9 +1362,11 @@ class DruidDatasource(Model, BaseDatasource):
     def query(self, query_obj):
         qry_start_dttm = datetime.now()
         client = self.cluster.get_pydruid_client()
-        query_str = self.get_query_str(
-            client=client, query_obj=query_obj, phase=2)
-        df = client.export_pandas()
+        with tracing.span('druid.query'):
+            query_str = self.get_query_str(
+                client=client, query_obj=query_obj, phase=2)
+        with tracing.span('druid.export_pandas'):
+            df = client.export_pandas()
 
         if df is None or df.size == 0:
             raise Exception(_('No data was returned.'))
@@ -1574,6 +1609,45 @@ class DruidDatasource(Model, BaseDatasource):
             .all()
         )
 
+    @classmethod
+    def eager_load_options(cls):
+        return super(DruidDatasource, cls).eager_load_options() + [
+            joinedload(cls.cluster)]
+
+    @classmethod
+    def query_perm_names(cls, session):
+        perm_names = []
+        qry = (
+            session.query(
+                cls.id, cls.datasource_name,
+                DruidCluster.cluster_name, DruidCluster.verbose_name)
+            .join(DruidCluster, cls.cluster_name == DruidCluster.cluster_name)
+        )
+        for id_, datasource_name, cluster_name, verbose_name in qry:
+            perm_names.append((
+                'datasource_access',
+                '[{}].[{}](id:{})'.format(cluster_name, datasource_name, id_)))
+            perm_names.append((
+                'schema_access',
+                security_manager.get_schema_perm(
+                    verbose_name or cluster_name,
+                    cls.schema_from_name(datasource_name))))
+
+        qry = (
+            session.query(
+                DruidMetric.id, DruidMetric.metric_name,
+                cls.cluster_name, cls.datasource_name)
+            .join(cls, DruidMetric.datasource_id == cls.id)
+            .filter(DruidMetric.is_restricted == True)  # noqa
+        )
+        for id_, metric_name, cluster_name, datasource_name in qry:
+            full_name = utils.get_datasource_full_name(
+                cluster_name, datasource_name)
+            perm_names.append((
+                'metric_access',
+                '{}.[{}](id:{})'.format(full_name, metric_name, id_)))
+        return perm_names
+
 
 sa.event.listen(DruidDatasource, 'after_insert', set_perm)
 sa.event.listen(DruidDatasource, 'after_update', set_perm)
@@ -18,13 +18,13 @@ from sqlalchemy import (
     and_, asc, Boolean, Column, DateTime, desc, ForeignKey, Integer, or_,
     select, String, Text,
 )
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, joinedload, relationship
 from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy.sql import column, literal_column, table, text
 from sqlalchemy.sql.expression import TextAsFrom
 import sqlparse
 
-from superset import db, import_util, security_manager, utils
+from superset import db, import_util, security_manager, tracing, utils
 from superset.connectors.base.models import BaseColumn, BaseDatasource, BaseMetric
 from superset.jinja_context import get_template_processor
 from superset.models.annotations import Annotation
@@ -415,6 +415,63 @@ class SqlaTable(Model, BaseDatasource):
         df = pd.read_sql_query(sql=sql, con=engine)
         return [row[0] for row in df.to_records(index=False)]
 
+    def value_counts_for_column(self, column_name, since=None, limit=None):
+        cols = {col.column_name: col for col in self.columns}
+        target_col = cols[column_name]
+        dttm_col = cols.get(self.main_dttm_col)
+        tp = self.get_template_processor()
+        db_engine_spec = self.database.db_engine_spec
+
+        select_exprs = [
+            target_col.sqla_col,
+            literal_column('COUNT(*)').label('__count'),
+        ]
+        if dttm_col is not None:
+            select_exprs.append(
+                sa.func.max(dttm_col.get_timestamp_expression(None))
+                .label('__max_dttm'))
+        qry = (
+            select(select_exprs)
+            .select_from(self.get_from_clause(tp, db_engine_spec))
+            .group_by(target_col.sqla_col)
+        )
+
+        where_clause_and = []
+        if self.fetch_values_predicate:
+            where_clause_and.append(
+                text(tp.process_template(self.fetch_values_predicate)))
+        if since and dttm_col is not None:
+            where_clause_and.append(
+                dttm_col.sqla_col >= text(dttm_col.dttm_sql_literal(since)))
+        if where_clause_and:
+            qry = qry.where(and_(*where_clause_and))
+        if limit:
+            qry = qry.limit(limit)
+
+        engine = self.database.get_sqla_engine()
+        sql = '{}'.format(
+            qry.compile(engine, compile_kwargs={'literal_binds': True}),
+        )
+        df = pd.read_sql_query(sql=sql, con=engine)
+
+        max_dttm = None
+        if dttm_col is not None and not df.empty:
+            max_dttm = pd.to_datetime(df['__max_dttm']).max()
+            max_dttm = None if pd.isnull(max_dttm) else max_dttm.to_pydatetime()
+        value_counts = list(zip(df[column_name].tolist(), df['__count'].tolist()))
+        return value_counts, max_dttm
+
+    def values_cache_params(self):
+        # rendered, as the templates can depend on the user or the request
+        tp = self.get_template_processor()
+        return {
+            'sql': tp.process_template(self.sql) if self.sql else None,
+            'fetch_values_predicate': (
+                tp.process_template(self.fetch_values_predicate)
+                if self.fetch_values_predicate else None),
+            'template_params': self.template_params,
+        }
+
     def get_template_processor(self, **kwargs):
         return get_template_processor(
             table=self, database=self.database, **kwargs)
@@ -722,25 +779,40 @@ class SqlaTable(Model, BaseDatasource):
         return qry.select_from(tbl)
 
     def _get_top_groups(self, df, dimensions):
-        cols = {col.column_name: col for col in self.columns}
-        groups = []
-        for unused, row in df.iterrows():
-            group = []
-            for dimension in dimensions:
-                col_obj = cols.get(dimension)
-                group.append(col_obj.sqla_col == row[dimension])
-            groups.append(and_(*group))
+        """Builds the filter on the top groups returned by the prequery
 
-        return or_(*groups)
+        Only engines without inner joins, Druid SQL, get here. A single
+        dimension is filtered with an IN, several with an OR of ANDs as
+        Druid SQL has no tuple IN. Groups holding nulls get an IS NULL.
+        """
+        cols = {col.column_name: col for col in self.columns}
+        sqla_cols = [cols.get(dimension).sqla_col for dimension in dimensions]
+        groups = list(zip(*[df[dimension].tolist() for dimension in dimensions]))
+
+        conditions = []
+        if len(dimensions) == 1:
+            values = [group[0] for group in groups]
+            in_values = [value for value in values if not pd.isnull(value)]
+            if in_values:
+                conditions.append(sqla_cols[0].in_(in_values))
+            groups = [(None,)] if len(in_values) < len(values) else []
+        for group in groups:
+            conditions.append(and_(*[
+                col == (None if pd.isnull(value) else value)
+                for col, value in zip(sqla_cols, group)
+            ]))
+        return or_(*conditions)
 
     def query(self, query_obj):
         qry_start_dttm = datetime.now()
-        sql = self.get_query_str(query_obj)
+        with tracing.span('sqla.get_query_str'):
+            sql = self.get_query_str(query_obj)
         status = QueryStatus.SUCCESS
         error_message = None
         df = None
         try:
-            df = self.database.get_df(sql, self.schema)
+            with tracing.span('sqla.get_df'):
+                df = self.database.get_df(sql, self.schema)
         except Exception as e:
             status = QueryStatus.FAILED
             logging.exception(e)
@@ -856,6 +928,47 @@ class SqlaTable(Model, BaseDatasource):
     def default_query(qry):
         return qry.filter_by(is_sqllab_view=False)
 
+    @classmethod
+    def eager_load_options(cls):
+        return super(SqlaTable, cls).eager_load_options() + [
+            joinedload(cls.database)]
+
+    @classmethod
+    def query_perm_names(cls, session):
+        perm_names = []
+        qry = cls.default_query(
+            session.query(
+                cls.id, cls.table_name, cls.schema,
+                Database.database_name, Database.verbose_name,
+            )
+            .select_from(cls),
+        ).join(Database, cls.database_id == Database.id)
+        for id_, table_name, schema, database_name, verbose_name in qry:
+            database = verbose_name or database_name
+            perm_names.append((
+                'datasource_access',
+                '[{}].[{}](id:{})'.format(database, table_name, id_)))
+            perm_names.append((
+                'schema_access',
+                security_manager.get_schema_perm(database, schema)))
+
+        qry = (
+            session.query(
+                SqlMetric.id, SqlMetric.metric_name, cls.table_name,
+                cls.schema, Database.database_name, Database.verbose_name)
+            .join(cls, SqlMetric.table_id == cls.id)
+            .join(Database, cls.database_id == Database.id)
+            .filter(SqlMetric.is_restricted == True)  # noqa
+        )
+        for (id_, metric_name, table_name, schema,
+                database_name, verbose_name) in qry:
+            full_name = utils.get_datasource_full_name(
+                verbose_name or database_name, table_name, schema=schema)
+            perm_names.append((
+                'metric_access',
+                '{}.[{}](id:{})'.format(full_name, metric_name, id_)))
+        return perm_names
+
 
 sa.event.listen(SqlaTable, 'after_insert', set_perm)
 sa.event.listen(SqlaTable, 'after_update', set_perm)
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Uploads of csv files run by the celery workers
+
+With ``CSV_UPLOAD_ASYNC`` set, the upload form saves the file to the
+``UPLOAD_FOLDER``, which has to be shared with the workers, and hands the
+upload over to the ``upload_csv`` task rather than streaming the file
+into the database from the request thread. The task reports its progress
+in the results backend, where ``/superset/csv_upload_status/<upload_id>/``
+reads it from.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import os
+import time
+import uuid
+
+from superset import app, db, results_backend, utils
+from superset.connectors.sqla.models import SqlaTable
+from superset.models.core import Database
+
+config = app.config
+celery_app = utils.get_celery_app(config)
+
+PENDING = 'pending'
+RUNNING = 'running'
+SUCCESS = 'success'
+FAILED = 'failed'
+
+
+def status_key(upload_id):
+    return 'csv_upload/{}'.format(upload_id)
+
+
+def set_status(upload_id, status):
+    try:
+        results_backend.set(
+            status_key(upload_id), status,
+            config.get('CACHE_DEFAULT_TIMEOUT'))
+    except Exception as e:
+        logging.exception(e)
+
+
+def get_status(upload_id):
+    """The status of an upload, ``None`` if unknown"""
+    if not results_backend:
+        return None
+    return results_backend.get(status_key(upload_id))
+
+
+class UploadProgress(object):
+    """Reports the progress of an upload, at most every
+    ``CSV_UPLOAD_PROGRESS_INTERVAL`` seconds"""
+
+    def __init__(self, upload_id, table_name, total_bytes):
+        self.upload_id = upload_id
+        self.status = {
+            'state': RUNNING,
+            'table': table_name,
+            'rows': 0,
+            'progress': 0,
+        }
+        self.total_bytes = total_bytes
+        self.interval = config.get('CSV_UPLOAD_PROGRESS_INTERVAL')
+        self._last_report = 0
+
+    def __call__(self, rows, bytes_read):
+        self.status['rows'] = rows
+        if self.total_bytes:
+            self.status['progress'] = min(
+                int(100 * bytes_read / self.total_bytes), 99)
+        now = time.time()
+        if now - self._last_report >= self.interval:
+            self._last_report = now
+            set_status(self.upload_id, self.status)
+
+    def finish(self, state, **kwargs):
+        self.status.update(kwargs, state=state)
+        if state == SUCCESS:
+            self.status['progress'] = 100
+        set_status(self.upload_id, self.status)
+
+
+def new_upload_id():
+    return uuid.uuid4().hex
+
+
+def upload_filename(upload_id):
+    """The name the file of an upload is saved under in the upload folder,
+    unique so that the uploads of files of the same name don't collide"""
+    return '{}.csv'.format(upload_id)
+
+
+def start(upload_id, database, params, user_id):
+    """Hands the upload of a file saved to the upload folder under
+    ``upload_filename(upload_id)`` over to the workers"""
+    params = dict(params)
+    params['csv'] = dict(
+        params['csv'], filepath_or_buffer=upload_filename(upload_id))
+    set_status(upload_id, {
+        'state': PENDING,
+        'table': params['name'],
+        'rows': 0,
+        'progress': 0,
+    })
+    upload_csv.delay(upload_id, database.id, params, user_id)
+
+
+@celery_app.task(name='upload_csv')
+def upload_csv(upload_id, database_id, params, user_id):
+    """Streams a csv file of the upload folder into a table, and adds the
+    table as a datasource"""
+    path = config['UPLOAD_FOLDER'] + params['csv']['filepath_or_buffer']
+    progress = UploadProgress(
+        upload_id, params['name'], os.path.getsize(path))
+    set_status(upload_id, progress.status)
+    try:
+        database = db.session.query(Database).filter_by(id=database_id).one()
+        table = SqlaTable(table_name=params['name'])
+        table.database = database
+        table.database_id = database.id
+        rows = database.db_engine_spec.upload_csv(
+            table, params, user_id, progress)
+        progress.finish(SUCCESS, rows=rows)
+    except Exception as e:
+        logging.exception(e)
+        db.session.rollback()
+        progress.finish(FAILED, error=utils.error_msg_from_exception(e))
+    finally:
+        try:
+            os.remove(path)
+        except OSError:
+            pass
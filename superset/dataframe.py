@@ -20,7 +20,7 @@ import pandas as pd
 from pandas.core.dtypes.dtypes import ExtensionDtype
 from past.builtins import basestring
 
-from superset.utils import JS_MAX_INTEGER
+from superset.utils import df_to_columnar, JS_MAX_INTEGER
 
 INFER_COL_TYPES_THRESHOLD = 95
 INFER_COL_TYPES_SAMPLE_SIZE = 100
@@ -72,7 +72,7 @@ class SupersetDataFrame(object):
         if db_engine_spec:
             self.column_names = dedup(db_engine_spec.get_normalized_column_names(cursor_description))
         else:
-            self.column_names = column_names
+            self.column_names = dedup(column_names)
 
         if data is None:
             data = []
@@ -80,8 +80,18 @@ class SupersetDataFrame(object):
         if isinstance(data, pd.DataFrame):
             self.df = data
         else:
-            self.df = (pd.DataFrame(list(data), columns=column_names).infer_objects())
+            # Repeated names, e.g. `SELECT a.id, b.id`, would make the columns
+            # of the same name indistinguishable
+            self.df = (
+                pd.DataFrame(list(data), columns=self.column_names)
+                .infer_objects()
+            )
 
+        # Engines whose cursor.description types are reliable spare us the
+        # sample based type inference in `columns`
+        self._trust_type_dict = bool(
+            db_engine_spec and db_engine_spec.reliable_cursor_types)
+        self._columns = None
         self._type_dict = {}
         try:
             # The driver may not be passing a cursor.description
@@ -99,15 +109,30 @@ class SupersetDataFrame(object):
 
     @property
     def data(self):
-        data = self.df.to_dict(orient='records')
-        for d in data:
-            for k, v in list(d.items()):
-                # if an int is too big for Java Script to handle
-                # convert it to a string
-                if isinstance(v, int):
-                    if abs(v) > JS_MAX_INTEGER:
-                        d[k] = str(v)
-        return data
+        df = self.df
+        # if an int is too big for Java Script to handle
+        # convert its column to strings
+        unsafe_cols = self.js_unsafe_int_columns(df)
+        if unsafe_cols:
+            df = df.astype({col: str for col in unsafe_cols})
+        return df.to_dict(orient='records')
+
+    @staticmethod
+    def js_unsafe_int_columns(df):
+        """Names of the integer columns holding values beyond JS_MAX_INTEGER"""
+        unsafe_cols = []
+        for col, dtype in df.dtypes.items():
+            if dtype.kind not in 'iu' or df.empty:
+                continue
+            values = df[col].values
+            if values.max() > JS_MAX_INTEGER or values.min() < -JS_MAX_INTEGER:
+                unsafe_cols.append(col)
+        return unsafe_cols
+
+    @property
+    def columnar_data(self):
+        """The data as a ``{column: values}`` dict, converted column-wise"""
+        return df_to_columnar(self.df, iso_dates=True)['data']
 
     @classmethod
     def db_type(cls, dtype):
@@ -119,22 +144,17 @@ class SupersetDataFrame(object):
 
     @classmethod
     def datetime_conversion_rate(cls, data_series):
-        success = 0
-        total = 0
-        for value in data_series:
-            total += 1
-            try:
-                pd.to_datetime(value)
-                success += 1
-            except Exception:
-                continue
-        return 100 * success / total
+        return 100 * pd.to_datetime(data_series, errors='coerce').notna().mean()
 
     @classmethod
     def is_date(cls, dtype):
         if dtype.name:
             return dtype.name.startswith('datetime')
 
+    @classmethod
+    def is_date_db_type(cls, db_type):
+        return db_type.upper().startswith(('DATE', 'TIME', 'NEWDATE'))
+
     @classmethod
     def is_dimension(cls, dtype, column_name):
         if cls.is_id(column_name):
@@ -159,16 +179,17 @@ class SupersetDataFrame(object):
     def columns(self):
         """Provides metadata about columns for data visualization.
 
+        The metadata is computed once and memoized on the instance.
+
         :return: dict, with the fields name, type, is_date, is_dim and agg.
         """
-        if self.df.empty:
-            return None
+        if self._columns is None and not self.df.empty:
+            self._columns = self.infer_columns()
+        return self._columns
 
+    def infer_columns(self):
         columns = []
-        sample_size = min(INFER_COL_TYPES_SAMPLE_SIZE, len(self.df.index))
-        sample = self.df
-        if sample_size:
-            sample = self.df.sample(sample_size)
+        sample = None
         for col in self.df.dtypes.keys():
             col_db_type = (
                 self._type_dict.get(col) or
@@ -182,7 +203,18 @@ class SupersetDataFrame(object):
                 'is_dim': self.is_dimension(self.df.dtypes[col], col),
             }
 
-            if column['type'] in ('OBJECT', None):
+            if self._trust_type_dict and self._type_dict.get(col):
+                if self.is_date_db_type(col_db_type):
+                    column.update({
+                        'is_date': True,
+                        'is_dim': False,
+                        'agg': None,
+                    })
+            elif column['type'] in ('OBJECT', None):
+                if sample is None:
+                    sample_size = min(
+                        INFER_COL_TYPES_SAMPLE_SIZE, len(self.df.index))
+                    sample = self.df.sample(sample_size)
                 v = sample[col].iloc[0] if not sample[col].empty else None
                 if isinstance(v, basestring):
                     column['type'] = 'STRING'
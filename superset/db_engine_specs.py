@@ -20,17 +20,22 @@ from __future__ import unicode_literals
 
 from collections import defaultdict, namedtuple
 import inspect
+import itertools
 import logging
 import os
 import re
 import textwrap
+import threading
 import time
+import uuid
 
 import boto3
 from flask import g
 from flask_babel import lazy_gettext as _
 import pandas
 from past.builtins import basestring
+from six import StringIO, text_type
+from six.moves import queue
 import sqlalchemy as sqla
 from sqlalchemy import select
 from sqlalchemy.engine import create_engine
@@ -41,9 +46,8 @@ import sqlparse
 from tableschema import Table
 from werkzeug.utils import secure_filename
 
-from superset import app, cache_util, conf, db, utils
+from superset import app, cache_util, conf, db, query_control, utils
 from superset.exceptions import SupersetTemplateException
-from superset.utils import QueryStatus
 
 config = app.config
 
@@ -71,6 +75,14 @@ class BaseEngineSpec(object):
     limit_method = LimitMethod.FORCE_LIMIT
     time_secondary_columns = False
     inner_joins = True
+    # Whether the types in cursor.description can be trusted over inference
+    reliable_cursor_types = False
+    # The most parameters bound in a multi-row insert, see insert_records
+    max_insert_params = 999
+    # Whether the chunks of a csv upload can be inserted concurrently
+    allows_parallel_inserts = True
+    # Whether csv uploads can run on the celery workers, see upload_csv
+    allows_async_csv_upload = True
 
     @classmethod
     def fetch_data(cls, cursor, limit):
@@ -78,6 +90,32 @@ class BaseEngineSpec(object):
             return cursor.fetchmany(limit)
         return cursor.fetchall()
 
+    @classmethod
+    def get_cursor(cls, conn, server_side=False):
+        """Opens a cursor, a server side one if asked and supported
+
+        Server side cursors keep the result set on the server, for it to be
+        fetched in batches without the driver buffering it all.
+        """
+        return conn.cursor()
+
+    @classmethod
+    def fetch_batches(cls, cursor, limit, batch_size):
+        """Yields the rows of the cursor in batches of up to ``batch_size``
+        rows, stopping after ``limit`` rows"""
+        fetched = 0
+        while True:
+            size = batch_size
+            if limit:
+                size = min(batch_size, limit - fetched)
+                if size <= 0:
+                    return
+            rows = cursor.fetchmany(size)
+            if not rows:
+                return
+            fetched += len(rows)
+            yield rows
+
     @classmethod
     def epoch_to_dttm(cls):
         raise NotImplementedError()
@@ -138,27 +176,9 @@ class BaseEngineSpec(object):
                 """, '', sql)
 
     @staticmethod
-    def csv_to_df(**kwargs):
-        kwargs['filepath_or_buffer'] = \
-            config['UPLOAD_FOLDER'] + kwargs['filepath_or_buffer']
-        kwargs['encoding'] = 'utf-8'
-        kwargs['iterator'] = True
-        chunks = pandas.read_csv(**kwargs)
-        df = pandas.DataFrame()
-        df = pandas.concat(chunk for chunk in chunks)
-        return df
-
-    @staticmethod
-    def df_to_db(df, table, **kwargs):
-        df.to_sql(**kwargs)
-        table.user_id = g.user.id
-        table.schema = kwargs['schema']
-        table.fetch_metadata()
-        db.session.add(table)
-        db.session.commit()
-
-    @staticmethod
-    def create_table_from_csv(form, table):
+    def csv_upload_params(form):
+        """The parameters of the upload of a csv file, out of the upload
+        form, in a form that can be passed on to a celery task"""
         def _allowed_file(filename):
             # Only allow specific file extensions as specified in the config
             extension = os.path.splitext(filename)[1]
@@ -167,35 +187,224 @@ class BaseEngineSpec(object):
         filename = secure_filename(form.csv_file.data.filename)
         if not _allowed_file(filename):
             raise Exception('Invalid file type selected')
-        kwargs = {
-            'filepath_or_buffer': filename,
-            'sep': form.sep.data,
-            'header': form.header.data if form.header.data else 0,
-            'index_col': form.index_col.data,
-            'mangle_dupe_cols': form.mangle_dupe_cols.data,
-            'skipinitialspace': form.skipinitialspace.data,
-            'skiprows': form.skiprows.data,
-            'nrows': form.nrows.data,
-            'skip_blank_lines': form.skip_blank_lines.data,
-            'parse_dates': form.parse_dates.data,
-            'infer_datetime_format': form.infer_datetime_format.data,
-            'chunksize': 10000,
-        }
-        df = BaseEngineSpec.csv_to_df(**kwargs)
-
-        df_to_db_kwargs = {
-            'table': table,
-            'df': df,
+        return {
+            'csv': {
+                'filepath_or_buffer': filename,
+                'sep': form.sep.data,
+                'header': form.header.data if form.header.data else 0,
+                'index_col': form.index_col.data,
+                'mangle_dupe_cols': form.mangle_dupe_cols.data,
+                'skipinitialspace': form.skipinitialspace.data,
+                'skiprows': form.skiprows.data,
+                'nrows': form.nrows.data,
+                'skip_blank_lines': form.skip_blank_lines.data,
+                'parse_dates': form.parse_dates.data,
+                'infer_datetime_format': form.infer_datetime_format.data,
+                'chunksize': config.get('CSV_UPLOAD_CHUNK_SIZE'),
+            },
             'name': form.name.data,
-            'con': create_engine(form.con.data.sqlalchemy_uri_decrypted, echo=False),
             'schema': form.schema.data,
             'if_exists': form.if_exists.data,
             'index': form.index.data,
             'index_label': form.index_label.data,
-            'chunksize': 10000,
         }
 
-        BaseEngineSpec.df_to_db(**df_to_db_kwargs)
+    @classmethod
+    def insert_df(cls, df, table, conn):
+        """Inserts the rows of ``df`` into ``table``, see insert_records"""
+        df = df.astype(object).where(pandas.notnull(df), None)
+        cls.insert_records(df.to_dict(orient='records'), table, conn)
+
+    @classmethod
+    def insert_records(cls, records, table, conn):
+        """Inserts the dicts of ``records`` into ``table`` with multi-row
+        VALUES, as many rows per statement as ``max_insert_params`` allows,
+        or with ``executemany`` when the dialect doesn't support them"""
+        if not records:
+            return
+        if not conn.dialect.supports_multivalues_insert:
+            conn.execute(table.insert(), records)
+            return
+        rows_per_insert = max(cls.max_insert_params // len(records[0]), 1)
+        for start in range(0, len(records), rows_per_insert):
+            conn.execute(
+                table.insert().values(records[start:start + rows_per_insert]))
+
+    @classmethod
+    def insert_chunks(cls, engine, table, chunks):
+        """Inserts the dataframes of ``chunks`` while the next ones are read
+
+        The chunks are inserted by ``CSV_UPLOAD_INSERT_THREADS`` threads, or
+        a single one when the database doesn't allow parallel inserts,
+        each chunk in its own transaction. At most as many chunks as there
+        are threads wait to be inserted.
+        """
+        threads = config.get('CSV_UPLOAD_INSERT_THREADS')
+        if not cls.allows_parallel_inserts:
+            threads = 1
+        pending = queue.Queue(maxsize=threads)
+        errors = []
+
+        def insert():
+            while True:
+                df = pending.get()
+                if df is None:
+                    return
+                if errors:
+                    continue
+                try:
+                    with engine.begin() as conn:
+                        cls.insert_df(df, table, conn)
+                except Exception as e:
+                    errors.append(e)
+
+        workers = [
+            threading.Thread(target=insert, name='csv_insert')
+            for i in range(threads)
+        ]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        try:
+            for df in chunks:
+                if errors:
+                    break
+                pending.put(df)
+        finally:
+            for worker in workers:
+                pending.put(None)
+            for worker in workers:
+                worker.join()
+        if errors:
+            raise errors[0]
+
+    @staticmethod
+    def conform_chunk(chunk, dtypes):
+        """Casts the integer and boolean columns of a chunk of a csv file to
+        the ``dtypes`` of its first chunk, which its table was created with.
+        Missing values turn them into floats or objects in later chunks."""
+        for col, dtype in dtypes.items():
+            series = chunk[col]
+            if series.dtype == dtype or dtype.kind not in 'iub':
+                continue
+            if dtype.kind in 'iu':
+                series = pandas.to_numeric(series, errors='coerce')
+                if (
+                        (series.notnull() != chunk[col].notnull()).any() or
+                        (series.dropna() % 1 != 0).any()):
+                    raise ValueError(
+                        'The column {} holds values other than integers past '
+                        'the first rows of the file'.format(col))
+            cast = int if dtype.kind in 'iu' else bool
+            chunk[col] = pandas.Series(
+                [None if pandas.isnull(v) else cast(v) for v in series],
+                index=chunk.index, dtype=object)
+        return chunk
+
+    @classmethod
+    def rename_table_sql(cls, table, new_name, preparer):
+        """The statement renaming ``table``, keeping it in its schema"""
+        return 'ALTER TABLE {} RENAME TO {}'.format(
+            preparer.format_table(table), preparer.quote(new_name))
+
+    @classmethod
+    def csv_to_table(cls, engine, params, progress=None):
+        """Streams a csv file of the upload folder into a table
+
+        The file is read a chunk at a time, and each chunk is inserted as
+        it comes rather than the whole file being loaded in memory. The
+        chunks go to a staging table created with the types inferred from
+        the first chunk, which the later chunks are cast to. The staging
+        table only takes the place of the table, or has its rows appended
+        to it, once the whole file is in: a failed upload leaves the
+        existing table untouched. ``progress`` is called
+        with the number of rows and bytes read after each chunk. Returns
+        the number of rows inserted.
+        """
+        path = config['UPLOAD_FOLDER'] + params['csv']['filepath_or_buffer']
+        csv_kwargs = dict(params['csv'], encoding='utf-8', iterator=True)
+        del csv_kwargs['filepath_or_buffer']
+        name = params['name']
+        schema = params['schema'] or None
+        if_exists = params['if_exists']
+
+        exists = engine.has_table(name, schema=schema)
+        if exists and if_exists == 'fail':
+            raise ValueError("Table '{}' already exists.".format(name))
+
+        def prepare(chunk):
+            chunk.columns = [text_type(col) for col in chunk.columns]
+            if params['index']:
+                chunk = chunk.reset_index()
+                if params['index_label']:
+                    chunk = chunk.rename(
+                        columns={chunk.columns[0]: params['index_label']})
+            return chunk
+
+        with open(path, 'rb') as f:
+            chunks = (prepare(chunk) for chunk in pandas.read_csv(f, **csv_kwargs))
+            first = next(chunks, None)
+            if first is None:
+                raise Exception('The csv file is empty')
+            staging_name = '{}__upload_{}'.format(name[:40], uuid.uuid4().hex[:8])
+            first.head(0).to_sql(
+                staging_name, engine, schema=schema, if_exists='fail',
+                index=False)
+            staging = sqla.Table(
+                staging_name, sqla.MetaData(), schema=schema,
+                autoload=True, autoload_with=engine)
+            rows = [0]
+
+            def read_chunks():
+                for chunk in itertools.chain([first], chunks):
+                    rows[0] += len(chunk.index)
+                    yield cls.conform_chunk(chunk, first.dtypes)
+                    if progress:
+                        progress(rows[0], f.tell())
+
+            try:
+                cls.insert_chunks(engine, staging, read_chunks())
+                with engine.begin() as conn:
+                    if exists and if_exists == 'append':
+                        target = sqla.Table(
+                            name, sqla.MetaData(), schema=schema,
+                            autoload=True, autoload_with=conn)
+                        columns = [col.name for col in staging.columns]
+                        conn.execute(target.insert().from_select(
+                            columns, select(list(staging.columns))))
+                        staging.drop(conn)
+                    else:
+                        if exists:
+                            target = sqla.Table(
+                                name, sqla.MetaData(), schema=schema)
+                            target.drop(conn)
+                        conn.execute(cls.rename_table_sql(
+                            staging, name, conn.dialect.identifier_preparer))
+            except Exception:
+                staging.drop(engine, checkfirst=True)
+                raise
+        return rows[0]
+
+    @classmethod
+    def upload_csv(cls, table, params, user_id, progress=None):
+        """Uploads a csv file of the upload folder to a table of the
+        database of ``table``, and saves ``table`` as its datasource"""
+        engine = create_engine(
+            table.database.sqlalchemy_uri_decrypted, echo=False)
+        try:
+            rows = cls.csv_to_table(engine, params, progress)
+        finally:
+            engine.dispose()
+        table.user_id = user_id
+        table.schema = params['schema']
+        table.fetch_metadata()
+        db.session.add(table)
+        db.session.commit()
+        return rows
+
+    @classmethod
+    def create_table_from_csv(cls, form, table):
+        cls.upload_csv(table, cls.csv_upload_params(form), g.user.id)
 
     @classmethod
     def convert_dttm(cls, target_type, dttm):
@@ -378,6 +587,14 @@ class PostgresBaseEngineSpec(BaseEngineSpec):
             return cursor.fetchmany(limit)
         return cursor.fetchall()
 
+    @classmethod
+    def fetch_batches(cls, cursor, limit, batch_size):
+        # named cursors only get a description once fetched from
+        if not cursor.description and not getattr(cursor, 'name', None):
+            return iter([])
+        return super(PostgresBaseEngineSpec, cls).fetch_batches(
+            cursor, limit, batch_size)
+
     @classmethod
     def epoch_to_dttm(cls):
         return "(timestamp 'epoch' + {col} * interval '1 second')"
@@ -390,6 +607,29 @@ class PostgresBaseEngineSpec(BaseEngineSpec):
 class PostgresEngineSpec(PostgresBaseEngineSpec):
     engine = 'postgresql'
 
+    @classmethod
+    def get_cursor(cls, conn, server_side=False):
+        if server_side:
+            # psycopg2 named cursors are server side ones
+            return conn.cursor(name='superset_{}'.format(uuid.uuid4().hex))
+        return conn.cursor()
+
+    @classmethod
+    def insert_df(cls, df, table, conn):
+        """Streams the rows of ``df`` to the server with COPY FROM STDIN"""
+        buf = StringIO()
+        df.to_csv(buf, index=False, header=False)
+        buf.seek(0)
+        preparer = conn.dialect.identifier_preparer
+        sql = 'COPY {} ({}) FROM STDIN WITH (FORMAT csv)'.format(
+            preparer.format_table(table),
+            ', '.join(preparer.quote(col) for col in df.columns))
+        cursor = conn.connection.cursor()
+        try:
+            cursor.copy_expert(sql, buf)
+        finally:
+            cursor.close()
+
     @classmethod
     def get_table_names(cls, schema, inspector):
         """Need to consider foreign tables for PostgreSQL"""
@@ -510,6 +750,8 @@ class Db2EngineSpec(BaseEngineSpec):
 
 class SqliteEngineSpec(BaseEngineSpec):
     engine = 'sqlite'
+    # Concurrent writes would fail on the lock of the database file
+    allows_parallel_inserts = False
     time_grains = (
         Grain('Time Column', _('Time Column'), '{col}', None),
         Grain('hour', _('hour'),
@@ -603,6 +845,7 @@ class MySQLEngineSpec(BaseEngineSpec):
               'P1W'),
     )
     type_code_map = {}  # loaded from get_datatype only if needed
+    reliable_cursor_types = True
 
     @classmethod
     def convert_dttm(cls, target_type, dttm):
@@ -649,10 +892,20 @@ class MySQLEngineSpec(BaseEngineSpec):
             pass
         return message
 
+    @classmethod
+    def rename_table_sql(cls, table, new_name, preparer):
+        # An unqualified new name would move the table to the default schema
+        new_name = preparer.quote(new_name)
+        if table.schema:
+            new_name = '{}.{}'.format(preparer.quote_schema(table.schema), new_name)
+        return 'ALTER TABLE {} RENAME TO {}'.format(
+            preparer.format_table(table), new_name)
+
 
 class PrestoEngineSpec(BaseEngineSpec):
     engine = 'presto'
     cursor_execute_kwargs = {'parameters': None}
+    reliable_cursor_types = True
 
     time_grains = (
         Grain('Time Column', _('Time Column'), '{col}', None),
@@ -762,6 +1015,7 @@ class PrestoEngineSpec(BaseEngineSpec):
     def handle_cursor(cls, cursor, query, session):
         """Updates progress information"""
         logging.info('Polling the cursor for progress')
+        monitor = query_control.QueryMonitor(query, session)
         polled = cursor.poll()
         # poll returns dict -- JSON status information or ``None``
         # if the query is done
@@ -771,8 +1025,7 @@ class PrestoEngineSpec(BaseEngineSpec):
             # Update the object and wait for the kill signal.
             stats = polled.get('stats', {})
 
-            query = session.query(type(query)).filter_by(id=query.id).one()
-            if query.status in [QueryStatus.STOPPED, QueryStatus.TIMED_OUT]:
+            if monitor.should_stop():
                 cursor.cancel()
                 break
 
@@ -790,12 +1043,12 @@ class PrestoEngineSpec(BaseEngineSpec):
                     logging.info(
                         'Query progress: {} / {} '
                         'splits'.format(completed_splits, total_splits))
-                    if progress > query.progress:
-                        query.progress = progress
-                    session.commit()
+                    monitor.set_progress(progress)
+                    monitor.flush()
             time.sleep(1)
             logging.info('Polling the cursor for progress')
             polled = cursor.poll()
+        monitor.flush(force=True)
 
     @classmethod
     def extract_error_message(cls, e):
@@ -952,6 +1205,8 @@ class HiveEngineSpec(PrestoEngineSpec):
 
     engine = 'hive'
     cursor_execute_kwargs = {'async': True}
+    # Uploads go through S3, see create_table_from_csv
+    allows_async_csv_upload = False
 
     # Scoping regex at class level to avoid recompiling
     # 17/02/07 19:36:38 INFO ql.Driver: Total jobs = 5
@@ -998,6 +1253,15 @@ class HiveEngineSpec(PrestoEngineSpec):
             raise Exception('Query error', state.errorMessage)
         return super(HiveEngineSpec, cls).fetch_data(cursor, limit)
 
+    @classmethod
+    def fetch_batches(cls, cursor, limit, batch_size):
+        from TCLIService import ttypes
+        state = cursor.poll()
+        if state.operationState == ttypes.TOperationState.ERROR_STATE:
+            raise Exception('Query error', state.errorMessage)
+        return super(HiveEngineSpec, cls).fetch_batches(
+            cursor, limit, batch_size)
+
     @staticmethod
     def create_table_from_csv(form, table):
         """Uploads a csv file and creates a superset datasource in Hive."""
@@ -1139,13 +1403,13 @@ class HiveEngineSpec(PrestoEngineSpec):
             hive.ttypes.TOperationState.INITIALIZED_STATE,
             hive.ttypes.TOperationState.RUNNING_STATE,
         )
+        monitor = query_control.QueryMonitor(query, session)
         polled = cursor.poll()
         last_log_line = 0
         tracking_url = None
         job_id = None
         while polled.operationState in unfinished_states:
-            query = session.query(type(query)).filter_by(id=query.id).one()
-            if query.status == QueryStatus.STOPPED:
+            if monitor.should_stop():
                 cursor.cancel()
                 break
 
@@ -1154,10 +1418,8 @@ class HiveEngineSpec(PrestoEngineSpec):
                 log_lines = log.splitlines()
                 progress = cls.progress(log_lines)
                 logging.info('Progress total: {}'.format(progress))
-                needs_commit = False
-                if progress > query.progress:
-                    query.progress = progress
-                    needs_commit = True
+                force_flush = False
+                monitor.set_progress(progress)
                 if not tracking_url:
                     tracking_url = cls.get_tracking_url(log_lines)
                     if tracking_url:
@@ -1167,9 +1429,9 @@ class HiveEngineSpec(PrestoEngineSpec):
                         tracking_url = tracking_url_trans(tracking_url)
                         logging.info(
                             'Transformation applied: {}'.format(tracking_url))
-                        query.tracking_url = tracking_url
+                        monitor.update(tracking_url=tracking_url)
                         logging.info('Job id: {}'.format(job_id))
-                        needs_commit = True
+                        force_flush = True
                 if job_id and len(log_lines) > last_log_line:
                     # Wait for job id before logging things out
                     # this allows for prefixing all log lines and becoming
@@ -1177,10 +1439,10 @@ class HiveEngineSpec(PrestoEngineSpec):
                     for l in log_lines[last_log_line:]:
                         logging.info('[{}] {}'.format(job_id, l))
                     last_log_line = len(log_lines)
-                if needs_commit:
-                    session.commit()
+                monitor.flush(force=force_flush)
             time.sleep(hive_poll_interval)
             polled = cursor.poll()
+        monitor.flush(force=True)
 
     @classmethod
     def where_latest_partition(
@@ -1418,6 +1680,14 @@ class BQEngineSpec(BaseEngineSpec):
             data = [r.values() for r in data]
         return data
 
+    @classmethod
+    def fetch_batches(cls, cursor, limit, batch_size):
+        for data in super(BQEngineSpec, cls).fetch_batches(
+                cursor, limit, batch_size):
+            if type(data[0]).__name__ == 'Row':
+                data = [r.values() for r in data]
+            yield data
+
 
 class ImpalaEngineSpec(BaseEngineSpec):
     """Engine spec for Cloudera's Impala"""
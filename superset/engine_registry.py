@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Registry of the engines used to query the databases
+
+An engine owns its connection pool, so rather than creating an engine per
+query, the registry keeps one per database, effective user and schema
+(and connection parameters). It is bounded in size and age, engines
+evicted are disposed of. Engines inherited through a fork, as with
+celery's prefork workers, are never reused by the child: their pooled
+connections share sockets with the parent process. The child keeps them
+referenced all the same, as garbage collecting them would close those
+sockets from under the parent.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import os
+import threading
+
+import simplejson as json
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import NullPool, QueuePool
+
+from superset import app, utils
+
+config = app.config
+stats_logger = config.get('STATS_LOGGER')
+
+
+def pool_params(url, params):
+    """Adds the configured pool settings to engine params, for the dialects
+    pooling connections with a QueuePool"""
+    poolclass = params.get('poolclass') or url.get_dialect().get_pool_class(url)
+    if not issubclass(poolclass, QueuePool):
+        return params
+    params = dict(params)
+    params.setdefault('pool_size', config.get('DATABASE_POOL_SIZE'))
+    params.setdefault('max_overflow', config.get('DATABASE_POOL_MAX_OVERFLOW'))
+    params.setdefault('pool_recycle', config.get('DATABASE_POOL_RECYCLE'))
+    return params
+
+
+def engine_key(database_id, user_name, schema, url, params):
+    fingerprint = json.dumps(
+        [str(url), params], sort_keys=True, default=repr)
+    return (
+        database_id,
+        user_name,
+        schema,
+        hashlib.md5(fingerprint.encode('utf-8')).hexdigest(),
+    )
+
+
+def new_engine(url, params, name):
+    engine = create_engine(url, **params)
+    pool = engine.pool
+    if isinstance(pool, NullPool):
+        return engine
+
+    if config.get('DATABASE_POOL_PRE_PING'):
+        utils.pessimistic_connection_handling(engine)
+    if hasattr(pool, 'checkedout'):
+        def report_gauges(*args):
+            stats_logger.gauge(
+                'database_pool.{}.checked_out'.format(name), pool.checkedout())
+            stats_logger.gauge(
+                'database_pool.{}.overflow'.format(name), pool.overflow())
+        event.listen(pool, 'checkout', report_gauges)
+        event.listen(pool, 'checkin', report_gauges)
+    return engine
+
+
+def dispose_engine(engine):
+    logging.info('Disposing of engine {}'.format(engine))
+    engine.dispose()
+
+
+class EngineRegistry(object):
+
+    def __init__(self, maxsize=None, ttl=None):
+        self.maxsize = maxsize or config.get('DATABASE_ENGINE_CACHE_SIZE')
+        self.ttl = ttl or config.get('DATABASE_ENGINE_CACHE_TTL')
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+        self._engines = self._new_cache()
+        self._inherited = []
+
+    def _new_cache(self):
+        return utils.LRUCache(
+            maxsize=self.maxsize,
+            ttl=self.ttl,
+            on_evict=dispose_engine,
+            name='engine_registry',
+            stats_logger=stats_logger,
+        )
+
+    @property
+    def engines(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                # Forked: set the parent's engines aside without disposing
+                # of them, closing their connections would affect the parent
+                logging.info('Setting aside the engines inherited from the parent')
+                self._inherited.append(self._engines)
+                self._engines = self._new_cache()
+                self._pid = os.getpid()
+            return self._engines
+
+    def get(self, key, url, params, name):
+        """Returns the engine registered under ``key``, creating it with
+        ``url`` and ``params`` if needed"""
+        return self.engines.get_or_create(
+            key, lambda: new_engine(url, params, name))
+
+    def dispose(self, database_id=None):
+        """Disposes of the engines of a database, or of all of them"""
+        self.engines.remove(
+            lambda key: database_id is None or key[0] == database_id)
+
+
+engine_registry = EngineRegistry()
@@ -0,0 +1,250 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Cached lookups of the distinct values of a datasource column
+
+These back the value pickers of the filters in the explore view. The
+values are cached per datasource and column, along with whatever else
+changes the values returned (see ``values_cache_params``), and prefix
+searches are answered by narrowing down the cached list.
+
+Optionally, a materialized index of the distinct values of the filterable
+columns, with their row counts, is maintained in the results backend by a
+celery task. While fresh, it is used instead of querying the datasource,
+by the filter box as well.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import logging
+import time
+import zlib
+
+import simplejson as json
+from six import text_type
+from six.moves import cPickle as pkl
+
+from superset import app, cache, db, results_backend, utils
+from superset.connectors.connector_registry import ConnectorRegistry
+
+config = app.config
+stats_logger = config.get('STATS_LOGGER')
+celery_app = utils.get_celery_app(config)
+
+
+def cache_key(datasource, column_name, limit):
+    cache_dict = datasource.values_cache_params()
+    cache_dict.update({
+        'datasource': datasource.uid,
+        'column': column_name,
+        'limit': limit,
+    })
+    json_data = json.dumps(
+        cache_dict, sort_keys=True, default=utils.json_iso_dttm_ser)
+    return 'filter_values_{}'.format(
+        hashlib.md5(json_data.encode('utf-8')).hexdigest())
+
+
+def cache_timeout(datasource):
+    if datasource.cache_timeout is not None:
+        return datasource.cache_timeout
+    database = getattr(datasource, 'database', None)
+    if database is not None and database.cache_timeout is not None:
+        return database.cache_timeout
+    return config.get('CACHE_DEFAULT_TIMEOUT')
+
+
+def filter_prefix(values, prefix):
+    """Values whose string representation starts with ``prefix``,
+    ignoring case"""
+    prefix = prefix.lower()
+    return [
+        v for v in values
+        if v is not None and text_type(v).lower().startswith(prefix)
+    ]
+
+
+def get_values(datasource, column_name, limit=None, prefix=None, force=False):
+    """Distinct values of a column, served from the cache when possible"""
+    if limit is None:
+        limit = config.get('FILTER_SELECT_ROW_LIMIT', 10000)
+    index = None if force else get_fresh_index(datasource, column_name)
+    if index is not None:
+        stats_logger.incr('filter_values_from_index')
+        values = index['values']
+        if prefix:
+            values = filter_prefix(values, prefix)
+        return values[:limit]
+
+    key = cache_key(datasource, column_name, limit)
+    values = None
+    if cache and not force:
+        values = cache.get(key)
+        if values is not None:
+            stats_logger.incr('filter_values_from_cache')
+
+    if values is None:
+        values = datasource.values_for_column(column_name, limit)
+        stats_logger.incr('filter_values_from_source')
+        if cache:
+            try:
+                cache.set(key, values, timeout=cache_timeout(datasource))
+            except Exception as e:
+                # the values can be too large for the cache backend
+                logging.warning('Could not cache key {}'.format(key))
+                logging.exception(e)
+                cache.delete(key)
+
+    if prefix:
+        values = filter_prefix(values, prefix)
+    return values
+
+
+def index_key(datasource, column_name):
+    return 'filter_values_index/{}/{}'.format(datasource.uid, column_name)
+
+
+def load_index(datasource, column_name):
+    if not results_backend:
+        return None
+    blob = results_backend.get(index_key(datasource, column_name))
+    if not blob:
+        return None
+    try:
+        return pkl.loads(zlib.decompress(blob))
+    except Exception as e:
+        logging.exception(e)
+        return None
+
+
+def store_index(datasource, column_name, index):
+    results_backend.set(
+        index_key(datasource, column_name),
+        zlib.compress(pkl.dumps(index, protocol=pkl.HIGHEST_PROTOCOL)),
+        config.get('FILTER_VALUES_INDEX_REBUILD_AGE'))
+
+
+def get_fresh_index(datasource, column_name):
+    """Returns the index of a column if it is enabled, fresh and built for
+    the same ``values_cache_params`` as the current ones"""
+    if not config.get('FILTER_VALUES_INDEX_ENABLED') or not results_backend:
+        return None
+    index = load_index(datasource, column_name)
+    if (
+            index is None or
+            index['truncated'] or
+            time.time() - index['refreshed_at'] >
+            config.get('FILTER_VALUES_INDEX_MAX_AGE')):
+        return None
+    if index['params'] != datasource.values_cache_params():
+        return None
+    return index
+
+
+def sort_value_counts(value_counts):
+    try:
+        return sorted(value_counts, key=lambda vc: (vc[0] is None, vc[0]))
+    except TypeError:
+        # values of mixed types
+        return sorted(
+            value_counts, key=lambda vc: (vc[0] is None, text_type(vc[0])))
+
+
+def period_start(dttm):
+    """The start of the day of ``dttm``"""
+    return dttm.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def refresh_index(datasource, column_name):
+    """Builds the index of a column, or refreshes it incrementally
+
+    An index can only be refreshed incrementally when the datasource has a
+    main time column. The rows since the start of the latest day indexed
+    are then counted anew, their counts replacing the previous ones, as
+    rows keep landing within that day, while the older rows keep their
+    counts. The index is fully rebuilt once older than
+    FILTER_VALUES_INDEX_REBUILD_AGE.
+    """
+    now = time.time()
+    params = datasource.values_cache_params()
+    max_values = config.get('FILTER_VALUES_INDEX_MAX_VALUES')
+    index = load_index(datasource, column_name)
+    incremental = (
+        index is not None and
+        not index['truncated'] and
+        index.get('tail_since') is not None and
+        index['params'] == params and
+        now - index['built_at'] < config.get('FILTER_VALUES_INDEX_REBUILD_AGE')
+    )
+    since = index['tail_since'] if incremental else None
+    recent_counts, max_dttm = datasource.value_counts_for_column(
+        column_name, since=since, limit=max_values + 1)
+
+    if incremental:
+        counts = dict(zip(index['values'], index['counts']))
+        for value, count in zip(index['tail_values'], index['tail_counts']):
+            counts[value] = counts.get(value, 0) - count
+        for value, count in recent_counts:
+            counts[value] = counts.get(value, 0) + count
+        value_counts = [
+            (value, count) for value, count in counts.items() if count > 0]
+        max_dttm = max_dttm or index['max_dttm']
+    else:
+        value_counts = recent_counts
+        index = {'built_at': now}
+
+    truncated = len(value_counts) > max_values
+    tail_since, tail_counts = since, recent_counts
+    if (
+            not truncated and
+            max_dttm is not None and
+            (since is None or period_start(max_dttm) > since)):
+        # The latest day moved on, the rows before it are settled
+        tail_since = period_start(max_dttm)
+        tail_counts, _ = datasource.value_counts_for_column(
+            column_name, since=tail_since, limit=max_values + 1)
+
+    value_counts = [] if truncated else sort_value_counts(value_counts)
+    index.update({
+        'values': [value for value, _ in value_counts],
+        'counts': [count for _, count in value_counts],
+        'tail_since': tail_since,
+        'tail_values': [value for value, _ in tail_counts],
+        'tail_counts': [count for _, count in tail_counts],
+        'params': params,
+        'max_dttm': max_dttm,
+        'refreshed_at': now,
+        'truncated': truncated,
+    })
+    store_index(datasource, column_name, index)
+    logging.info('{} the filter values index of {}.{}: {} values'.format(
+        'Refreshed' if incremental else 'Built',
+        datasource.name, column_name, len(index['values'])))
+    return index
+
+
+@celery_app.task(name='refresh_filter_values_index')
+def refresh_filter_values_index():
+    """Refreshes the index of the filterable columns of the datasources
+    having filter select enabled"""
+    if not results_backend:
+        logging.warning(
+            "Results backend isn't configured, not indexing filter values")
+        return
+    for datasource_class in ConnectorRegistry.sources.values():
+        qry = datasource_class.default_query(
+            db.session.query(datasource_class),
+        ).filter_by(filter_select_enabled=True)
+        for datasource in qry:
+            for col in datasource.columns:
+                if not col.filterable:
+                    continue
+                try:
+                    refresh_index(datasource, col.column_name)
+                except Exception as e:
+                    logging.error(
+                        'Could not index the values of {}.{}'.format(
+                            datasource.name, col.column_name))
+                    logging.exception(e)
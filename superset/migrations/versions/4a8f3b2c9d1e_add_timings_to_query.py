@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+"""Add the phase timings to the query table.
+
+Revision ID: 4a8f3b2c9d1e
+Revises: cc8d01a1af42
+Create Date: 2026-10-19 10:12:31.204518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '4a8f3b2c9d1e'
+down_revision = 'cc8d01a1af42'
+
+
+def upgrade():
+    op.add_column('query', sa.Column('timings', sa.Text(), nullable=True))
+
+
+def downgrade():
+    op.drop_column('query', 'timings')
@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+"""Add the indexes backing the search of queries.
+
+Composite indexes cover the filters of the query search, ordered by start
+time. On PostgreSQL the SQL text is indexed as well: a GIN index of its
+tsvector for full-text search and, when the pg_trgm extension is
+available, a trigram GIN index speeding up the substring matches.
+
+Revision ID: 7c1e5a2f0b3d
+Revises: 4a8f3b2c9d1e
+Create Date: 2026-10-19 13:41:07.532814
+
+"""
+import logging
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a2f0b3d'
+down_revision = '4a8f3b2c9d1e'
+
+INDEXES = {
+    'ti_start_time_id': ['start_time', 'id'],
+    'ti_user_id_start_time': ['user_id', 'start_time'],
+    'ti_database_id_start_time': ['database_id', 'start_time'],
+    'ti_status_start_time': ['status', 'start_time'],
+}
+
+
+def has_trigram_extension(bind):
+    if bind.execute(sa.text(
+            "SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")).scalar():
+        return True
+    available = bind.execute(sa.text(
+        "SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'",
+    )).scalar()
+    if not available:
+        return False
+    # Creating an extension may require privileges the user lacks
+    savepoint = bind.begin_nested()
+    try:
+        bind.execute(sa.text('CREATE EXTENSION IF NOT EXISTS pg_trgm'))
+        savepoint.commit()
+        return True
+    except sa.exc.DBAPIError as e:
+        savepoint.rollback()
+        logging.warning('Could not create the pg_trgm extension: %s', e)
+        return False
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'query', columns, unique=False)
+
+    bind = op.get_bind()
+    if bind.dialect.name != 'postgresql':
+        return
+    op.execute(
+        'CREATE INDEX ti_sql_tsvector ON query '
+        "USING gin (to_tsvector('simple', coalesce(sql, '')))")
+    if has_trigram_extension(bind):
+        op.execute(
+            'CREATE INDEX ti_sql_trgm ON query USING gin (sql gin_trgm_ops)')
+    else:
+        logging.warning(
+            'pg_trgm is not available, the substring searches of queries '
+            'will not be indexed')
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('DROP INDEX IF EXISTS ti_sql_trgm')
+        op.execute('DROP INDEX IF EXISTS ti_sql_tsvector')
+    for name in INDEXES:
+        op.drop_index(name, table_name='query')
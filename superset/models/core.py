@@ -21,7 +21,7 @@ import numpy
 import pandas as pd
 import sqlalchemy as sqla
 from sqlalchemy import (
-    Boolean, Column, create_engine, DateTime, ForeignKey, Integer,
+    Boolean, Column, DateTime, ForeignKey, Integer,
     MetaData, String, Table, Text,
 )
 from sqlalchemy.engine import url
@@ -31,11 +31,12 @@ from sqlalchemy.orm.session import make_transient
 from sqlalchemy.pool import NullPool
 from sqlalchemy.schema import UniqueConstraint
 from sqlalchemy_utils import EncryptedType
-import sqlparse
 
 from superset import app, db, db_engine_specs, security_manager, utils
 from superset.connectors.connector_registry import ConnectorRegistry
+from superset.engine_registry import engine_key, engine_registry, pool_params
 from superset.models.helpers import AuditMixinNullable, ImportMixin, set_perm
+from superset.sql_parse import SupersetQuery
 from superset.viz import viz_types
 install_aliases()
 from urllib import parse  # noqa
@@ -118,6 +119,9 @@ class Slice(Model, AuditMixinNullable, ImportMixin):
 
     @property
     def datasource(self):
+        # set in bulk by Dashboard.prefetch_datasources
+        if 'prefetched_datasource' in self.__dict__:
+            return self.__dict__['prefetched_datasource']
         return self.get_datasource
 
     def clone(self):
@@ -364,6 +368,28 @@ class Dashboard(Model, AuditMixinNullable, ImportMixin):
     def datasources(self):
         return {slc.datasource for slc in self.slices}
 
+    def prefetch_datasources(self, session):
+        """Loads the datasources of all the slices at once
+
+        The datasources are fetched per type, with their columns, metrics
+        and database, so that rendering the dashboard takes the same number
+        of queries whatever its number of slices. Returns the datasources.
+        """
+        ids_by_type = {}
+        for slc in self.slices:
+            if slc.datasource_type in ConnectorRegistry.sources:
+                ids_by_type.setdefault(
+                    slc.datasource_type, set()).add(slc.datasource_id)
+        datasources = {}
+        for datasource_type, ids in ids_by_type.items():
+            for datasource in ConnectorRegistry.get_eager_datasources(
+                    session, datasource_type, ids):
+                datasources[(datasource_type, datasource.id)] = datasource
+        for slc in self.slices:
+            slc.prefetched_datasource = datasources.get(
+                (slc.datasource_type, slc.datasource_id))
+        return set(datasources.values())
+
     @property
     def sqla_metadata(self):
         # pylint: disable=no-member
@@ -701,9 +727,14 @@ class Database(Model, AuditMixinNullable, ImportMixin):
                 effective_username = g.user.username
         return effective_username
 
-    @utils.memoized(
-        watch=('impersonate_user', 'sqlalchemy_uri_decrypted', 'extra'))
-    def get_sqla_engine(self, schema=None, nullpool=True, user_name=None):
+    def get_sqla_engine(self, schema=None, nullpool=None, user_name=None):
+        """Returns an engine for the database, from the engine registry
+
+        Unless ``nullpool`` is set, or DATABASE_POOL_ENABLED isn't, the
+        engine pools its connections.
+        """
+        if nullpool is None:
+            nullpool = not config.get('DATABASE_POOL_ENABLED')
         extra = self.get_extra()
         url = make_url(self.sqlalchemy_uri_decrypted)
         url = self.db_engine_spec.adjust_database_uri(url, schema)
@@ -722,6 +753,8 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         params = extra.get('engine_params', {})
         if nullpool:
             params['poolclass'] = NullPool
+        else:
+            params = pool_params(url, params)
 
         # If using Hive, this will set hive.server2.proxy.user=$effective_username
         configuration = {}
@@ -737,7 +770,8 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         if DB_CONNECTION_MUTATOR:
             url, params = DB_CONNECTION_MUTATOR(
                 url, params, effective_username, security_manager)
-        return create_engine(url, **params)
+        key = engine_key(self.id, effective_username, schema, url, params)
+        return engine_registry.get(key, url, params, self.id)
 
     def get_reserved_words(self):
         return self.get_dialect().preparer.reserved_words
@@ -746,7 +780,7 @@ class Database(Model, AuditMixinNullable, ImportMixin):
         return self.get_dialect().identifier_preparer.quote
 
     def get_df(self, sql, schema):
-        sqls = [str(s).strip().strip(';') for s in sqlparse.parse(sql)]
+        sqls = SupersetQuery(sql).statements
         eng = self.get_sqla_engine(schema=schema)
 
         for i in range(len(sqls) - 1):
@@ -964,29 +998,53 @@ class Log(Model):
                 records = [d]
 
             referrer = request.referrer[:1000] if request.referrer else None
+            dttm = datetime.utcnow()
             logs = []
             for record in records:
                 try:
                     json_string = json.dumps(record)
                 except Exception:
                     json_string = None
-                log = cls(
+                logs.append(dict(
                     action=f.__name__,
                     json=json_string,
                     dashboard_id=dashboard_id,
                     slice_id=slice_id,
                     duration_ms=duration_ms,
                     referrer=referrer,
-                    user_id=user_id)
-                logs.append(log)
+                    user_id=user_id,
+                    dttm=dttm))
 
-            sesh = db.session()
-            sesh.bulk_save_objects(logs)
-            sesh.commit()
+            if config.get('ACTION_LOG_ASYNC'):
+                action_log_batcher.put(logs)
+            else:
+                sesh = db.session()
+                sesh.bulk_insert_mappings(cls, logs)
+                sesh.commit()
             return value
 
         return wrapper
 
+    @classmethod
+    def insert_logs(cls, logs):
+        """Inserts log records in as few multi-row statements as the
+        metadata database binds parameters for"""
+        engine = db.engine
+        db_engine_spec = Database.get_db_engine_spec_for_backend(
+            engine.url.get_backend_name())
+        with engine.begin() as conn:
+            db_engine_spec.insert_records(logs, cls.__table__, conn)
+
+
+action_log_batcher = utils.AsyncBatcher(
+    Log.insert_logs,
+    maxsize=config.get('ACTION_LOG_QUEUE_SIZE'),
+    batch_size=config.get('ACTION_LOG_BATCH_SIZE'),
+    interval=config.get('ACTION_LOG_FLUSH_INTERVAL'),
+    put_timeout=config.get('ACTION_LOG_PUT_TIMEOUT'),
+    name='action_log',
+    stats_logger=stats_logger)
+
 
 class FavStar(Model):
     __tablename__ = 'favstar'
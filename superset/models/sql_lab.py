@@ -7,6 +7,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from datetime import datetime
+import json
 import re
 
 from flask import Markup
@@ -14,11 +15,12 @@ from flask_appbuilder import Model
 from future.standard_library import install_aliases
 import sqlalchemy as sqla
 from sqlalchemy import (
-    Boolean, Column, DateTime, ForeignKey, Integer, Numeric, String, Text,
+    Boolean, Column, DateTime, event, ForeignKey, Integer, Numeric, String,
+    Text,
 )
-from sqlalchemy.orm import backref, relationship
+from sqlalchemy.orm import backref, joinedload, load_only, relationship
 
-from superset import security_manager
+from superset import query_control, security_manager
 from superset.models.helpers import AuditMixinNullable
 from superset.utils import QueryStatus, user_label
 
@@ -66,6 +68,8 @@ class Query(Model):
     end_time = Column(Numeric(precision=20, scale=6))
     end_result_backend_time = Column(Numeric(precision=20, scale=6))
     tracking_url = Column(Text)
+    # JSON list of the phases timed while running, see superset.tracing
+    timings = Column(Text)
 
     changed_on = Column(
         DateTime,
@@ -81,12 +85,56 @@ class Query(Model):
 
     __table_args__ = (
         sqla.Index('ti_user_id_changed_on', user_id, changed_on),
+        sqla.Index('ti_start_time_id', start_time, id),
+        sqla.Index('ti_user_id_start_time', user_id, start_time),
+        sqla.Index('ti_database_id_start_time', database_id, start_time),
+        sqla.Index('ti_status_start_time', status, start_time),
     )
 
     @property
     def limit_reached(self):
         return self.rows == self.limit if self.limit_used else False
 
+    def get_timings(self):
+        return json.loads(self.timings) if self.timings else []
+
+    def add_timings(self, spans):
+        if spans:
+            self.timings = json.dumps(self.get_timings() + spans)
+
+    @classmethod
+    def sql_search_filter(cls, search_text, dialect_name):
+        """Filter on the queries whose SQL holds ``search_text``
+
+        On PostgreSQL the queries matching the words of the text are found
+        as well. Both matches use the GIN indexes of the SQL, the
+        expressions below have to stay in line with those.
+        """
+        pattern = '%{}%'.format(search_text)
+        if dialect_name != 'postgresql':
+            return cls.sql.like(pattern)
+        simple = sqla.literal_column("'simple'")
+        tsvector = sqla.func.to_tsvector(
+            simple, sqla.func.coalesce(cls.sql, sqla.literal_column("''")))
+        tsquery = sqla.func.plainto_tsquery(simple, search_text)
+        return sqla.or_(tsvector.op('@@')(tsquery), cls.sql.ilike(pattern))
+
+    @classmethod
+    def dict_options(cls):
+        """Loader options fetching what ``to_dict`` needs in a single query,
+        leaving out the other columns"""
+        return (
+            load_only(
+                'changed_on', 'client_id', 'database_id', 'end_time',
+                'error_message', 'executed_sql', 'id', 'limit', 'limit_used',
+                'progress', 'results_key', 'rows', 'schema', 'select_as_cta',
+                'sql', 'sql_editor_id', 'start_time', 'status', 'tab_name',
+                'timings', 'tmp_table_name', 'tracking_url', 'user_id'),
+            joinedload(cls.database).load_only('database_name'),
+            joinedload(cls.user).load_only(
+                'first_name', 'last_name', 'username'),
+        )
+
     def to_dict(self):
         return {
             'changedOn': self.changed_on,
@@ -114,6 +162,7 @@ class Query(Model):
             'limit_reached': self.limit_reached,
             'resultsKey': self.results_key,
             'trackingUrl': self.tracking_url,
+            'timings': self.get_timings(),
         }
 
     @property
@@ -127,6 +176,10 @@ class Query(Model):
         return 'sqllab_{tab}_{ts}'.format(**locals())
 
 
+event.listen(Query, 'after_insert', query_control.collect_change)
+event.listen(Query, 'after_update', query_control.collect_change)
+
+
 class SavedQuery(Model, AuditMixinNullable):
     """ORM model for SQL query"""
 
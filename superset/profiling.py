@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Statistical profiling of the SQL Lab queries run by the workers
+
+When a query asks for it, or for a ``SQLLAB_PROFILING_SAMPLE_RATE``
+fraction of the queries, a background thread samples the stack of the
+thread running the query every ``SQLLAB_PROFILING_INTERVAL`` seconds.
+The samples are stored in the results backend as collapsed stacks, one
+``frame;frame;frame count`` line per distinct stack, the input format of
+flamegraph.pl and speedscope, and served to admins by the
+``/superset/query_profile/<query_id>/`` endpoint.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import logging
+import os
+import random
+import sys
+import threading
+
+from superset import app, results_backend, utils
+
+config = app.config
+
+
+def profile_key(query_id):
+    return 'profile/{}'.format(query_id)
+
+
+def frame_name(frame):
+    code = frame.f_code
+    return '{} ({}:{})'.format(
+        code.co_name, os.path.basename(code.co_filename), frame.f_lineno)
+
+
+class SamplingProfiler(object):
+    """Samples the stack of a thread from a background thread"""
+
+    def __init__(self, thread_id, interval=0.01):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = {}
+        self._stopped = threading.Event()
+        self._thread = None
+
+    def sample(self):
+        frame = sys._current_frames().get(self.thread_id)
+        stack = []
+        while frame is not None:
+            stack.append(frame_name(frame))
+            frame = frame.f_back
+        if stack:
+            stack = tuple(reversed(stack))
+            self.samples[stack] = self.samples.get(stack, 0) + 1
+
+    def _run(self):
+        while not self._stopped.wait(self.interval):
+            self.sample()
+
+    def start(self):
+        self._thread = threading.Thread(
+            target=self._run, name='sampling_profiler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._stopped.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def collapsed(self):
+        return '\n'.join(
+            '{} {}'.format(';'.join(stack), count)
+            for stack, count in sorted(self.samples.items()))
+
+
+def should_profile(requested=False):
+    if requested:
+        return True
+    rate = config.get('SQLLAB_PROFILING_SAMPLE_RATE')
+    return bool(rate) and random.random() < rate
+
+
+@contextmanager
+def profiled(query_id, enabled=True):
+    """Profiles the enclosed block, storing the samples under the query id"""
+    if not enabled or not results_backend:
+        yield
+        return
+    profiler = SamplingProfiler(
+        threading.current_thread().ident,
+        config.get('SQLLAB_PROFILING_INTERVAL'))
+    profiler.start()
+    try:
+        yield
+    finally:
+        profiler.stop()
+        try:
+            results_backend.set(
+                profile_key(query_id),
+                utils.zlib_compress(profiler.collapsed()),
+                config.get('CACHE_DEFAULT_TIMEOUT'))
+        except Exception as e:
+            logging.exception(e)
+
+
+def load(query_id):
+    """The collapsed stacks sampled while running a query, if any"""
+    if not results_backend:
+        return None
+    blob = results_backend.get(profile_key(query_id))
+    if blob is None:
+        return None
+    return utils.zlib_decompress_to_string(blob)
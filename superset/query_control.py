@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Control of the SQL Lab queries running on the workers
+
+Stopping a query raises a flag in the results backend. The engine specs
+polling a running query check that flag on each poll, rather than
+reloading the query from the metadata database every time. The metadata
+database is still looked at, every ``SQLLAB_STATUS_CHECK_INTERVAL``
+seconds, for the queries timed out and when no results backend is set.
+Progress reported while polling is committed at most every
+``SQLLAB_PROGRESS_UPDATE_INTERVAL`` seconds.
+
+When ``SQLLAB_POLL_REDIS_URL`` is set, the ids of the users whose queries
+changed are published to redis once the changes are committed, so that
+the polls of the SQL Lab clients can wait for a change rather than poll
+the metadata database again and again.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import logging
+import time
+
+from sqlalchemy import event
+from sqlalchemy.orm import object_session, Session
+
+from superset import app, results_backend
+from superset.utils import QueryStatus
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+config = app.config
+
+STOP_STATUSES = (QueryStatus.STOPPED, QueryStatus.TIMED_OUT)
+
+
+def stop_key(query_id):
+    return 'query_stop/{}'.format(query_id)
+
+
+def request_stop(query):
+    """Signals the worker running ``query`` that it has to be stopped"""
+    if not results_backend:
+        return
+    try:
+        results_backend.set(
+            stop_key(query.id), query.status,
+            config.get('SQLLAB_ASYNC_TIME_LIMIT_SEC'))
+    except Exception as e:
+        logging.exception(e)
+
+
+def stop_requested(query_id):
+    """The status a stop was requested with, ``None`` if it wasn't"""
+    if not results_backend:
+        return None
+    try:
+        return results_backend.get(stop_key(query_id))
+    except Exception as e:
+        logging.exception(e)
+        return None
+
+
+class QueryMonitor(object):
+    """Checks for stops and coalesces the updates of a running query"""
+
+    def __init__(self, query, session):
+        self.query = query
+        self.session = session
+        self.progress_interval = config.get('SQLLAB_PROGRESS_UPDATE_INTERVAL')
+        self.status_interval = config.get('SQLLAB_STATUS_CHECK_INTERVAL')
+        self._dirty = False
+        self._last_flush = self._last_status_check = time.time()
+
+    def _db_status(self):
+        model = type(self.query)
+        with self.session.no_autoflush:
+            return (
+                self.session.query(model.status)
+                .filter(model.id == self.query.id)
+                .scalar()
+            )
+
+    def should_stop(self):
+        status = stop_requested(self.query.id)
+        now = time.time()
+        if (
+                status is None and
+                now - self._last_status_check >= self.status_interval):
+            self._last_status_check = now
+            status = self._db_status()
+        if status in STOP_STATUSES:
+            self.query.status = status
+            return True
+        return False
+
+    def set_progress(self, progress):
+        if progress > self.query.progress:
+            self.query.progress = progress
+            self._dirty = True
+
+    def update(self, **kwargs):
+        for attr, value in kwargs.items():
+            setattr(self.query, attr, value)
+        self._dirty = True
+
+    def flush(self, force=False):
+        """Commits the pending updates if the last commit is old enough"""
+        now = time.time()
+        if self._dirty and (
+                force or now - self._last_flush >= self.progress_interval):
+            self.session.commit()
+            self._dirty = False
+            self._last_flush = now
+
+
+CHANGED_USERS = 'sqllab_changed_query_users'
+
+_redis_clients = {}
+
+
+def changes_channel(user_id):
+    return 'sqllab_query_changes/{}'.format(user_id)
+
+
+def get_redis():
+    """The client of the redis server query changes are published to, if
+    any"""
+    url = config.get('SQLLAB_POLL_REDIS_URL')
+    if not url or redis is None:
+        return None
+    if url not in _redis_clients:
+        _redis_clients[url] = redis.StrictRedis.from_url(url)
+    return _redis_clients[url]
+
+
+def record_change(session, user_id):
+    """Records a change to the queries of a user, to be notified once
+    ``session`` commits. Needed for bulk updates, which skip the mapper
+    events."""
+    if user_id and get_redis() is not None:
+        session.info.setdefault(CHANGED_USERS, set()).add(user_id)
+
+
+def collect_change(mapper, connection, target):
+    """Records the user of a query flushed, to be notified on commit"""
+    session = object_session(target)
+    if session is not None:
+        record_change(session, target.user_id)
+
+
+def notify_changes(session):
+    user_ids = session.info.pop(CHANGED_USERS, None)
+    client = get_redis()
+    if not user_ids or client is None:
+        return
+    try:
+        for user_id in user_ids:
+            client.publish(changes_channel(user_id), 1)
+    except Exception as e:
+        logging.exception(e)
+
+
+def discard_changes(session):
+    session.info.pop(CHANGED_USERS, None)
+
+
+event.listen(Session, 'after_commit', notify_changes)
+event.listen(Session, 'after_rollback', discard_changes)
+
+
+class ChangeListener(object):
+    """Subscription to the changes of the queries of a user"""
+
+    def __init__(self, client, user_id):
+        self.pubsub = client.pubsub(ignore_subscribe_messages=True)
+        self.pubsub.subscribe(changes_channel(user_id))
+
+    def wait(self, timeout):
+        """Whether a change was published within ``timeout`` seconds"""
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            try:
+                message = self.pubsub.get_message(timeout=remaining)
+            except Exception as e:
+                logging.exception(e)
+                return False
+            if message is not None:
+                return True
+
+    def close(self):
+        self.pubsub.close()
+
+
+@contextmanager
+def listen_changes(user_id, enabled=True):
+    """Yields a ``ChangeListener`` for the user, ``None`` when disabled or
+    when no redis server is set. Subscribing before reading the queries
+    ensures no change committed in between is missed."""
+    client = get_redis() if enabled else None
+    listener = None
+    if client is not None:
+        try:
+            listener = ChangeListener(client, user_id)
+        except Exception as e:
+            logging.exception(e)
+    try:
+        yield listener
+    finally:
+        if listener is not None:
+            listener.close()
@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Chunked, columnar storage of SQL Lab results in the results backend
+
+A result set is stored as a small JSON header under the results key, and
+its rows as fixed size chunks under derived keys. Each chunk holds a
+zlib compressed ``{column: [values]}`` dict, so reading a page of rows
+only decompresses and decodes the chunks overlapping that page.
+
+The chunks are encoded as JSON rather than Arrow: pyarrow is only the
+optional ``parquet`` extra, used to archive old rows, and the chunks
+written by a worker have to be readable by every web server, whether or
+not it has pyarrow installed.
+
+Blobs written before this format (a single JSON payload holding all the
+records) are still readable.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import logging
+
+import pandas as pd
+
+from superset import app, results_backend, utils
+
+config = app.config
+
+FORMAT = 'chunked_columnar'
+
+
+def chunk_key(key, index):
+    return '{}/chunk/{}'.format(key, index)
+
+
+class ChunkWriter(object):
+    """Writes a result set to the results backend one chunk at a time
+
+    Dataframes of any size can be written as they come, e.g. as batches
+    are fetched from a cursor: only the rows not making up a full chunk
+    yet are kept in memory. ``close`` then writes the header.
+    """
+
+    def __init__(self, key, cache_timeout):
+        self.key = key
+        self.cache_timeout = cache_timeout
+        self.chunk_size = config.get('RESULTS_BACKEND_CHUNK_SIZE')
+        self.rows = 0
+        self.chunks = 0
+        self.columns = None
+        self._pending = None
+
+    def write(self, df):
+        if self.columns is None:
+            self.columns = list(df.columns)
+        self.rows += len(df.index)
+        if self._pending is not None:
+            df = pd.concat([self._pending, df], ignore_index=True)
+        self._pending = None
+        start = 0
+        if self.chunk_size:
+            while len(df.index) - start >= self.chunk_size:
+                self._write_chunk(df.iloc[start:start + self.chunk_size])
+                start += self.chunk_size
+        if start < len(df.index):
+            self._pending = df.iloc[start:]
+
+    def abort(self):
+        """Deletes the chunks written so far, when the results won't be
+        stored after all"""
+        self._pending = None
+        for index in range(self.chunks):
+            try:
+                results_backend.delete(chunk_key(self.key, index))
+            except Exception as e:
+                logging.exception(e)
+        self.chunks = 0
+
+    def _write_chunk(self, chunk):
+        data = utils.df_to_columnar(chunk, iso_dates=True)['data']
+        results_backend.set(
+            chunk_key(self.key, self.chunks),
+            utils.zlib_compress(utils.json_dumps_columnar(
+                data, default=utils.pessimistic_json_iso_dttm_ser)),
+            self.cache_timeout)
+        self.chunks += 1
+
+    def close(self, payload, columnar=False):
+        """Writes the last chunk and the header, made of ``payload`` minus
+        its ``data`` entry
+
+        ``columnar`` records the format the client asked for, so that it
+        can be served back in the same shape.
+        """
+        if self._pending is not None:
+            self._write_chunk(self._pending)
+            self._pending = None
+        header = {k: v for k, v in payload.items() if k != 'data'}
+        header.update({
+            'format': FORMAT,
+            'columnar': columnar,
+            'data_columns': self.columns or [],
+            'rows': self.rows,
+            'chunk_size': self.chunk_size or self.rows or 1,
+            'chunks': self.chunks,
+        })
+        results_backend.set(
+            self.key,
+            utils.zlib_compress(
+                json.dumps(header, default=utils.json_iso_dttm_ser)),
+            self.cache_timeout)
+        logging.info('Stored {} rows in {} chunks under key {}'.format(
+            self.rows, self.chunks, self.key))
+
+
+def store(key, payload, df, cache_timeout, columnar=False):
+    """Stores a SQL Lab payload and its dataframe under ``key``"""
+    writer = ChunkWriter(key, cache_timeout)
+    writer.write(df)
+    writer.close(payload, columnar)
+
+
+def load_header(blob):
+    """Decodes the blob stored under a results key"""
+    return json.loads(utils.zlib_decompress_to_string(blob))
+
+
+def is_chunked(header):
+    return header.get('format') == FORMAT
+
+
+def data_columns(header):
+    if is_chunked(header):
+        return header['data_columns']
+    return [col['name'] for col in header.get('columns') or []]
+
+
+def slice_columns(data, columns, start, end):
+    """Slices a ``{column: values}`` dict, records are turned into columns"""
+    if isinstance(data, dict):
+        return {col: data[col][start:end] for col in columns}
+    rows = data[start:end]
+    return {col: [row.get(col) for row in rows] for col in columns}
+
+
+def chunks_available(key, header):
+    """Whether all the chunks of the stored results are still in the
+    results backend, which may have evicted some of them"""
+    if not is_chunked(header):
+        return True
+    return all(
+        results_backend.has(chunk_key(key, index))
+        for index in range(header['chunks']))
+
+
+def iter_chunks(key, header, offset=0, limit=None):
+    """Yields ``{column: values}`` dicts covering ``[offset, offset + limit)``
+
+    Only the chunks overlapping the requested range are fetched and
+    decompressed.
+    """
+    columns = data_columns(header)
+    if not is_chunked(header):
+        end = None if limit is None else offset + limit
+        yield slice_columns(header.get('data') or [], columns, offset, end)
+        return
+
+    chunk_size = header['chunk_size']
+    end = header['rows']
+    if limit is not None:
+        end = min(end, offset + limit)
+    for index in range(offset // chunk_size, (end - 1) // chunk_size + 1):
+        if offset >= end:
+            break
+        blob = results_backend.get(chunk_key(key, index))
+        if blob is None:
+            raise KeyError(
+                'Chunk {} of results {} is missing'.format(index, key))
+        data = json.loads(utils.zlib_decompress_to_string(blob))
+        chunk_start = index * chunk_size
+        yield slice_columns(
+            data, columns, max(offset - chunk_start, 0), end - chunk_start)
+
+
+def read_rows(key, header, offset=0, limit=None, columnar=False):
+    """Reads a page of rows, as records or as a dict of columns"""
+    columns = data_columns(header)
+    merged = {col: [] for col in columns}
+    for data in iter_chunks(key, header, offset, limit):
+        for col in columns:
+            merged[col].extend(data[col])
+    if columnar:
+        return merged
+    return [
+        dict(zip(columns, row))
+        for row in zip(*[merged[col] for col in columns])
+    ]
+
+
+def iter_csv(key, header, **csv_kwargs):
+    """Streams the stored results as CSV, one chunk at a time"""
+    columns = data_columns(header)
+    first = True
+    for data in iter_chunks(key, header):
+        df = pd.DataFrame(data, columns=columns)
+        yield df.to_csv(index=False, header=first, **csv_kwargs)
+        first = False
+    if first:
+        # No rows, still a header
+        yield pd.DataFrame([], columns=columns).to_csv(
+            index=False, **csv_kwargs)
@@ -0,0 +1,242 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Retention of the rows of the query and logs tables
+
+Both tables only ever grow. The rows older than ``RETENTION_DAYS`` for
+their table are deleted, ``RETENTION_BATCH_SIZE`` rows at a time so that
+no long transaction holds the tables. When ``RETENTION_ARCHIVE_PATH`` is
+set, they are first archived there as compressed parquet files, a batch
+only being deleted once its archive is written. Pruning is run by the
+``prune_tables`` celery task, to schedule with celery beat, or the
+``superset prune_tables`` command.
+
+On PostgreSQL 11 and later, the logs table can be partitioned by month on
+``dttm`` (see ``partition_logs``). The monthly partitions past retention
+are then archived and dropped whole rather than deleted row by row, and
+the queries filtering logs on time only read the recent partitions.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+import logging
+import os
+import re
+
+import pandas as pd
+from sqlalchemy import select, text
+
+from superset import app, db, utils
+from superset.exceptions import SupersetException
+from superset.models.core import Log
+from superset.models.sql_lab import Query
+
+config = app.config
+stats_logger = config.get('STATS_LOGGER')
+celery_app = utils.get_celery_app(config)
+
+# The column telling the age of the rows of each table
+TIME_COLUMNS = {
+    'query': Query.__table__.c.changed_on,
+    'logs': Log.__table__.c.dttm,
+}
+
+PARTITION_NAME = re.compile(r'^logs_p(\d{4})(\d{2})$')
+
+
+def archive_path(table_name, first_id, last_id):
+    return os.path.join(
+        config.get('RETENTION_ARCHIVE_PATH'), table_name,
+        '{}_{}_{}.parquet'.format(table_name, first_id, last_id))
+
+
+def write_archive(df, table_name):
+    """Writes the rows of ``df`` to a parquet file, requires pyarrow or
+    fastparquet"""
+    path = archive_path(table_name, df['id'].min(), df['id'].max())
+    directory = os.path.dirname(path)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    df.to_parquet(
+        path, compression=config.get('RETENTION_ARCHIVE_COMPRESSION'),
+        index=False)
+    logging.info('Archived {} rows of {} to {}'.format(
+        len(df.index), table_name, path))
+
+
+def prune_rows(session, table, where, batch_size, archive=True):
+    """Archives and deletes the rows of ``table`` matching ``where``, a
+    batch at a time. Returns the number of rows deleted."""
+    deleted = 0
+    while True:
+        result = session.execute(
+            select([table]).where(where)
+            .order_by(table.c.id)
+            .limit(batch_size))
+        df = pd.DataFrame.from_records(
+            result.fetchall(), columns=result.keys())
+        if df.empty:
+            break
+        if archive:
+            write_archive(df, table.name)
+        session.execute(
+            table.delete().where(table.c.id.in_(df['id'].tolist())))
+        session.commit()
+        deleted += len(df.index)
+    return deleted
+
+
+def is_partitioned(session, table_name):
+    if session.bind.dialect.name != 'postgresql':
+        return False
+    return bool(session.execute(
+        text(
+            'SELECT 1 FROM pg_partitioned_table '
+            'WHERE partrelid = to_regclass(:name)'),
+        {'name': table_name},
+    ).scalar())
+
+
+def month_start(dttm, months=0):
+    month = dttm.month - 1 + months
+    return datetime(dttm.year + month // 12, month % 12 + 1, 1)
+
+
+def partition_name(start):
+    return 'logs_p{:04d}{:02d}'.format(start.year, start.month)
+
+
+def log_partitions(session):
+    """The monthly partitions of logs, as a ``{name: start}`` dict"""
+    names = session.execute(text(
+        'SELECT c.relname FROM pg_inherits i '
+        'JOIN pg_class c ON c.oid = i.inhrelid '
+        "WHERE i.inhparent = to_regclass('logs')")).fetchall()
+    partitions = {}
+    for name, in names:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions[name] = datetime(
+                int(match.group(1)), int(match.group(2)), 1)
+    return partitions
+
+
+def create_log_partitions(session, months_ahead=None):
+    """Creates the partitions of logs for the next months. This month is
+    covered by the partition created ahead, or the legacy one."""
+    if months_ahead is None:
+        months_ahead = config.get('LOGS_PARTITIONS_AHEAD')
+    existing = log_partitions(session)
+    now = datetime.utcnow()
+    for i in range(1, months_ahead + 1):
+        start = month_start(now, i)
+        name = partition_name(start)
+        if name in existing:
+            continue
+        session.execute(text(
+            'CREATE TABLE {} PARTITION OF logs '
+            "FOR VALUES FROM ('{}') TO ('{}')".format(
+                name, start.isoformat(), month_start(start, 1).isoformat())))
+        logging.info('Created the partition {} of logs'.format(name))
+    session.commit()
+
+
+def partition_logs(session):
+    """Turns logs into a table partitioned by month on ``dttm``
+
+    The existing table becomes the partition of the rows older than next
+    month, without copying them. Its rows without a ``dttm`` are given the
+    epoch, as partition keys can't be null. A default partition catches
+    the rows outside of the monthly partitions, should their creation lag
+    behind. Requires PostgreSQL 11 or later.
+    """
+    if session.bind.dialect.name != 'postgresql':
+        raise SupersetException('Only the logs of PostgreSQL can be partitioned')
+    if is_partitioned(session, 'logs'):
+        logging.info('logs is already partitioned')
+        return
+    boundary = month_start(datetime.utcnow(), 1).isoformat()
+    sequence = session.execute(
+        text("SELECT pg_get_serial_sequence('logs', 'id')")).scalar()
+    for statement in (
+            "UPDATE logs SET dttm = '1970-01-01' WHERE dttm IS NULL",
+            'ALTER TABLE logs RENAME TO logs_legacy',
+            'CREATE TABLE logs (LIKE logs_legacy INCLUDING DEFAULTS) '
+            'PARTITION BY RANGE (dttm)',
+            # Keep the id sequence when the legacy partition gets dropped
+            'ALTER SEQUENCE {} OWNED BY logs.id'.format(sequence),
+            'ALTER TABLE logs ATTACH PARTITION logs_legacy '
+            "FOR VALUES FROM (MINVALUE) TO ('{}')".format(boundary),
+            'CREATE TABLE logs_default PARTITION OF logs DEFAULT'):
+        session.execute(text(statement))
+    session.commit()
+    create_log_partitions(session)
+
+
+def drop_log_partitions(session, cutoff, batch_size, archive=True):
+    """Archives and drops the partitions of logs entirely older than
+    ``cutoff``. Returns the number of rows dropped."""
+    table = Log.__table__
+    dropped = 0
+    for name, start in sorted(log_partitions(session).items()):
+        if month_start(start, 1) > cutoff:
+            continue
+        count = session.execute(
+            text('SELECT COUNT(*) FROM {}'.format(name))).scalar()
+        if archive and count:
+            last_id = 0
+            while True:
+                result = session.execute(text(
+                    'SELECT * FROM {} WHERE id > :last_id '
+                    'ORDER BY id LIMIT :limit'.format(name)),
+                    {'last_id': last_id, 'limit': batch_size})
+                df = pd.DataFrame.from_records(
+                    result.fetchall(), columns=result.keys())
+                if df.empty:
+                    break
+                write_archive(df, table.name)
+                last_id = int(df['id'].max())
+        session.execute(text('DROP TABLE {}'.format(name)))
+        session.commit()
+        logging.info('Dropped the partition {} of logs'.format(name))
+        dropped += count
+    return dropped
+
+
+def prune_table(session, table_name, days, batch_size=None, archive=None):
+    """Archives and deletes the rows of a table older than ``days``"""
+    if batch_size is None:
+        batch_size = config.get('RETENTION_BATCH_SIZE')
+    if archive is None:
+        archive = bool(config.get('RETENTION_ARCHIVE_PATH'))
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    time_column = TIME_COLUMNS[table_name]
+    deleted = 0
+    if table_name == 'logs' and is_partitioned(session, 'logs'):
+        deleted += drop_log_partitions(session, cutoff, batch_size, archive)
+    deleted += prune_rows(
+        session, time_column.table, time_column < cutoff, batch_size, archive)
+    stats_logger.gauge('retention.{}.deleted'.format(table_name), deleted)
+    logging.info('Pruned {} rows older than {} from {}'.format(
+        deleted, cutoff, table_name))
+    return deleted
+
+
+@celery_app.task(name='prune_tables')
+def prune_tables():
+    """Prunes the tables with a retention set in ``RETENTION_DAYS``, and
+    creates the upcoming partitions of logs when it is partitioned"""
+    session = db.session()
+    if is_partitioned(session, 'logs'):
+        create_log_partitions(session)
+    for table_name, days in (config.get('RETENTION_DAYS') or {}).items():
+        if days is None:
+            continue
+        try:
+            prune_table(session, table_name, days)
+        except Exception as e:
+            session.rollback()
+            logging.error('Could not prune {}'.format(table_name))
+            logging.exception(e)
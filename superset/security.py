@@ -7,11 +7,13 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import logging
+import time
 
 from flask import g
 from flask_appbuilder.security.sqla import models as ab_models
 from flask_appbuilder.security.sqla.manager import SecurityManager
-from sqlalchemy import or_
+from sqlalchemy import and_, event, or_
+from sqlalchemy.orm import joinedload, Session
 
 from superset import sql_parse
 from superset.connectors.connector_registry import ConnectorRegistry
@@ -56,6 +58,8 @@ ADMIN_ONLY_PERMISSIONS = {
     'can_sql_json',  # TODO: move can_sql_json to sql_lab role
     'can_override_role_permissions',
     'can_sync_druid_source',
+    'can_stats',
+    'can_query_profile',
     'can_override_role_permissions',
     'can_approve',
     'can_update_role',
@@ -69,6 +73,7 @@ READ_ONLY_PERMISSION = {
 ALPHA_ONLY_PERMISSIONS = set([
     'muldelete',
     'all_datasource_access',
+    'can_csv_upload_status',
 ])
 
 OBJECT_SPEC_PERMISSIONS = set([
@@ -81,6 +86,13 @@ OBJECT_SPEC_PERMISSIONS = set([
 
 class SupersetSecurityManager(SecurityManager):
 
+    def __init__(self, appbuilder):
+        super(SupersetSecurityManager, self).__init__(appbuilder)
+        # user id -> (expiry, version, frozenset of (permission, view_menu))
+        self._perms_snapshots = {}
+        self._perms_version = 0
+        self._listen_for_perms_changes()
+
     def get_schema_perm(self, database, schema):
         if schema:
             return '[{}].[{}]'.format(database, schema)
@@ -93,6 +105,97 @@ class SupersetSecurityManager(SecurityManager):
             return self.is_item_public(permission_name, view_name)
         return self._has_view_access(user, permission_name, view_name)
 
+    def _has_view_access(self, user, permission_name, view_name):
+        """Checks access against the user's permission snapshot"""
+        if getattr(user, 'id', None) is None:
+            return super(SupersetSecurityManager, self)._has_view_access(
+                user, permission_name, view_name)
+        return (permission_name, view_name) in self.get_perms_snapshot(user)
+
+    def get_perms_snapshot(self, user):
+        """Returns the set of ``(permission, view_menu)`` granted to a user
+
+        The set is loaded in a single query, then memoized for the current
+        request and for ``PERMISSIONS_SNAPSHOT_TTL`` seconds across requests.
+        Any change to roles or permissions invalidates the snapshots.
+        """
+        request_snapshots = self._request_perms_snapshots()
+        if request_snapshots is not None and user.id in request_snapshots:
+            return request_snapshots[user.id]
+
+        now = time.time()
+        cached = self._perms_snapshots.get(user.id)
+        if cached and cached[0] > now and cached[1] == self._perms_version:
+            perms = cached[2]
+        else:
+            version = self._perms_version
+            perms = self._load_perms(user)
+            ttl = self.appbuilder.get_app.config.get('PERMISSIONS_SNAPSHOT_TTL')
+            if ttl:
+                self._perms_snapshots[user.id] = (now + ttl, version, perms)
+
+        if request_snapshots is not None:
+            request_snapshots[user.id] = perms
+        return perms
+
+    def invalidate_perms_snapshots(self, *args, **kwargs):
+        """Drops all permission snapshots, to be called when roles change"""
+        self._perms_version += 1
+        self._perms_snapshots = {}
+        request_snapshots = self._request_perms_snapshots()
+        if request_snapshots:
+            request_snapshots.clear()
+
+    def _request_perms_snapshots(self):
+        try:
+            if not hasattr(g, 'perms_snapshots'):
+                g.perms_snapshots = {}
+            return g.perms_snapshots
+        except RuntimeError:
+            # Working outside of the application context
+            return None
+
+    def _query_pv_names(self):
+        """Query of the ``(permission, view_menu)`` names of all the
+        permission views"""
+        pv = self.permissionview_model
+        return (
+            self.get_session.query(
+                self.permission_model.name, self.viewmenu_model.name)
+            .select_from(pv)
+            .join(self.permission_model, pv.permission_id == self.permission_model.id)
+            .join(self.viewmenu_model, pv.view_menu_id == self.viewmenu_model.id)
+        )
+
+    def _load_perms(self, user):
+        pv = self.permissionview_model
+        pv_role = ab_models.assoc_permissionview_role
+        user_role = ab_models.assoc_user_role
+        qry = (
+            self._query_pv_names()
+            .join(pv_role, pv_role.c.permission_view_id == pv.id)
+            .join(user_role, user_role.c.role_id == pv_role.c.role_id)
+            .filter(user_role.c.user_id == user.id)
+        )
+        return frozenset(qry.all())
+
+    def _listen_for_perms_changes(self):
+        for attr in (self.user_model.roles, self.role_model.permissions):
+            for identifier in ('append', 'remove'):
+                event.listen(attr, identifier, self.invalidate_perms_snapshots)
+        event.listen(Session, 'after_flush', self._invalidate_on_flush)
+
+    def _invalidate_on_flush(self, session, flush_context):
+        models = (
+            self.role_model,
+            self.permission_model,
+            self.viewmenu_model,
+            self.permissionview_model,
+        )
+        changed = session.deleted | session.dirty | session.new
+        if any(isinstance(obj, models) for obj in changed):
+            self.invalidate_perms_snapshots()
+
     def all_datasource_access(self, user=None):
         return self.can_access(
             'all_datasource_access', 'all_datasource_access', user=user)
@@ -234,41 +337,82 @@ class SupersetSecurityManager(SecurityManager):
         self.merge_perm('all_database_access', 'all_database_access')
 
     def create_missing_perms(self):
-        """Creates missing perms for datasources, schemas and metrics"""
+        """Creates missing perms for datasources, schemas and metrics
+
+        The perms needed are diffed as a set against the existing ones, and
+        only the missing ones are inserted, in bulk.
+        """
         from superset import db
         from superset.models import core as models
 
         logging.info(
             'Fetching a set of all perms to lookup which ones are missing')
-        all_pvs = set()
-        for pv in self.get_session.query(self.permissionview_model).all():
-            if pv.permission and pv.view_menu:
-                all_pvs.add((pv.permission.name, pv.view_menu.name))
-
-        def merge_pv(view_menu, perm):
-            """Create permission view menu only if it doesn't exist"""
-            if view_menu and perm and (view_menu, perm) not in all_pvs:
-                self.merge_perm(view_menu, perm)
-
-        logging.info('Creating missing datasource permissions.')
-        datasources = ConnectorRegistry.get_all_datasources(db.session)
-        for datasource in datasources:
-            merge_pv('datasource_access', datasource.get_perm())
-            merge_pv('schema_access', datasource.schema_perm)
-
-        logging.info('Creating missing database permissions.')
-        databases = db.session.query(models.Database).all()
-        for database in databases:
-            merge_pv('database_access', database.perm)
+        all_pvs = set(self._query_pv_names())
 
-        logging.info('Creating missing metrics permissions')
-        metrics = []
+        logging.info('Collecting datasource, schema and metric permissions')
+        perm_names = set()
         for datasource_class in ConnectorRegistry.sources.values():
-            metrics += list(db.session.query(datasource_class.metric_class).all())
-
-        for metric in metrics:
-            if metric.is_restricted:
-                merge_pv('metric_access', metric.perm)
+            perm_names.update(datasource_class.query_perm_names(db.session))
+
+        logging.info('Collecting database permissions')
+        for database_perm, in db.session.query(models.Database.perm):
+            perm_names.add(('database_access', database_perm))
+
+        missing = {
+            (permission_name, view_menu_name)
+            for permission_name, view_menu_name in perm_names
+            if permission_name and view_menu_name
+        } - all_pvs
+        if missing:
+            logging.info('Creating {} missing permissions'.format(len(missing)))
+            self.add_permission_views(missing)
+
+    def add_permission_views(self, perm_names):
+        """Bulk inserts permission views from ``(permission, view_menu)``
+        names that don't exist yet
+
+        The missing view menus are inserted with a single statement, and so
+        are the permission views.
+        """
+        sesh = self.get_session
+        permission_ids = {
+            permission_name: self.add_permission(permission_name).id
+            for permission_name in {p for p, _ in perm_names}
+        }
+        view_menu_names = {v for _, v in perm_names}
+        view_menu_ids = self._query_view_menu_ids(view_menu_names)
+        new_view_menus = view_menu_names - set(view_menu_ids)
+        if new_view_menus:
+            sesh.execute(
+                self.viewmenu_model.__table__.insert(),
+                [{'name': name} for name in new_view_menus])
+            view_menu_ids.update(self._query_view_menu_ids(new_view_menus))
+        sesh.execute(
+            self.permissionview_model.__table__.insert(),
+            [
+                {
+                    'permission_id': permission_ids[permission_name],
+                    'view_menu_id': view_menu_ids[view_menu_name],
+                }
+                for permission_name, view_menu_name in perm_names
+            ])
+        sesh.commit()
+        self.invalidate_perms_snapshots()
+
+    def _query_view_menu_ids(self, names, batch_size=500):
+        vm = self.viewmenu_model
+        names = sorted(names)
+        view_menu_ids = {}
+        # Batched, some databases bound the number of query parameters
+        for i in range(0, len(names), batch_size):
+            view_menu_ids.update({
+                name: id_
+                for id_, name in (
+                    self.get_session.query(vm.id, vm.name)
+                    .filter(vm.name.in_(names[i:i + batch_size]))
+                )
+            })
+        return view_menu_ids
 
     def clean_perms(self):
         """FAB leaves faulty permissions that need to be cleaned up"""
@@ -310,15 +454,42 @@ class SupersetSecurityManager(SecurityManager):
         self.clean_perms()
 
     def set_role(self, role_name, pvm_check):
+        """Syncs the perms of a role with the permission views passing
+        ``pvm_check``, only inserting and deleting the differences"""
         logging.info('Syncing {} perms'.format(role_name))
         sesh = self.get_session
-        pvms = sesh.query(ab_models.PermissionView).all()
-        pvms = [p for p in pvms if p.permission and p.view_menu]
+        pvms = (
+            sesh.query(ab_models.PermissionView)
+            .options(joinedload('permission'), joinedload('view_menu'))
+            .all()
+        )
         role = self.add_role(role_name)
-        role_pvms = [p for p in pvms if pvm_check(p)]
-        role.permissions = role_pvms
-        sesh.merge(role)
+        role_pvm_ids = {
+            p.id for p in pvms if p.permission and p.view_menu and pvm_check(p)}
+
+        pv_role = ab_models.assoc_permissionview_role
+        current_ids = {
+            pvm_id for pvm_id, in
+            sesh.query(pv_role.c.permission_view_id)
+            .filter(pv_role.c.role_id == role.id)
+        }
+        added = role_pvm_ids - current_ids
+        removed = current_ids - role_pvm_ids
+        if added:
+            sesh.execute(
+                pv_role.insert(),
+                [
+                    {'permission_view_id': pvm_id, 'role_id': role.id}
+                    for pvm_id in added
+                ])
+        if removed:
+            sesh.execute(
+                pv_role.delete().where(and_(
+                    pv_role.c.role_id == role.id,
+                    pv_role.c.permission_view_id.in_(removed),
+                )))
         sesh.commit()
+        self.invalidate_perms_snapshots()
 
     def is_admin_only(self, pvm):
         # not readonly operations on read only model views allowed only for admins
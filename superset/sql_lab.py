@@ -3,7 +3,6 @@
 from __future__ import absolute_import, division, print_function, unicode_literals
 
 from datetime import datetime
-import json
 import logging
 from time import sleep
 import uuid
@@ -14,7 +13,10 @@ import sqlalchemy
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import NullPool
 
-from superset import app, dataframe, db, results_backend, security_manager, utils
+from superset import (
+    app, dataframe, db, profiling, results_backend, results_store,
+    security_manager, tracing, utils,
+)
 from superset.models.sql_lab import Query
 from superset.sql_parse import SupersetQuery
 from superset.utils import get_celery_app, QueryStatus
@@ -51,6 +53,13 @@ def get_query(query_id, session, retry_count=5):
     return query
 
 
+def results_data(cdf, columnar=False):
+    """The rows of a result set, as records or as a dict of columns"""
+    if cdf.df.empty:
+        return {} if columnar else []
+    return cdf.columnar_data if columnar else cdf.data
+
+
 @contextmanager
 def session_scope(nullpool):
     """Provide a transactional scope around a series of operations."""
@@ -78,14 +87,20 @@ def session_scope(nullpool):
 @celery_app.task(bind=True, soft_time_limit=SQLLAB_TIMEOUT)
 def get_sql_results(
     ctask, query_id, rendered_query, return_results=True, store_results=False,
-        user_name=None):
-    """Executes the sql query returns the results."""
+        user_name=None, columnar=False, profile=False):
+    """Executes the sql query returns the results.
+
+    ``profile`` asks for the execution to be profiled, see
+    ``superset.profiling``."""
     with session_scope(not ctask.request.called_directly) as session:
 
         try:
-            return execute_norm(
-                ctask, query_id, rendered_query, return_results, store_results, user_name,
-                session=session)
+            with stats_logger.timer('sqllab.get_sql_results'), \
+                    profiling.profiled(
+                        query_id, profiling.should_profile(profile)):
+                return execute_norm(
+                    ctask, query_id, rendered_query, return_results, store_results,
+                    user_name, session=session, columnar=columnar)
         except Exception as e:
             logging.exception(e)
             stats_logger.incr('error_sqllab_unhandled')
@@ -97,11 +112,13 @@ def get_sql_results(
             raise
 
 
+@tracing.traced
 def execute_norm(ctask, query_id, rendered_query, return_results=True, store_results=False,
-                 user_name=None, session=None):
+                 user_name=None, session=None, columnar=False):
     """ Executes the norm script and returns the results"""
     if rendered_query.lower().find('select') >= 0:
-        return execute_sql(ctask, query_id, rendered_query, return_results, store_results, user_name, session)
+        return execute_sql(ctask, query_id, rendered_query, return_results, store_results, user_name,
+                           session, columnar=columnar)
 
     query = get_query(query_id, session)
     payload = dict(query_id=query_id)
@@ -112,6 +129,7 @@ def execute_norm(ctask, query_id, rendered_query, return_results=True, store_res
         query.error_message = msg
         query.status = QueryStatus.FAILED
         query.tmp_table_name = None
+        query.add_timings(tracing.pop_spans())
         session.commit()
         payload.update({
             'status': query.status,
@@ -135,7 +153,9 @@ def execute_norm(ctask, query_id, rendered_query, return_results=True, store_res
     db_engine_spec = database.db_engine_spec
     db_engine_spec.patch()
     try:
-        data = norm.execute(query.executed_sql, session, query.user)
+        with stats_logger.timer('sqllab.norm.execute'), \
+                tracing.span('norm.execute'):
+            data = norm.execute(query.executed_sql, session, query.user)
     except SoftTimeLimitExceeded as e:
         logging.exception(e)
         return handle_error(
@@ -148,7 +168,8 @@ def execute_norm(ctask, query_id, rendered_query, return_results=True, store_res
     if query.status == utils.QueryStatus.STOPPED:
         return handle_error('The query has been stopped')
 
-    cdf = dataframe.SupersetDataFrame(data)
+    with tracing.span('dataframe'):
+        cdf = dataframe.SupersetDataFrame(data)
 
     query.rows = cdf.size
     query.progress = 100
@@ -159,29 +180,33 @@ def execute_norm(ctask, query_id, rendered_query, return_results=True, store_res
 
     payload.update({
         'status': query.status,
-        'data': cdf.data if cdf.data else [],
         'columns': cdf.columns if cdf.columns else [],
         'query': query.to_dict(),
     })
     if store_results:
         key = '{}'.format(uuid.uuid4())
         logging.info('Storing results in results backend, key: {}'.format(key))
-        json_payload = json.dumps(payload, default=utils.json_iso_dttm_ser)
         cache_timeout = config.get('CACHE_DEFAULT_TIMEOUT', 0)
-        results_backend.set(key, utils.zlib_compress(json_payload), cache_timeout)
+        with stats_logger.timer('sqllab.store'), \
+                tracing.span('results_backend_write'):
+            results_store.store(key, payload, cdf.df, cache_timeout, columnar)
         query.results_key = key
         query.end_result_backend_time = utils.now_as_float()
 
+    query.add_timings(tracing.pop_spans())
     session.merge(query)
     session.commit()
 
     if return_results:
+        payload['query']['timings'] = query.get_timings()
+        payload['data'] = results_data(cdf, columnar)
         return payload
 
 
+@tracing.traced
 def execute_sql(
     ctask, query_id, rendered_query, return_results=True, store_results=False,
-    user_name=None, session=None,
+    user_name=None, session=None, columnar=False,
 ):
     """Executes the sql query returns the results."""
 
@@ -198,6 +223,7 @@ def execute_sql(
         query.error_message = msg
         query.status = QueryStatus.FAILED
         query.tmp_table_name = None
+        query.add_timings(tracing.pop_spans())
         session.commit()
         payload.update({
             'status': query.status,
@@ -211,7 +237,8 @@ def execute_sql(
         return handle_error("Results backend isn't configured.")
 
     # Limit enforced only for retrieving the data, not for the CTA queries.
-    superset_query = SupersetQuery(rendered_query)
+    with tracing.span('parse'):
+        superset_query = SupersetQuery(rendered_query)
     executed_sql = superset_query.stripped()
     SQL_MAX_ROWS = app.config.get('SQL_MAX_ROW')
     if not superset_query.is_select() and not database.allow_dml:
@@ -245,27 +272,68 @@ def execute_sql(
     session.merge(query)
     session.commit()
     logging.info("Set query to 'running'")
+
+    if store_results:
+        key = '{}'.format(uuid.uuid4())
+        cache_timeout = database.cache_timeout
+        if cache_timeout is None:
+            cache_timeout = config.get('CACHE_DEFAULT_TIMEOUT', 0)
+    # When the results are only stored, they are fetched and written to the
+    # results backend batch by batch, bounding the memory used
+    stream_results = (
+        store_results and not return_results and
+        config.get('SQLLAB_STREAM_RESULTS'))
     conn = None
+    writer = None
     try:
-        engine = database.get_sqla_engine(
-            schema=query.schema,
-            nullpool=not ctask.request.called_directly,
-            user_name=user_name,
-        )
-        conn = engine.raw_connection()
-        cursor = conn.cursor()
+        with stats_logger.timer('sqllab.connect'), tracing.span('engine'):
+            engine = database.get_sqla_engine(
+                schema=query.schema,
+                user_name=user_name,
+            )
+            conn = engine.raw_connection()
+        server_side = (
+            stream_results and
+            superset_query.is_select() and
+            len(superset_query.statements) == 1)
+        cursor = db_engine_spec.get_cursor(conn, server_side=server_side)
         logging.info('Running query: \n{}'.format(executed_sql))
         logging.info(query.executed_sql)
-        cursor.execute(query.executed_sql,
-                       **db_engine_spec.cursor_execute_kwargs)
+        with stats_logger.timer('sqllab.execute'), tracing.span('execute'):
+            cursor.execute(query.executed_sql,
+                           **db_engine_spec.cursor_execute_kwargs)
         logging.info('Handling cursor')
-        db_engine_spec.handle_cursor(cursor, query, session)
-        logging.info('Fetching data: {}'.format(query.to_dict()))
-        data = db_engine_spec.fetch_data(cursor, query.limit)
+        with stats_logger.timer('sqllab.handle_cursor'), \
+                tracing.span('handle_cursor'):
+            db_engine_spec.handle_cursor(cursor, query, session)
+        if stream_results:
+            logging.info('Streaming data: {}'.format(query.to_dict()))
+            writer = results_store.ChunkWriter(key, cache_timeout)
+            batches = db_engine_spec.fetch_batches(
+                cursor, query.limit,
+                config.get('RESULTS_BACKEND_CHUNK_SIZE') or 10000)
+            with stats_logger.timer('sqllab.fetch'), tracing.span('fetch'):
+                for batch in batches:
+                    cdf = dataframe.SupersetDataFrame(
+                        batch, cursor.description, db_engine_spec)
+                    if writer.columns is None:
+                        columns = cdf.columns
+                    writer.write(cdf.df)
+            if writer.columns is None:
+                cdf = dataframe.SupersetDataFrame(
+                    [], cursor.description, db_engine_spec)
+                columns = cdf.columns
+                writer.write(cdf.df)
+        else:
+            logging.info('Fetching data: {}'.format(query.to_dict()))
+            with stats_logger.timer('sqllab.fetch'), tracing.span('fetch'):
+                data = db_engine_spec.fetch_data(cursor, query.limit)
     except SoftTimeLimitExceeded as e:
         logging.exception(e)
         if conn is not None:
             conn.close()
+        if writer is not None:
+            writer.abort()
         return handle_error(
             "SQL Lab timeout. This environment's policy is to kill queries "
             'after {} seconds.'.format(SQLLAB_TIMEOUT))
@@ -273,6 +341,8 @@ def execute_sql(
         logging.exception(e)
         if conn is not None:
             conn.close()
+        if writer is not None:
+            writer.abort()
         return handle_error(db_engine_spec.extract_error_message(e))
 
     logging.info('Fetching cursor description')
@@ -282,11 +352,18 @@ def execute_sql(
         conn.close()
 
     if query.status == utils.QueryStatus.STOPPED:
+        if writer is not None:
+            writer.abort()
         return handle_error('The query has been stopped')
 
-    cdf = dataframe.SupersetDataFrame(data, cursor.description, db_engine_spec)
-
-    query.rows = cdf.size
+    if stream_results:
+        query.rows = writer.rows
+    else:
+        with tracing.span('dataframe'):
+            cdf = dataframe.SupersetDataFrame(
+                data, cursor.description, db_engine_spec)
+        columns = cdf.columns
+        query.rows = cdf.size
     query.progress = 100
     query.status = QueryStatus.SUCCESS
     if query.select_as_cta:
@@ -303,23 +380,26 @@ def execute_sql(
 
     payload.update({
         'status': query.status,
-        'data': cdf.data if cdf.data else [],
-        'columns': cdf.columns if cdf.columns else [],
+        'columns': columns if columns else [],
         'query': query.to_dict(),
     })
     if store_results:
-        key = '{}'.format(uuid.uuid4())
         logging.info('Storing results in results backend, key: {}'.format(key))
-        json_payload = json.dumps(payload, default=utils.json_iso_dttm_ser)
-        cache_timeout = database.cache_timeout
-        if cache_timeout is None:
-            cache_timeout = config.get('CACHE_DEFAULT_TIMEOUT', 0)
-        results_backend.set(key, utils.zlib_compress(json_payload), cache_timeout)
+        with stats_logger.timer('sqllab.store'), \
+                tracing.span('results_backend_write'):
+            if stream_results:
+                writer.close(payload, columnar)
+            else:
+                results_store.store(
+                    key, payload, cdf.df, cache_timeout, columnar)
         query.results_key = key
         query.end_result_backend_time = utils.now_as_float()
 
+    query.add_timings(tracing.pop_spans())
     session.merge(query)
     session.commit()
 
     if return_results:
+        payload['query']['timings'] = query.get_timings()
+        payload['data'] = results_data(cdf, columnar)
         return payload
@@ -5,35 +5,68 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hashlib
 import logging
 
 import sqlparse
 from sqlparse.sql import Identifier, IdentifierList
 from sqlparse.tokens import Keyword, Name
 
+from superset import utils
+
 RESULT_OPERATIONS = {'UNION', 'INTERSECT', 'EXCEPT'}
 PRECEDES_TABLE_NAME = {'FROM', 'JOIN', 'DESC', 'DESCRIBE', 'WITH'}
 
+# Number of parse results kept in the in process LRU cache
+PARSE_CACHE_SIZE = 256
+
+# Parsing large scripts with sqlparse is slow, and the same SQL tends to be
+# parsed several times while serving a single SQL Lab query: for the access
+# checks, then when executing it. Parse results are cached by parse_key.
+parse_cache = utils.LRUCache(maxsize=PARSE_CACHE_SIZE, name='sql_parse')
+
+
+def parse_key(sql):
+    return hashlib.sha1((sql or '').encode('utf-8')).hexdigest()
+
 
 class SupersetQuery(object):
     def __init__(self, sql_statement):
         self.sql = sql_statement
         self._table_names = set()
         self._alias_names = set()
-        # TODO: multistatement support
 
+        self._table_names, self._statements, self._statement_types = (
+            parse_cache.get_or_create(parse_key(self.sql), self.__parse))
+
+    def __parse(self):
         logging.info('Parsing with sqlparse statement {}'.format(self.sql))
-        self._parsed = sqlparse.parse(self.sql)
-        for statement in self._parsed:
+        parsed = sqlparse.parse(self.sql)
+        for statement in parsed:
             self.__extract_from_token(statement)
-        self._table_names = self._table_names - self._alias_names
+        statements = [
+            (str(s).strip().strip(';'), s.get_type()) for s in parsed]
+        statements = [(sql, type_) for sql, type_ in statements if sql]
+        return (
+            frozenset(self._table_names - self._alias_names),
+            tuple(sql for sql, _ in statements),
+            tuple(type_ for _, type_ in statements),
+        )
 
     @property
     def tables(self):
         return self._table_names
 
+    @property
+    def statements(self):
+        """The non empty statements, stripped of their trailing ``;``"""
+        return list(self._statements)
+
     def is_select(self):
-        return self._parsed[0].get_type() == 'SELECT'
+        """Whether all the statements are ``SELECT`` ones"""
+        return (
+            bool(self._statement_types) and
+            all(t == 'SELECT' for t in self._statement_types))
 
     def stripped(self):
         return self.sql.strip(' \t\n;')
@@ -5,7 +5,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+from contextlib import contextmanager
 import logging
+import math
+import threading
+import timeit
 
 from colorama import Fore, Style
 
@@ -29,10 +33,26 @@ class BaseStatsLogger(object):
         """Decrement a counter"""
         raise NotImplementedError()
 
-    def gauge(self, key):
+    def gauge(self, key, value):
         """Setup a gauge"""
         raise NotImplementedError()
 
+    def timing(self, key, value):
+        """Log a duration, in milliseconds
+
+        Not abstract, for the stats loggers written before timings were
+        supported to keep working."""
+        pass
+
+    @contextmanager
+    def timer(self, key):
+        """Times the enclosed block"""
+        start = timeit.default_timer()
+        try:
+            yield
+        finally:
+            self.timing(key, (timeit.default_timer() - start) * 1000)
+
 
 class DummyStatsLogger(BaseStatsLogger):
     def incr(self, key):
@@ -49,6 +69,122 @@ class DummyStatsLogger(BaseStatsLogger):
             Fore.CYAN + '[stats_logger] (gauge) '
             '{key} | {value}' + Style.RESET_ALL).format(**locals()))
 
+    def timing(self, key, value):
+        logging.debug((
+            Fore.CYAN + '[stats_logger] (timing) '
+            '{key} | {value:.3f}ms' + Style.RESET_ALL).format(**locals()))
+
+
+class Histogram(object):
+    """A histogram of values with a bounded relative error
+
+    As in HdrHistogram, each power of two range is split in ``sub_buckets``
+    linear buckets, so percentiles are reported within ``1 / sub_buckets``
+    of the actual values while the memory used only grows with the
+    logarithm of the range of the values.
+    """
+
+    def __init__(self, sub_buckets=32):
+        self.sub_buckets = sub_buckets
+        self.counts = {}
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def width(self, value):
+        """Width of the bucket ``value`` falls in"""
+        if value < self.sub_buckets:
+            return 1
+        return 2 ** (math.frexp(value)[1] - math.frexp(self.sub_buckets)[1])
+
+    def bucket(self, value):
+        """Lower bound of the bucket ``value`` falls in"""
+        return value - value % self.width(value)
+
+    def record(self, value):
+        bucket = self.bucket(value)
+        self.counts[bucket] = self.counts.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, percent):
+        if not self.count:
+            return None
+        rank = percent / 100 * self.count
+        seen = 0
+        for bucket in sorted(self.counts):
+            seen += self.counts[bucket]
+            if seen >= rank:
+                return min(bucket + self.width(bucket), self.max)
+        return self.max
+
+    def data(self, percentiles=(50, 90, 99, 99.9)):
+        return {
+            'count': self.count,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'percentiles': {
+                str(p): self.percentile(p) for p in percentiles},
+        }
+
+
+class HistogramStatsLogger(BaseStatsLogger):
+    """Keeps the counters, gauges and timing histograms in process
+
+    They are served by the ``/superset/stats/`` endpoint. Everything is
+    also passed on to ``delegate`` if given, e.g. a ``StatsdStatsLogger``.
+    """
+
+    def __init__(self, delegate=None, sub_buckets=32):
+        super(HistogramStatsLogger, self).__init__()
+        self.delegate = delegate
+        self.sub_buckets = sub_buckets
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+        self._lock = threading.Lock()
+
+    def incr(self, key):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + 1
+        if self.delegate:
+            self.delegate.incr(key)
+
+    def decr(self, key):
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) - 1
+        if self.delegate:
+            self.delegate.decr(key)
+
+    def gauge(self, key, value):
+        with self._lock:
+            self.gauges[key] = value
+        if self.delegate:
+            self.delegate.gauge(key, value)
+
+    def timing(self, key, value):
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(self.sub_buckets)
+            histogram.record(value)
+        if self.delegate:
+            self.delegate.timing(key, value)
+
+    def data(self):
+        with self._lock:
+            return {
+                'counters': dict(self.counters),
+                'gauges': dict(self.gauges),
+                'timings': {
+                    key: histogram.data()
+                    for key, histogram in self.histograms.items()},
+            }
+
 
 try:
     from statsd import StatsClient
@@ -63,9 +199,11 @@ try:
         def decr(self, key):
             self.client.decr(key)
 
-        def gauge(self, key):
-            # pylint: disable=no-value-for-parameter
-            self.client.gauge(key)
+        def gauge(self, key, value):
+            self.client.gauge(key, value)
+
+        def timing(self, key, value):
+            self.client.timing(key, value)
 
 except Exception as e:
     pass
@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=C,R,W
+"""Timing of the phases of a SQL Lab query or a viz request
+
+A trace is started for a block with ``trace()``, and the phases within
+it are timed with ``span(name)``. Traces are thread local, a trace
+started while one is active joins it. When ``TRACING_ENABLED`` isn't set,
+or outside of a trace, ``span`` returns a shared no-op context manager.
+
+    with tracing.trace():
+        with tracing.span('execute'):
+            cursor.execute(sql)
+        timings = tracing.pop_spans()
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from contextlib import contextmanager
+import functools
+import threading
+import timeit
+
+from superset import app
+
+config = app.config
+
+_local = threading.local()
+
+
+class Trace(object):
+    """The spans recorded, in the order they ended"""
+
+    def __init__(self):
+        self.spans = []
+        self.depth = 0
+
+    def pop(self):
+        """Returns the spans recorded so far and forgets them"""
+        spans, self.spans = self.spans, []
+        return spans
+
+
+class Span(object):
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.start = timeit.default_timer()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        duration = timeit.default_timer() - self.start
+        self.trace.depth -= 1
+        self.trace.spans.append({
+            'name': self.name,
+            'depth': self.depth,
+            'duration_ms': round(duration * 1000, 3),
+        })
+        return False
+
+
+class NullSpan(object):
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        return False
+
+
+NULL_SPAN = NullSpan()
+
+
+def current_trace():
+    return getattr(_local, 'trace', None)
+
+
+def span(name):
+    """Times the enclosed block in the current trace, if any"""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        return NULL_SPAN
+    return Span(trace, name)
+
+
+@contextmanager
+def trace():
+    """Starts a trace for the block, or joins the active one. Yields
+    ``None`` when tracing is disabled."""
+    active = current_trace()
+    if active is not None or not config.get('TRACING_ENABLED'):
+        yield active
+        return
+    _local.trace = Trace()
+    try:
+        yield _local.trace
+    finally:
+        _local.trace = None
+
+
+def traced(f):
+    """Runs ``f`` within a trace"""
+    @functools.wraps(f)
+    def wrapper(*args, **kwargs):
+        with trace():
+            return f(*args, **kwargs)
+    return wrapper
+
+
+def pop_spans():
+    """The spans recorded so far in the current trace, ``None`` outside of
+    a trace"""
+    active = current_trace()
+    return active.pop() if active is not None else None
@@ -6,7 +6,9 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import atexit
 from builtins import object
+from collections import OrderedDict
 from datetime import date, datetime, time, timedelta
 import decimal
 from email.mime.application import MIMEApplication
@@ -21,6 +23,8 @@ import os
 import signal
 import smtplib
 import sys
+import threading
+import timeit
 import uuid
 import zlib
 
@@ -37,12 +41,19 @@ import parsedatetime
 from past.builtins import basestring
 from pydruid.utils.having import Having
 import pytz
+import simplejson
+from six.moves import queue
 import sqlalchemy as sa
 from sqlalchemy import event, exc, select
 from sqlalchemy.types import TEXT, TypeDecorator
 
 from superset.exceptions import SupersetException, SupersetTimeoutException
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 logging.getLogger('MARKDOWN').setLevel(logging.INFO)
 
@@ -120,6 +131,191 @@ def memoized(func=None, watch=None):
         return wrapper
 
 
+class LRUCache(object):
+    """A thread safe LRU cache, bounded in size and optionally in age
+
+    Values evicted, expired or removed are passed to ``on_evict``, to
+    release the resources they hold. Hits and misses are counted, and
+    reported along with the size through ``stats_logger`` if given.
+    """
+
+    def __init__(self, maxsize=128, ttl=None, on_evict=None, name='lru_cache',
+                 stats_logger=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.name = name
+        self.stats_logger = stats_logger
+        self.hits = 0
+        self.misses = 0
+        # key -> (expiry, value), least recently used first
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get_or_create(self, key, create):
+        """Returns the value cached under ``key``, calling ``create`` to
+        make it on a miss"""
+        evicted = []
+        with self._lock:
+            now = timeit.default_timer()
+            entry = self._entries.pop(key, None)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self._entries[key] = entry
+                self.hits += 1
+                hit = True
+                value = entry[1]
+            else:
+                self.misses += 1
+                hit = False
+                if entry is not None:
+                    evicted.append(entry[1])
+                evicted += self._pop_expired(now)
+                value = create()
+                expiry = now + self.ttl if self.ttl else None
+                self._entries[key] = (expiry, value)
+                while len(self._entries) > self.maxsize:
+                    evicted.append(self._entries.popitem(last=False)[1][1])
+            size = len(self._entries)
+        self._evict(evicted)
+        if self.stats_logger:
+            self.stats_logger.incr(
+                '{}.{}'.format(self.name, 'hit' if hit else 'miss'))
+            self.stats_logger.gauge('{}.size'.format(self.name), size)
+        return value
+
+    def remove(self, predicate=None):
+        """Removes the entries whose key matches ``predicate``, or all"""
+        with self._lock:
+            keys = [
+                key for key in self._entries
+                if predicate is None or predicate(key)]
+            evicted = [self._entries.pop(key)[1] for key in keys]
+        self._evict(evicted)
+
+    def _pop_expired(self, now):
+        expired = [
+            key for key, (expiry, _) in self._entries.items()
+            if expiry is not None and expiry <= now]
+        return [self._entries.pop(key)[1] for key in expired]
+
+    def _evict(self, values):
+        if not self.on_evict:
+            return
+        for value in values:
+            try:
+                self.on_evict(value)
+            except Exception as e:
+                logging.exception(e)
+
+
+class AsyncBatcher(object):
+    """Hands items over to a background thread passing them to ``flush``
+    in batches
+
+    A batch is flushed once it holds ``batch_size`` items, or ``interval``
+    seconds after its first item was taken off the queue. When the queue
+    is full, ``put`` blocks for up to ``put_timeout`` seconds per item,
+    then drops it. Dropped items, including those of batches ``flush``
+    failed on, are counted. At exit, the items still queued are flushed,
+    waiting up to ``exit_timeout`` seconds.
+    """
+
+    def __init__(self, flush, maxsize=10000, batch_size=500, interval=1,
+                 put_timeout=0.1, name='async_batcher', stats_logger=None,
+                 exit_timeout=5):
+        self.flush = flush
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.interval = interval
+        self.put_timeout = put_timeout
+        self.name = name
+        self.stats_logger = stats_logger
+        self.exit_timeout = exit_timeout
+        self.dropped = 0
+        self._queue = None
+        self._pid = None
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+
+    def _ensure_started(self):
+        # threads don't survive forks, a child starts its own
+        pid = os.getpid()
+        if self._pid == pid:
+            return
+        with self._lock:
+            if self._pid != pid:
+                self._queue = queue.Queue(self.maxsize)
+                thread = threading.Thread(target=self._run, name=self.name)
+                thread.daemon = True
+                thread.start()
+                self._pid = pid
+
+    def put(self, items):
+        self._ensure_started()
+        for item in items:
+            try:
+                self._queue.put(item, timeout=self.put_timeout)
+            except queue.Full:
+                self._count_dropped(1)
+
+    def join(self):
+        """Waits for all the items put to be flushed"""
+        if self._queue is not None:
+            self._queue.join()
+
+    def close(self):
+        """Waits up to ``exit_timeout`` seconds for the items put by this
+        process to be flushed, the thread being a daemon"""
+        if self._queue is None or self._pid != os.getpid():
+            return
+        deadline = timeit.default_timer() + self.exit_timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                timeout = deadline - timeit.default_timer()
+                if timeout <= 0:
+                    logging.warning('{}: {} items not flushed at exit'.format(
+                        self.name, self._queue.unfinished_tasks))
+                    return
+                self._queue.all_tasks_done.wait(timeout)
+
+    def _count_dropped(self, count):
+        with self._lock:
+            self.dropped += count
+            dropped = self.dropped
+        if self.stats_logger:
+            self.stats_logger.gauge('{}.dropped'.format(self.name), dropped)
+
+    def _next_batch(self):
+        batch = [self._queue.get()]
+        deadline = timeit.default_timer() + self.interval
+        while len(batch) < self.batch_size:
+            timeout = deadline - timeit.default_timer()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self.flush(batch)
+            except Exception as e:
+                logging.exception(e)
+                self._count_dropped(len(batch))
+            if self.stats_logger:
+                self.stats_logger.gauge(
+                    '{}.queue_size'.format(self.name), self._queue.qsize())
+            for _ in batch:
+                self._queue.task_done()
+
+
 def js_string_to_python(item):
     return None if item in ('null', 'undefined') else item
 
@@ -388,6 +584,76 @@ def json_dumps_w_dates(payload):
     return json.dumps(payload, default=json_int_dttm_ser)
 
 
+def columnar_values(series, iso_dates=False):
+    """Converts a pandas Series to a JSON ready list, column-wise
+
+    Datetimes become epoch milliseconds (or ISO strings when ``iso_dates``),
+    NaN, NaT and infinite values become ``None`` and integers too large for
+    Java Script are turned into strings, all without a Python callback per
+    cell. Object columns are left for the JSON ``default`` hook to handle.
+    """
+    values = series.values
+    kind = values.dtype.kind
+    if kind in 'iu':
+        big = numpy.abs(values) > JS_MAX_INTEGER
+        if not big.any():
+            return values.tolist()
+        out = values.astype(object)
+        out[big] = [str(v) for v in values[big].tolist()]
+        return out.tolist()
+    elif kind == 'b':
+        return values.tolist()
+    elif kind == 'f':
+        nulls = ~numpy.isfinite(values)
+        out = values.astype(object)
+    elif kind == 'M':
+        nulls = pd.isnull(values)
+        if iso_dates:
+            truncated = values.astype('datetime64[s]')
+            unit = 'us' if ((truncated != values) & ~nulls).any() else 's'
+            out = numpy.datetime_as_string(values, unit=unit).astype(object)
+        else:
+            out = values.astype('datetime64[ms]').astype(numpy.int64)
+            out = out.astype(float).astype(object)
+    else:
+        out = numpy.array(values, dtype=object)
+        nulls = pd.isnull(out)
+    if nulls.any():
+        out[nulls] = None
+    return out.tolist()
+
+
+def df_to_columnar(df, iso_dates=False):
+    """Builds the columnar payload ``{'columns': [...], 'data': {...}}``"""
+    return {
+        'columns': list(df.columns),
+        'data': {
+            col: columnar_values(df[col], iso_dates=iso_dates)
+            for col in df.columns
+        },
+    }
+
+
+def json_dumps_columnar(payload, default=json_int_dttm_ser, sort_keys=False):
+    """Serializes a payload holding columnar data
+
+    Uses orjson when it is installed, falling back on simplejson. Both
+    paths ignore NaN and only call ``default`` for objects that columnar
+    conversion left untouched.
+    """
+    if orjson:
+        option = (
+            orjson.OPT_SERIALIZE_NUMPY |
+            orjson.OPT_NON_STR_KEYS |
+            orjson.OPT_PASSTHROUGH_DATETIME
+        )
+        if sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        return orjson.dumps(payload, default=default, option=option).decode('utf-8')
+    return simplejson.dumps(
+        payload, default=default, ignore_nan=True, sort_keys=sort_keys)
+
+
 def error_msg_from_exception(e):
     """Translate exception into error message
 
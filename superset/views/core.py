@@ -6,6 +6,7 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from datetime import datetime, timedelta
+from decimal import Decimal
 import logging
 import os
 import re
@@ -14,7 +15,8 @@ import traceback
 from urllib import parse
 
 from flask import (
-    flash, g, Markup, redirect, render_template, request, Response, url_for,
+    flash, g, Markup, redirect, render_template, request, Response,
+    stream_with_context, url_for,
 )
 from flask_appbuilder import expose, SimpleFormView
 from flask_appbuilder.actions import action
@@ -22,23 +24,25 @@ from flask_appbuilder.models.sqla.interface import SQLAInterface
 from flask_appbuilder.security.decorators import has_access, has_access_api
 from flask_babel import gettext as __
 from flask_babel import lazy_gettext as _
-import pandas as pd
 import simplejson as json
 from six import text_type
 import sqlalchemy as sqla
-from sqlalchemy import and_, create_engine, or_, update
+from sqlalchemy import and_, create_engine, or_
 from sqlalchemy.engine.url import make_url
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import selectinload
 from unidecode import unidecode
 from werkzeug.routing import BaseConverter
 from werkzeug.utils import secure_filename
 
 from superset import (
-    app, appbuilder, cache, db, results_backend, security_manager, sql_lab, utils,
-    viz,
+    app, appbuilder, bootstrap_cache, cache, csv_upload, db, filter_values,
+    profiling, query_control, results_backend, results_store, security_manager,
+    sql_lab, tracing, utils, viz,
 )
 from superset.connectors.connector_registry import ConnectorRegistry
 from superset.connectors.sqla.models import AnnotationDatasource, SqlaTable
+from superset.engine_registry import engine_registry
 from superset.exceptions import SupersetException, SupersetSecurityException
 from superset.forms import CsvToDatabaseForm
 from superset.jinja_context import get_template_processor
@@ -297,6 +301,13 @@ class DatabaseView(SupersetModelView, DeleteMixin, YamlExportMixin):  # noqa
     def pre_update(self, db):
         self.pre_add(db)
 
+    def post_update(self, db):
+        # The engines were created with the previous connection settings
+        engine_registry.dispose(db.id)
+
+    def post_delete(self, db):
+        engine_registry.dispose(db.id)
+
     def _delete(self, pk):
         DeleteMixin._delete(self, pk)
 
@@ -352,14 +363,37 @@ class CsvToDatabaseView(SimpleFormView):
         csv_file = form.csv_file.data
         form.csv_file.data.filename = secure_filename(form.csv_file.data.filename)
         csv_filename = form.csv_file.data.filename
+        database = form.data.get('con')
+        upload_async = (
+            config.get('CSV_UPLOAD_ASYNC') and results_backend and
+            database.db_engine_spec.allows_async_csv_upload)
+        upload_id = None
         path = os.path.join(config['UPLOAD_FOLDER'], csv_filename)
+        if upload_async:
+            # The file waits for a worker, under a name of its own
+            upload_id = csv_upload.new_upload_id()
+            path = os.path.join(
+                config['UPLOAD_FOLDER'], csv_upload.upload_filename(upload_id))
         try:
             utils.ensure_path_exists(config['UPLOAD_FOLDER'])
             csv_file.save(path)
             table = SqlaTable(table_name=form.name.data)
-            table.database = form.data.get('con')
+            table.database = database
             table.database_id = table.database.id
-            table.database.db_engine_spec.create_table_from_csv(form, table)
+            db_engine_spec = table.database.db_engine_spec
+            if upload_async:
+                csv_upload.start(
+                    upload_id, table.database,
+                    db_engine_spec.csv_upload_params(form), g.user.get_id())
+                # The worker removes the file once uploaded
+                message = _(
+                    'CSV file "{0}" is being uploaded to table "{1}", follow '
+                    'its progress at {2}'.format(
+                        csv_filename, form.name.data,
+                        '/superset/csv_upload_status/{}/'.format(upload_id)))
+                flash(message, 'info')
+                return redirect('/tablemodelview/list/')
+            db_engine_spec.create_table_from_csv(form, table)
         except Exception as e:
             try:
                 os.remove(path)
@@ -1020,6 +1054,7 @@ class Superset(BaseSupersetView):
             datasource_type=None,
             datasource_id=None,
             force=False,
+            columnar=False,
     ):
         if slice_id:
             slc = (
@@ -1036,6 +1071,7 @@ class Superset(BaseSupersetView):
                 datasource,
                 form_data=form_data,
                 force=force,
+                columnar=columnar,
             )
             return viz_obj
 
@@ -1077,13 +1113,14 @@ class Superset(BaseSupersetView):
             mimetype='application/json')
 
     def generate_json(self, datasource_type, datasource_id, form_data,
-                      csv=False, query=False, force=False):
+                      csv=False, query=False, force=False, columnar=False):
         try:
             viz_obj = self.get_viz(
                 datasource_type=datasource_type,
                 datasource_id=datasource_id,
                 form_data=form_data,
                 force=force,
+                columnar=columnar,
             )
         except Exception as e:
             logging.exception(e)
@@ -1176,6 +1213,7 @@ class Superset(BaseSupersetView):
             csv = request.args.get('csv') == 'true'
             query = request.args.get('query') == 'true'
             force = request.args.get('force') == 'true'
+            columnar = request.args.get('columnar') == 'true'
             form_data = self.get_form_data()[0]
             datasource_id, datasource_type = self.datasource_info(
                 datasource_id, datasource_type, form_data)
@@ -1189,7 +1227,8 @@ class Superset(BaseSupersetView):
                                   form_data=form_data,
                                   csv=csv,
                                   query=query,
-                                  force=force)
+                                  force=force,
+                                  columnar=columnar)
 
     @log_this
     @has_access
@@ -1352,8 +1391,10 @@ class Superset(BaseSupersetView):
         :param datasource_id: Datasource id
         :param column: Column name to retrieve values for
         :return:
+
+        The ``prefix`` request argument narrows the values down to the ones
+        starting with it, and ``force=true`` bypasses the cache.
         """
-        # TODO: Cache endpoint by user, datasource and column
         datasource = ConnectorRegistry.get_datasource(
             datasource_type, datasource_id, db.session)
         if not datasource:
@@ -1362,9 +1403,12 @@ class Superset(BaseSupersetView):
             return json_error_response(DATASOURCE_ACCESS_ERR)
 
         payload = json.dumps(
-            datasource.values_for_column(
+            filter_values.get_values(
+                datasource,
                 column,
                 config.get('FILTER_SELECT_ROW_LIMIT', 10000),
+                prefix=request.args.get('prefix'),
+                force=request.args.get('force') == 'true',
             ),
             default=utils.json_int_dttm_ser)
         return json_success(payload)
@@ -2103,21 +2147,19 @@ class Superset(BaseSupersetView):
     def dashboard(self, dashboard_id):
         """Server side rendering for a dashboard"""
         session = db.session()
-        qry = session.query(models.Dashboard)
+        qry = (
+            session.query(models.Dashboard)
+            .options(selectinload(models.Dashboard.slices))
+        )
         if dashboard_id.isdigit():
             qry = qry.filter_by(id=int(dashboard_id))
         else:
             qry = qry.filter_by(slug=dashboard_id)
 
         dash = qry.one()
-        datasources = set()
-        for slc in dash.slices:
-            datasource = slc.datasource
-            if datasource:
-                datasources.add(datasource)
 
         if config.get('ENABLE_ACCESS_REQUEST'):
-            for datasource in datasources:
+            for datasource in dash.prefetch_datasources(session):
                 if datasource and not security_manager.datasource_access(datasource):
                     flash(
                         __(get_datasource_access_error_msg(datasource.name)),
@@ -2145,7 +2187,8 @@ class Superset(BaseSupersetView):
         # if layout == v2 (not backwards compatible)
         #   view = v2
         #   edit = v2
-        dashboard_layout = dash.data.get('position_json', {})
+        payload = bootstrap_cache.get_dashboard_payload(session, dash)
+        dashboard_layout = payload['dashboard_data'].get('position_json', {})
         is_v2_dash = (
             isinstance(dashboard_layout, dict) and
             dashboard_layout.get('DASHBOARD_VERSION_KEY') == 'v2'
@@ -2188,7 +2231,7 @@ class Superset(BaseSupersetView):
             force_v2_edit=force_v2_edit,
             edit_mode=edit_mode)
 
-        dashboard_data = dash.data
+        dashboard_data = dict(payload['dashboard_data'])
         dashboard_data.update({
             'standalone_mode': standalone_mode,
             'dash_save_perm': dash_save_perm,
@@ -2200,7 +2243,7 @@ class Superset(BaseSupersetView):
         bootstrap_data = {
             'user_id': g.user.get_id(),
             'dashboard_data': dashboard_data,
-            'datasources': {ds.uid: ds.data for ds in datasources},
+            'datasources': payload['datasources'],
             'common': self.common_bootsrap_payload(),
             'editMode': edit_mode,
             # TODO remove the following upon v1 deprecation 🎉
@@ -2476,11 +2519,43 @@ class Superset(BaseSupersetView):
             return json_error_response(get_datasource_access_error_msg(
                 '{}'.format(rejected_tables)))
 
-        payload = utils.zlib_decompress_to_string(blob)
-        display_limit = app.config.get('DISPLAY_SQL_MAX_ROW', None)
-        if display_limit:
-            payload_json = json.loads(payload)
-            payload_json['data'] = payload_json['data'][:display_limit]
+        # Only the chunks overlapping the requested page get decoded
+        header = results_store.load_header(blob)
+        limit = app.config.get('DISPLAY_SQL_MAX_ROW', None)
+        try:
+            offset = int(request.args.get('offset') or 0)
+            if request.args.get('limit'):
+                limit = int(request.args.get('limit'))
+                if app.config.get('DISPLAY_SQL_MAX_ROW'):
+                    limit = min(limit, app.config.get('DISPLAY_SQL_MAX_ROW'))
+            if offset < 0 or (limit is not None and limit < 0):
+                raise ValueError()
+        except ValueError:
+            return json_error_response('Invalid offset or limit', status=400)
+        columnar = (
+            header.get('columnar') or
+            isinstance(header.get('data'), dict))
+        try:
+            data = results_store.read_rows(
+                key, header, offset=offset, limit=limit, columnar=columnar)
+        except KeyError as e:
+            logging.exception(e)
+            return json_error_response(
+                'Data could not be retrieved. '
+                'You may want to re-run the query.',
+                status=410,
+            )
+        payload_json = {
+            k: v for k, v in header.items()
+            if k not in ('data', 'format', 'data_columns', 'chunk_size', 'chunks')
+        }
+        payload_json.update({
+            'data': data,
+            'offset': offset,
+        })
+        if columnar:
+            return json_success(utils.json_dumps_columnar(
+                payload_json, default=utils.json_iso_dttm_ser))
         return json_success(
             json.dumps(
                 payload_json, default=utils.json_iso_dttm_ser, ignore_nan=True))
@@ -2497,6 +2572,7 @@ class Superset(BaseSupersetView):
             )
             query.status = utils.QueryStatus.STOPPED
             db.session.commit()
+            query_control.request_stop(query)
         except Exception:
             pass
         return self.json_response('OK')
@@ -2504,9 +2580,12 @@ class Superset(BaseSupersetView):
     @has_access_api
     @expose('/sql_json/', methods=['POST', 'GET'])
     @log_this
+    @tracing.traced
     def sql_json(self):
         """Runs arbitrary sql and returns and json"""
         async_ = request.form.get('runAsync') == 'true'
+        columnar = request.form.get('columnar') == 'true'
+        profile = request.form.get('profile') == 'true'
         sql = request.form.get('sql')
         database_id = request.form.get('database_id')
         schema = request.form.get('schema') or None
@@ -2520,7 +2599,9 @@ class Superset(BaseSupersetView):
             json_error_response(
                 'Database with id {} is missing.'.format(database_id))
 
-        rejected_tables = security_manager.rejected_datasources(sql, mydb, schema)
+        with tracing.span('permission_check'):
+            rejected_tables = security_manager.rejected_datasources(
+                sql, mydb, schema)
         if rejected_tables:
             return json_error_response(get_datasource_access_error_msg(
                 '{}'.format(rejected_tables)))
@@ -2557,11 +2638,12 @@ class Superset(BaseSupersetView):
         logging.info('Triggering query_id: {}'.format(query_id))
 
         try:
-            template_processor = get_template_processor(
-                database=query.database, query=query)
-            rendered_query = template_processor.process_template(
-                query.sql,
-                **template_params)
+            with tracing.span('render_template'):
+                template_processor = get_template_processor(
+                    database=query.database, query=query)
+                rendered_query = template_processor.process_template(
+                    query.sql,
+                    **template_params)
         except Exception as e:
             return json_error_response(
                 'Template rendering failed: {}'.format(utils.error_msg_from_exception(e)))
@@ -2569,6 +2651,11 @@ class Superset(BaseSupersetView):
         # Async request.
         if async_:
             logging.info('Running query on a Celery worker')
+            # the worker adds its own timings to the ones of this request
+            spans = tracing.pop_spans()
+            if spans:
+                query.add_timings(spans)
+                session.commit()
             # Ignore the celery future object and the request may time out.
             try:
                 sql_lab.get_sql_results.delay(
@@ -2576,7 +2663,9 @@ class Superset(BaseSupersetView):
                     rendered_query,
                     return_results=False,
                     store_results=not query.select_as_cta,
-                    user_name=g.user.username)
+                    user_name=g.user.username,
+                    columnar=columnar,
+                    profile=profile)
             except Exception as e:
                 logging.exception(e)
                 msg = (
@@ -2607,13 +2696,19 @@ class Superset(BaseSupersetView):
                 data = sql_lab.get_sql_results(
                     query_id,
                     rendered_query,
-                    return_results=True)
-            payload = json.dumps(
-                data,
-                default=utils.pessimistic_json_iso_dttm_ser,
-                ignore_nan=True,
-                encoding=None,
-            )
+                    return_results=True,
+                    columnar=columnar,
+                    profile=profile)
+            if columnar:
+                payload = utils.json_dumps_columnar(
+                    data, default=utils.pessimistic_json_iso_dttm_ser)
+            else:
+                payload = json.dumps(
+                    data,
+                    default=utils.pessimistic_json_iso_dttm_ser,
+                    ignore_nan=True,
+                    encoding=None,
+                )
         except Exception as e:
             logging.exception(e)
             return json_error_response('{}'.format(e))
@@ -2644,14 +2739,17 @@ class Superset(BaseSupersetView):
                 'Fetching CSV from results backend '
                 '[{}]'.format(query.results_key))
             blob = results_backend.get(query.results_key)
-        if blob:
-            logging.info('Decompressing')
-            json_payload = utils.zlib_decompress_to_string(blob)
-            obj = json.loads(json_payload)
-            columns = [c['name'] for c in obj['columns']]
-            df = pd.DataFrame.from_records(obj['data'], columns=columns)
-            logging.info('Using pandas to convert to CSV')
-            csv = df.to_csv(index=False, **config.get('CSV_EXPORT'))
+        header = results_store.load_header(blob) if blob else None
+        if header is not None and not results_store.chunks_available(
+                query.results_key, header):
+            # Checked before the response starts, a chunk missing while
+            # streaming would truncate the file
+            logging.info('Some chunks of the results were evicted')
+            header = None
+        if header is not None:
+            logging.info('Streaming CSV from the stored chunks')
+            csv = stream_with_context(results_store.iter_csv(
+                query.results_key, header, **config.get('CSV_EXPORT')))
         else:
             logging.info('Running a query to turn into CSV')
             sql = query.select_sql or query.executed_sql
@@ -2681,31 +2779,48 @@ class Superset(BaseSupersetView):
         # Check permission for datasource
         if not security_manager.datasource_access(datasource):
             return json_error_response(DATASOURCE_ACCESS_ERR)
-        return json_success(json.dumps(datasource.data))
+        return json_success(
+            bootstrap_cache.get_datasource_json(db.session, datasource))
 
-    @expose('/queries/<last_updated_ms>')
-    def queries(self, last_updated_ms):
-        """Get the updated queries."""
-        stats_logger.incr('queries')
-        if not g.user.get_id():
+    @has_access_api
+    @expose('/stats/')
+    def stats(self):
+        """Counters, gauges and timing percentiles kept in process"""
+        if not hasattr(stats_logger, 'data'):
             return json_error_response(
-                'Please login to access the queries.', status=403)
+                'The stats logger in use does not keep stats in process',
+                status=404)
+        return json_success(json.dumps(stats_logger.data()))
 
-        # Unix time, milliseconds.
-        last_updated_ms_int = int(float(last_updated_ms)) if last_updated_ms else 0
+    @has_access
+    @expose('/query_profile/<int:query_id>/')
+    def query_profile(self, query_id):
+        """The stacks sampled while running a SQL Lab query, collapsed"""
+        collapsed = profiling.load(query_id)
+        if collapsed is None:
+            return json_error_response(
+                'No profile was stored for query {}'.format(query_id),
+                status=404)
+        return Response(collapsed, mimetype='text/plain')
 
-        # UTC date time, same that is stored in the DB.
-        last_updated_dt = utils.EPOCH + timedelta(seconds=last_updated_ms_int / 1000)
+    def changed_queries(self, user_id, since):
+        """The dicts of the queries of the user changed since ``since``,
+        keyed by client id, and their latest ``changed_on``
 
+        Queries running for longer than ``SQLLAB_ASYNC_TIME_LIMIT_SEC`` are
+        timed out along the way.
+        """
         sql_queries = (
             db.session.query(Query)
+            .options(*Query.dict_options())
             .filter(
-                Query.user_id == g.user.get_id(),
-                Query.changed_on >= last_updated_dt,
+                Query.user_id == user_id,
+                Query.changed_on >= since,
             )
             .all()
         )
         dict_queries = {q.client_id: q.to_dict() for q in sql_queries}
+        latest = max([q.changed_on for q in sql_queries] or [since])
 
         now = int(round(time.time() * 1000))
 
@@ -2725,25 +2840,105 @@ class Superset(BaseSupersetView):
         ]
 
         if queries_to_timeout:
-            update(Query).where(
-                and_(
-                    Query.user_id == g.user.get_id(),
-                    Query.client_id in queries_to_timeout,
-                ),
-            ).values(state=utils.QueryStatus.TIMED_OUT)
+            (
+                db.session.query(Query)
+                .filter(
+                    Query.user_id == user_id,
+                    Query.client_id.in_(queries_to_timeout),
+                )
+                .update(
+                    {Query.status: utils.QueryStatus.TIMED_OUT},
+                    synchronize_session=False)
+            )
+            query_control.record_change(db.session, user_id)
+            db.session.commit()
 
             for client_id in queries_to_timeout:
-                dict_queries[client_id]['status'] = utils.QueryStatus.TIMED_OUT
+                dict_queries[client_id]['state'] = utils.QueryStatus.TIMED_OUT
+
+        return dict_queries, latest
+
+    @api
+    @has_access_api
+    @expose('/csv_upload_status/<upload_id>/')
+    def csv_upload_status(self, upload_id):
+        """The state and progress of a csv upload run by the workers"""
+        status = csv_upload.get_status(upload_id)
+        if status is None:
+            return json_error_response(
+                'Unknown csv upload {}'.format(upload_id), status=404)
+        return json_success(json.dumps(status))
+
+    @expose('/queries/<last_updated_ms>')
+    def queries(self, last_updated_ms):
+        """Get the updated queries."""
+        stats_logger.incr('queries')
+        if not g.user.get_id():
+            return json_error_response(
+                'Please login to access the queries.', status=403)
+
+        # Unix time, milliseconds.
+        last_updated_ms_int = int(float(last_updated_ms)) if last_updated_ms else 0
 
+        # UTC date time, same that is stored in the DB.
+        last_updated_dt = utils.EPOCH + timedelta(seconds=last_updated_ms_int / 1000)
+
+        dict_queries, _ = self.changed_queries(g.user.get_id(), last_updated_dt)
         return json_success(
             json.dumps(dict_queries, default=utils.json_int_dttm_ser))
 
+    @expose('/poll_queries/')
+    def poll_queries(self):
+        """The queries changed since the ``cursor`` argument, along with the
+        cursor to pass on the next poll
+
+        The cursor is the latest ``changed_on`` returned, in microseconds
+        since the epoch. The queries changed at that very time are returned
+        again, as the metadata database may store a coarser time. Given a
+        ``timeout``, the poll waits up to that many seconds, capped by
+        ``SQLLAB_POLL_MAX_TIMEOUT``, for a change when there is none yet.
+        """
+        stats_logger.incr('poll_queries')
+        user_id = g.user.get_id()
+        if not user_id:
+            return json_error_response(
+                'Please login to access the queries.', status=403)
+        try:
+            cursor = int(request.args.get('cursor') or 0)
+            timeout = float(request.args.get('timeout') or 0)
+        except ValueError:
+            return json_error_response(
+                'Invalid cursor or timeout', status=400)
+        timeout = min(timeout, config.get('SQLLAB_POLL_MAX_TIMEOUT'))
+        since = utils.EPOCH + timedelta(microseconds=cursor)
+
+        with query_control.listen_changes(user_id, timeout > 0) as listener:
+            dict_queries, latest = self.changed_queries(user_id, since)
+            if latest <= since and listener is not None:
+                # Nothing new yet, wait for the commit of a change. Ending
+                # the transaction lets the next read see that change.
+                db.session.commit()
+                if listener.wait(timeout):
+                    dict_queries, latest = self.changed_queries(user_id, since)
+
+        delta = latest - utils.EPOCH
+        cursor = (delta.days * 86400 + delta.seconds) * 10 ** 6 + delta.microseconds
+        return json_success(json.dumps(
+            {'cursor': cursor, 'queries': dict_queries},
+            default=utils.json_int_dttm_ser))
+
     @has_access
     @expose('/search_queries')
     @log_this
     def search_queries(self):
-        """Search for queries."""
-        query = db.session.query(Query)
+        """Search for queries.
+
+        Queries are returned by start time, a page of at most
+        ``QUERY_SEARCH_LIMIT`` of them, or ``limit`` if lower. When there may
+        be more, the ``X-Next-Cursor`` header holds the ``after`` argument
+        fetching the next page.
+        """
+        query = db.session.query(Query).options(*Query.dict_options())
         search_user_id = request.args.get('user_id')
         database_id = request.args.get('database_id')
         search_text = request.args.get('search_text')
@@ -2751,6 +2946,7 @@ class Superset(BaseSupersetView):
         # From and To time stamp should be Epoch timestamp in seconds
         from_time = request.args.get('from')
         to_time = request.args.get('to')
+        after = request.args.get('after')
 
         if search_user_id:
             # Filter on db Id
@@ -2766,8 +2962,8 @@ class Superset(BaseSupersetView):
 
         if search_text:
             # Filter on search text
-            query = query \
-                .filter(Query.sql.like('%{}%'.format(search_text)))
+            query = query.filter(Query.sql_search_filter(
+                search_text, db.engine.dialect.name))
 
         if from_time:
             query = query.filter(Query.start_time > int(from_time))
@@ -2776,18 +2972,39 @@ class Superset(BaseSupersetView):
             query = query.filter(Query.start_time < int(to_time))
 
         query_limit = config.get('QUERY_SEARCH_LIMIT', 1000)
+        try:
+            query_limit = max(min(
+                int(request.args.get('limit') or query_limit), query_limit), 1)
+            if after:
+                # Keyset pagination, past the last query of the previous page
+                after_time, after_id = after.split(':')
+                after_time, after_id = Decimal(after_time), int(after_id)
+                query = query.filter(or_(
+                    Query.start_time > after_time,
+                    and_(Query.start_time == after_time, Query.id > after_id),
+                ))
+        except (ArithmeticError, ValueError):
+            return json_error_response(
+                'Invalid limit or cursor', status=400)
+
         sql_queries = (
-            query.order_by(Query.start_time.asc())
+            query.order_by(Query.start_time.asc(), Query.id.asc())
             .limit(query_limit)
             .all()
         )
 
         dict_queries = [q.to_dict() for q in sql_queries]
 
-        return Response(
+        resp = Response(
             json.dumps(dict_queries, default=utils.json_int_dttm_ser),
             status=200,
             mimetype='application/json')
+        if sql_queries and len(sql_queries) == query_limit:
+            last = sql_queries[-1]
+            if last.start_time is not None:
+                resp.headers['X-Next-Cursor'] = '{}:{}'.format(
+                    last.start_time, last.id)
+        return resp
 
     @app.errorhandler(500)
     def show_traceback(self):
@@ -15,7 +15,6 @@ import copy
 from datetime import datetime, timedelta
 import hashlib
 import inspect
-from itertools import product
 import logging
 import math
 import re
@@ -37,7 +36,7 @@ import simplejson as json
 from six import string_types, text_type
 from six.moves import cPickle as pkl, reduce
 
-from superset import app, cache, get_manifest_file, utils
+from superset import app, cache, filter_values, get_manifest_file, tracing, utils
 from superset.exceptions import NullValueException
 from superset.utils import DTTM_ALIAS, JS_MAX_INTEGER, merge_extra_filters
 
@@ -62,8 +61,9 @@ class BaseViz(object):
     default_fillna = 0
     cache_type = 'df'
     enforce_numerical_metrics = True
+    supports_columnar = False
 
-    def __init__(self, datasource, form_data, force=False):
+    def __init__(self, datasource, form_data, force=False, columnar=False):
         if not datasource:
             raise Exception(_('Viz is missing a datasource'))
         self.datasource = datasource
@@ -81,6 +81,8 @@ class BaseViz(object):
         self.status = None
         self.error_message = None
         self.force = force
+        # Columnar payloads are only produced by viz types that support them
+        self.columnar = columnar and self.supports_columnar
 
         # Keeping track of whether some data came from cache
         # this is useful to trigerr the <CachedLabel /> when
@@ -361,6 +363,7 @@ class BaseViz(object):
             del payload['df']
         return payload
 
+    @tracing.traced
     def get_df_payload(self, query_obj=None):
         """Handles caching around the df payload retrieval"""
         if not query_obj:
@@ -372,7 +375,9 @@ class BaseViz(object):
         df = None
         cached_dttm = datetime.utcnow().isoformat().split('.')[0]
         if cache_key and cache and not self.force:
-            cache_value = cache.get(cache_key)
+            with stats_logger.timer('viz.cache_get'), \
+                    tracing.span('viz.cache_get'):
+                cache_value = cache.get(cache_key)
             if cache_value:
                 stats_logger.incr('loaded_from_cache')
                 try:
@@ -391,7 +396,9 @@ class BaseViz(object):
 
         if query_obj and not is_loaded:
             try:
-                df = self.get_df(query_obj)
+                with stats_logger.timer('viz.get_df'), \
+                        tracing.span('viz.get_df'):
+                    df = self.get_df(query_obj)
                 if self.status != utils.QueryStatus.FAILED:
                     stats_logger.incr('loaded_from_source')
                     is_loaded = True
@@ -420,10 +427,12 @@ class BaseViz(object):
                         len(cache_value), cache_key))
 
                     stats_logger.incr('set_cache_key')
-                    cache.set(
-                        cache_key,
-                        cache_value,
-                        timeout=self.cache_timeout)
+                    with stats_logger.timer('viz.cache_set'), \
+                            tracing.span('viz.cache_set'):
+                        cache.set(
+                            cache_key,
+                            cache_value,
+                            timeout=self.cache_timeout)
                 except Exception as e:
                     # cache.set call can fail if the backend is down or if
                     # the key is too large or whatever other reasons
@@ -443,9 +452,13 @@ class BaseViz(object):
             'status': self.status,
             'stacktrace': stacktrace,
             'rowcount': len(df.index) if df is not None else 0,
+            'timings': tracing.pop_spans(),
         }
 
     def json_dumps(self, obj, sort_keys=False):
+        if self.columnar:
+            return utils.json_dumps_columnar(
+                obj, default=utils.json_int_dttm_ser, sort_keys=sort_keys)
         return json.dumps(
             obj,
             default=utils.json_int_dttm_ser,
@@ -486,6 +499,7 @@ class TableViz(BaseViz):
     credits = 'a <a href="https://github.com/airbnb/superset">Superset</a> original'
     is_timeseries = False
     enforce_numerical_metrics = False
+    supports_columnar = True
 
     def should_be_timeseries(self):
         fd = self.form_data
@@ -567,6 +581,10 @@ class TableViz(BaseViz):
             ):
                 del df[m]
 
+        if self.columnar:
+            return utils.df_to_columnar(
+                df, iso_dates=bool(fd.get('all_columns')))
+
         data = self.handle_js_int_overflow(
             dict(
                 records=df.to_dict(orient='records'),
@@ -576,6 +594,12 @@ class TableViz(BaseViz):
         return data
 
     def json_dumps(self, obj, sort_keys=False):
+        if self.columnar:
+            default = utils.json_int_dttm_ser
+            if self.form_data.get('all_columns'):
+                default = utils.json_iso_dttm_ser
+            return utils.json_dumps_columnar(
+                obj, default=default, sort_keys=sort_keys)
         if self.form_data.get('all_columns'):
             return json.dumps(
                 obj,
@@ -916,6 +940,10 @@ class BoxPlotViz(NVD3Viz):
         return chart_data
 
 
+# Stands for the null group of a bubble chart while grouping
+NULL_GROUP = object()
+
+
 class BubbleViz(NVD3Viz):
 
     """Based on the NVD3 bubble chart"""
@@ -949,21 +977,24 @@ class BubbleViz(NVD3Viz):
         return d
 
     def get_data(self, df):
-        df['x'] = df[[utils.get_metric_name(self.x_metric)]]
-        df['y'] = df[[utils.get_metric_name(self.y_metric)]]
-        df['size'] = df[[utils.get_metric_name(self.z_metric)]]
+        df['x'] = df[utils.get_metric_name(self.x_metric)]
+        df['y'] = df[utils.get_metric_name(self.y_metric)]
+        df['size'] = df[utils.get_metric_name(self.z_metric)]
         df['shape'] = 'circle'
-        df['group'] = df[[self.series]]
-
-        series = defaultdict(list)
-        for row in df.to_dict(orient='records'):
-            series[row['group']].append(row)
-        chart_data = []
-        for k, v in series.items():
-            chart_data.append({
-                'key': k,
-                'values': v})
-        return chart_data
+        df['group'] = df[self.series]
+
+        # Grouping column-wise keeps the series in order of first appearance
+        # without materializing and bucketing one dict per row in Python.
+        # groupby drops the rows of a null group, these keep a null key.
+        groups = df['group'].astype(object).where(
+            df['group'].notnull(), NULL_GROUP)
+        return [
+            {
+                'key': None if k is NULL_GROUP else k,
+                'values': v.to_dict(orient='records'),
+            }
+            for k, v in df.groupby(groups, sort=False)
+        ]
 
 
 class BulletViz(NVD3Viz):
@@ -1115,16 +1146,9 @@ class NVD3TimeSeriesViz(NVD3Viz):
                 elif isinstance(series_title, (list, tuple)):
                     series_title = series_title + (title_suffix,)
 
-            values = []
-            for ds in df.index:
-                if ds in ys:
-                    d = {
-                        'x': ds,
-                        'y': ys[ds],
-                    }
-                else:
-                    d = {}
-                values.append(d)
+            # ys shares df's index, zipping avoids a label lookup per row
+            values = [
+                {'x': ds, 'y': y} for ds, y in zip(df.index, ys.values)]
 
             d = {
                 'key': series_title,
@@ -1327,9 +1351,7 @@ class NVD3DualLineViz(NVD3Viz):
                 'key': series_title,
                 'classed': classed,
                 'values': [
-                    {'x': ds, 'y': ys[ds] if ds in ys else None}
-                    for ds in df.index
-                ],
+                    {'x': ds, 'y': y} for ds, y in zip(df.index, ys.values)],
                 'yAxis': i + 1,
                 'type': 'line',
             }
@@ -1603,9 +1625,11 @@ class SankeyViz(BaseViz):
         df['target'] = df['target'].astype(basestring)
         recs = df.to_dict(orient='records')
 
+        # Only distinct edges matter for cycle detection
+        edges = df[['source', 'target']].drop_duplicates()
         hierarchy = defaultdict(set)
-        for row in recs:
-            hierarchy[row['source']].add(row['target'])
+        for source, target in zip(edges['source'].values, edges['target'].values):
+            hierarchy[source].add(target)
 
         def find_cycle(g):
             """Whether there's a cycle in a directed graph"""
@@ -1673,15 +1697,16 @@ class ChordViz(BaseViz):
 
         # Preparing a symetrical matrix like d3.chords calls for
         nodes = list(set(df['source']) | set(df['target']))
-        matrix = {}
-        for source, target in product(nodes, nodes):
-            matrix[(source, target)] = 0
-        for source, target, value in df.to_records(index=False):
-            matrix[(source, target)] = value
-        m = [[matrix[(n1, n2)] for n1 in nodes] for n2 in nodes]
+        index = pd.Index(nodes)
+        matrix = np.zeros((len(nodes), len(nodes)), dtype=df['value'].dtype)
+        # Rows are targets and columns are sources
+        matrix[
+            index.get_indexer(df['target']),
+            index.get_indexer(df['source']),
+        ] = df['value'].values
         return {
-            'nodes': list(nodes),
-            'matrix': m,
+            'nodes': nodes,
+            'matrix': matrix.tolist(),
         }
 
 
@@ -1782,9 +1807,50 @@ class FilterBoxViz(BaseViz):
         self.dataframes = {}
         for flt in filters:
             qry['groupby'] = [flt]
-            df = self.get_df_payload(query_obj=qry).get('df')
+            df = self.get_indexed_df(qry, flt)
+            if df is None:
+                df = self.get_df_payload(query_obj=qry).get('df')
             self.dataframes[flt] = df
 
+    def counts_all_rows(self, qry):
+        """Whether the filter query is a plain row count, over all rows"""
+        metric = self.form_data.get('metric')
+        if (
+                self.datasource.type != 'table' or
+                not isinstance(metric, string_types) or
+                self.datasource.fetch_values_predicate):
+            return False
+        metrics = {m.metric_name: m for m in self.datasource.metrics}
+        if metric not in metrics:
+            return False
+        expression = re.sub(r'\s', '', metrics[metric].expression or '')
+        if expression.upper() != 'COUNT(*)':
+            return False
+        extras = qry['extras']
+        return not (
+            qry['filter'] or
+            qry['from_dttm'] or
+            extras.get('where') or
+            extras.get('having') or
+            self.form_data.get('until', 'now') not in ('', 'now'))
+
+    def get_indexed_df(self, qry, flt):
+        """Reads the row counts of a filter from the materialized index of
+        the filter values, when fresh and the query allows it"""
+        if self.force or not self.counts_all_rows(qry):
+            return None
+        index = filter_values.get_fresh_index(self.datasource, flt)
+        if index is None:
+            return None
+        metric = self.form_data['metric']
+        df = pd.DataFrame(
+            {flt: index['values'], metric: index['counts']},
+            columns=[flt, metric])
+        return (
+            df.sort_values(metric, ascending=False)
+            .head(qry['row_limit'])
+        )
+
     def filter_query_obj(self):
         qry = super(FilterBoxViz, self).query_obj()
         groupby = self.form_data.get('groupby')
@@ -1800,11 +1866,12 @@ class FilterBoxViz(BaseViz):
         for flt in filters:
             df = self.dataframes[flt]
             d[flt] = [{
-                'id': row[0],
-                'text': row[0],
+                'id': value,
+                'text': value,
                 'filter': flt,
-                'metric': row[1]}
-                for row in df.itertuples(index=False)
+                'metric': metric}
+                for value, metric in zip(
+                    df.iloc[:, 0].tolist(), df.iloc[:, 1].tolist())
             ]
         return d
 
@@ -2082,6 +2149,21 @@ class BaseDeckGLViz(BaseViz):
         elif spatial.get('type') == 'geohash':
             group_by += [spatial.get('geohashCol')]
 
+    @staticmethod
+    def map_distinct(series, func):
+        """Applies ``func`` once per distinct value of ``series``
+
+        Spatial columns are typically highly repetitive, parsing each
+        distinct value once and broadcasting the result back with
+        ``take`` avoids calling into Python for every row.
+        """
+        codes, uniques = pd.factorize(series)
+        # factorize marks nulls with -1, which picks up the trailing None
+        parsed = np.empty(len(uniques) + 1, dtype=object)
+        for i, value in enumerate(uniques):
+            parsed[i] = func(value)
+        return parsed.take(codes)
+
     def process_spatial_data_obj(self, key, df):
         spatial = self.form_data.get(key)
         if spatial is None:
@@ -2095,20 +2177,15 @@ class BaseDeckGLViz(BaseViz):
 
             def tupleify(s):
                 p = Point(s)
+                if spatial.get('reverseCheckbox'):
+                    return (p.longitude, p.latitude)
                 return (p.latitude, p.longitude)
 
-            df[key] = df[spatial.get('lonlatCol')].apply(tupleify)
-
-            if spatial.get('reverseCheckbox'):
-                df[key] = [
-                    tuple(reversed(o)) if isinstance(o, (list, tuple)) else (0, 0)
-                    for o in df[key]
-                ]
+            df[key] = self.map_distinct(df[spatial.get('lonlatCol')], tupleify)
             del df[spatial.get('lonlatCol')]
         elif spatial.get('type') == 'geohash':
-            latlong = df[spatial.get('geohashCol')].map(geohash.decode)
-            df[key] = list(zip(latlong.apply(lambda x: x[0]),
-                               latlong.apply(lambda x: x[1])))
+            df[key] = self.map_distinct(
+                df[spatial.get('geohashCol')], geohash.decode)
             del df[spatial.get('geohashCol')]
 
         if df.get(key) is None:
@@ -2426,9 +2503,7 @@ class PairedTTestViz(BaseViz):
             d = {
                 'group': nameSet[1:] if hasGroup else 'All',
                 'values': [
-                    {'x': t, 'y': Y[t] if t in Y else None}
-                    for t in df.index
-                ],
+                    {'x': t, 'y': y} for t, y in zip(df.index, Y.values)],
             }
             key = nameSet[0] if hasGroup else nameSet
             if key in data:
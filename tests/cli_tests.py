@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from superset import cli
+
+
+class CliTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # fails on conflicting options of any command
+        self.parser = cli.manager.create_parser('superset')
+
+    def test_runserver_options(self):
+        args = self.parser.parse_args(
+            ['runserver', '-d', '-n', '-a', 'localhost', '-p', '8089'])
+        self.assertTrue(args.debug)
+        self.assertFalse(args.use_reloader)
+        self.assertEqual('localhost', args.address)
+        self.assertEqual('8089', args.port)
+
+    def test_prune_tables_options(self):
+        args = self.parser.parse_args(['prune_tables', '-t', 'logs', '-D', '30'])
+        self.assertEqual('logs', args.table)
+        self.assertEqual(30, args.days)
+        self.assertNotIn('debug', vars(args))
+
+
+if __name__ == '__main__':
+    unittest.main()
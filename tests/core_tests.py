@@ -17,6 +17,7 @@ import re
 import string
 import unittest
 
+from mock import patch
 import pandas as pd
 import psycopg2
 from six import text_type
@@ -228,6 +229,20 @@ class CoreTests(SupersetTestCase):
         assert len(resp) > 0
         assert 'Carbon Dioxide' in resp
 
+    def test_filter_endpoint_prefix(self):
+        self.login(username='admin')
+        tbl_id = self.table_ids.get('energy_usage')
+        url = '/superset/filter/table/{}/target/'.format(tbl_id)
+        values = self.get_json_resp(url)
+        self.assertIn('Carbon Dioxide', values)
+
+        values = self.get_json_resp(url + '?prefix=carbon')
+        self.assertIn('Carbon Dioxide', values)
+        self.assertTrue(all(v.lower().startswith('carbon') for v in values))
+
+        values = self.get_json_resp(url + '?prefix=carbon&force=true')
+        self.assertIn('Carbon Dioxide', values)
+
     def test_slice_data(self):
         # slice data should have some required attributes
         self.login(username='admin')
@@ -366,6 +381,16 @@ class CoreTests(SupersetTestCase):
         database = self.get_main_database(db.session)
         self.assertEqual(sqlalchemy_uri_decrypted, database.sqlalchemy_uri_decrypted)
 
+    def test_databaseview_edit_disposes_engines(self):
+        self.login(username='admin')
+        database = self.get_main_database(db.session)
+        url = 'databaseview/edit/{}'.format(database.id)
+        data = {k: database.__getattribute__(k) for k in DatabaseView.add_columns}
+        data['sqlalchemy_uri'] = database.safe_sqlalchemy_uri()
+        with patch('superset.views.core.engine_registry') as engine_registry:
+            self.client.post(url, data=data)
+        engine_registry.dispose.assert_called_once_with(database.id)
+
     def test_warm_up_cache(self):
         slc = self.get_slice('Girls', db.session)
         data = self.get_json_resp(
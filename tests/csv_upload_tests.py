@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from mock import Mock, patch
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import csv_upload
+
+
+class CsvUploadTestCase(unittest.TestCase):
+
+    def test_start(self):
+        params = {'csv': {'filepath_or_buffer': 'data.csv'}, 'name': 'data'}
+        with patch.object(csv_upload, 'results_backend', SimpleCache()), \
+                patch.object(csv_upload, 'upload_csv') as upload_csv:
+            upload_ids = [csv_upload.new_upload_id() for _ in range(2)]
+            for upload_id in upload_ids:
+                csv_upload.start(upload_id, Mock(id=1), params, 1)
+            self.assertEqual(
+                'pending', csv_upload.get_status(upload_ids[0])['state'])
+
+        # the files of the same name are read from names of their own
+        filenames = [
+            call[0][2]['csv']['filepath_or_buffer']
+            for call in upload_csv.delay.call_args_list]
+        self.assertEqual(
+            [csv_upload.upload_filename(upload_id) for upload_id in upload_ids],
+            filenames)
+        self.assertNotEqual(filenames[0], filenames[1])
+        self.assertEqual('data.csv', params['csv']['filepath_or_buffer'])
+
+
+if __name__ == '__main__':
+    unittest.main()
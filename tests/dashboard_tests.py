@@ -9,9 +9,12 @@ import json
 import unittest
 
 from flask import escape
+from mock import patch, PropertyMock
+import sqlalchemy as sqla
+from sqlalchemy.orm import selectinload
 
-from superset import db, security_manager
-from superset.connectors.sqla.models import SqlaTable
+from superset import bootstrap_cache, db, security_manager
+from superset.connectors.sqla.models import SqlaTable, TableColumn
 from superset.models import core as models
 from .base_tests import SupersetTestCase
 
@@ -355,6 +358,128 @@ class DashboardTests(SupersetTestCase):
         resp = self.get_resp('/dashboardmodelview/list/')
         self.assertIn('/superset/dashboard/empty_dashboard/', resp)
 
+    def count_render_queries(self, dash_id):
+        """Number of queries loading a dashboard and all its data"""
+        db.session.expunge_all()
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, *args):
+            statements.append(statement)
+
+        sqla.event.listen(
+            db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            dash = (
+                db.session.query(models.Dashboard)
+                .options(selectinload(models.Dashboard.slices))
+                .filter_by(id=dash_id)
+                .one()
+            )
+            for datasource in dash.prefetch_datasources(db.session):
+                datasource.data
+            dash.data
+        finally:
+            sqla.event.remove(
+                db.engine, 'before_cursor_execute', before_cursor_execute)
+        return len(statements)
+
+    def test_dashboard_query_count_is_constant(self):
+        slices = (
+            db.session.query(models.Slice)
+            .filter_by(datasource_type='table')
+            .all()
+        )
+        self.assertGreater(len({slc.datasource_id for slc in slices}), 1)
+        slice_ids = [slc.id for slc in slices]
+        counts = []
+        for count in (1, len(slice_ids)):
+            dash = models.Dashboard(
+                dashboard_title='Eager {}'.format(count),
+                slices=db.session.query(models.Slice).filter(
+                    models.Slice.id.in_(slice_ids[:count])).all())
+            db.session.add(dash)
+            db.session.commit()
+            dash_id = dash.id
+            counts.append(self.count_render_queries(dash_id))
+            db.session.delete(db.session.query(models.Dashboard).get(dash_id))
+            db.session.commit()
+        self.assertEquals(counts[0], counts[1])
+
+    def test_bootstrap_cache(self):
+        dash = (
+            db.session.query(models.Dashboard)
+            .filter_by(slug='births')
+            .first()
+        )
+        key = bootstrap_cache.dashboard_key(dash.id)
+        bootstrap_cache.cache.delete(key)
+        payload = bootstrap_cache.get_dashboard_payload(db.session, dash)
+        self.assertEquals(
+            (bootstrap_cache.get_generation(),
+             bootstrap_cache.dashboard_version(db.session, dash.id)),
+            bootstrap_cache.cache.get(key)[0])
+        with patch.object(
+                models.Dashboard, 'data', new_callable=PropertyMock) as data:
+            self.assertEquals(
+                payload,
+                bootstrap_cache.get_dashboard_payload(db.session, dash))
+            data.assert_not_called()
+
+        # saving the dashboard drops its payload
+        dash.css = (dash.css or '') + ' '
+        db.session.commit()
+        self.assertIsNone(bootstrap_cache.cache.get(key))
+        dash.css = dash.css[:-1]
+        db.session.commit()
+
+    def test_bootstrap_cache_without_cache(self):
+        dash = (
+            db.session.query(models.Dashboard)
+            .filter_by(slug='births')
+            .first()
+        )
+        with patch.object(bootstrap_cache, 'cache', None), \
+                patch.object(bootstrap_cache, 'dashboard_version') as version:
+            payload = bootstrap_cache.get_dashboard_payload(db.session, dash)
+            version.assert_not_called()
+            # saving the dashboard doesn't need the cache either
+            dash.css = (dash.css or '') + ' '
+            db.session.commit()
+            dash.css = dash.css[:-1]
+            db.session.commit()
+        self.assertEquals(payload['dashboard_data'], dash.data)
+
+    def test_changing_a_column_bumps_the_generation(self):
+        table = SqlaTable(table_name='bootstrap_cache_test')
+        table.database = self.get_main_database(db.session)
+        table.columns = [
+            TableColumn(column_name='a'), TableColumn(column_name='b')]
+        db.session.add(table)
+        db.session.commit()
+
+        # within the same second, which changed_on can't tell apart
+        generation = bootstrap_cache.get_generation()
+        table.columns[0].verbose_name = 'A'
+        db.session.commit()
+        self.assertNotEqual(generation, bootstrap_cache.get_generation())
+
+        generation = bootstrap_cache.get_generation()
+        db.session.commit()
+        self.assertEqual(generation, bootstrap_cache.get_generation())
+
+        db.session.delete(table.columns[1])
+        db.session.commit()
+        self.assertNotEqual(generation, bootstrap_cache.get_generation())
+
+        db.session.delete(table)
+        db.session.commit()
+
+    def test_evicted_generation_is_replaced(self):
+        bootstrap_cache.cache.delete(bootstrap_cache.GENERATION_KEY)
+        generation = bootstrap_cache.get_generation()
+        self.assertTrue(generation)
+        self.assertEqual(generation, bootstrap_cache.get_generation())
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+"""Timing benchmarks for SupersetDataFrame, see viz_benchmark_tests"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import time
+import unittest
+
+import numpy as np
+
+from superset.dataframe import SupersetDataFrame
+from superset.db_engine_specs import BaseEngineSpec
+from superset.utils import JS_MAX_INTEGER
+from .utils import BENCHMARK_MAX_SECONDS, BENCHMARK_ROWS, RUN_BENCHMARKS
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'SUPERSET_RUN_BENCHMARKS is not set')
+class SupersetDataFrameBenchmark(unittest.TestCase):
+
+    def test_data(self):
+        rs = np.random.RandomState(0)
+        columns = 20
+        data = rs.randint(0, 1000, (BENCHMARK_ROWS, columns))
+        # One column that needs converting for Java Script
+        data[:, 0] += JS_MAX_INTEGER
+        cursor_descr = [('col_{}'.format(i), None) for i in range(columns)]
+        cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+
+        start = time.time()
+        cdf.data
+        duration = time.time() - start
+        logging.info('SupersetDataFrame.data on {}x{} took {:.3f}s'.format(
+            BENCHMARK_ROWS, columns, duration))
+        self.assertLess(duration, BENCHMARK_MAX_SECONDS)
@@ -4,8 +4,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import pandas as pd
+
 from superset.dataframe import dedup, SupersetDataFrame
 from superset.db_engine_specs import BaseEngineSpec
+from superset.utils import JS_MAX_INTEGER
 from .base_tests import SupersetTestCase
 
 
@@ -57,6 +60,14 @@ class SupersetDataFrameTestCase(SupersetTestCase):
             ],
         )
 
+    def test_repeated_column_names(self):
+        data = [(1, 2), (3, 4)]
+        cursor_descr = (('id', 'int'), ('id', 'int'))
+        cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+        self.assertEqual(list(cdf.df.columns), ['id', 'id__1'])
+        self.assertEqual(
+            cdf.data, [{'id': 1, 'id__1': 2}, {'id': 3, 'id__1': 4}])
+
     def test_get_columns_with_int(self):
         data = [
             ('a1', 1),
@@ -113,3 +124,60 @@ class SupersetDataFrameTestCase(SupersetTestCase):
                 },
             ],
         )
+
+    def test_data_converts_js_unsafe_ints(self):
+        data = [
+            (1, JS_MAX_INTEGER + 1, 1.5),
+            (2, 3, 2.5),
+        ]
+        cursor_descr = (
+            ('a', None),
+            ('b', None),
+            ('c', None),
+        )
+        cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+        self.assertEqual(cdf.js_unsafe_int_columns(cdf.df), ['b'])
+        self.assertEqual(
+            cdf.data,
+            [
+                {'a': 1, 'b': str(JS_MAX_INTEGER + 1), 'c': 1.5},
+                {'a': 2, 'b': '3', 'c': 2.5},
+            ],
+        )
+
+    def test_columns_is_memoized(self):
+        data = [('a1', '2018-01-01'), ('a2', '2018-01-02')]
+        cursor_descr = (('a', None), ('ds', None))
+        cdf = SupersetDataFrame(data, cursor_descr, BaseEngineSpec)
+        columns = cdf.columns
+        self.assertTrue(columns[1]['is_date'])
+        self.assertIs(cdf.columns, columns)
+
+    def test_datetime_conversion_rate_mixed_formats(self):
+        series = pd.Series(['2018-01-01', '01/02/2018', 'Jan 3 2018', 'foo'])
+        self.assertEquals(
+            75, SupersetDataFrame.datetime_conversion_rate(series))
+
+    def test_get_columns_reliable_cursor_types(self):
+        class ReliableEngineSpec(BaseEngineSpec):
+            reliable_cursor_types = True
+
+        data = [('a1', '2018-01-01'), ('a2', '2018-01-02')]
+        cursor_descr = (('a', 'varchar'), ('ds', 'timestamp'))
+        cdf = SupersetDataFrame(data, cursor_descr, ReliableEngineSpec)
+        self.assertEqual(
+            cdf.columns,
+            [
+                {
+                    'is_date': False,
+                    'type': 'VARCHAR',
+                    'name': 'a',
+                    'is_dim': True,
+                }, {
+                    'is_date': True,
+                    'type': 'TIMESTAMP',
+                    'name': 'ds',
+                    'is_dim': False,
+                },
+            ],
+        )
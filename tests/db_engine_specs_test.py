@@ -4,11 +4,21 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import os
+import shutil
+import tempfile
 import textwrap
 
+from mock import ANY, MagicMock, Mock, patch
+import numpy as np
+import pandas as pd
+import sqlalchemy as sqla
+from sqlalchemy.dialects import sqlite
+
+from superset import db_engine_specs
 from superset.db_engine_specs import (
     BaseEngineSpec, HiveEngineSpec, MssqlEngineSpec,
-    MySQLEngineSpec, PrestoEngineSpec,
+    MySQLEngineSpec, PrestoEngineSpec, SqliteEngineSpec,
 )
 from superset.models.core import Database
 from .base_tests import SupersetTestCase
@@ -201,3 +211,140 @@ class DbEngineSpecsTestCase(SupersetTestCase):
         self.assertEquals('TINY', MySQLEngineSpec.get_datatype(1))
         self.assertEquals('VARCHAR', MySQLEngineSpec.get_datatype(15))
         self.assertEquals('VARCHAR', BaseEngineSpec.get_datatype('VARCHAR'))
+
+    def test_fetch_batches(self):
+        cursor = Mock()
+        cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,), (4,)], [(5,)], []]
+        batches = list(BaseEngineSpec.fetch_batches(cursor, None, 2))
+        self.assertEquals([[(1,), (2,)], [(3,), (4,)], [(5,)]], batches)
+
+        cursor.fetchmany.reset_mock()
+        cursor.fetchmany.side_effect = [[(1,), (2,)], [(3,)]]
+        batches = list(BaseEngineSpec.fetch_batches(cursor, 3, 2))
+        self.assertEquals([[(1,), (2,)], [(3,)]], batches)
+        self.assertEquals(
+            [2, 1], [c[0][0] for c in cursor.fetchmany.call_args_list])
+
+    def test_insert_df(self):
+        table = sqla.Table(
+            'csv', sqla.MetaData(), sqla.Column('a'), sqla.Column('b'))
+        df = pd.DataFrame({'a': [1, 2, 3, 4, 5], 'b': [1.5, np.nan, 3, 4, 5]})
+        conn = Mock()
+        with patch.object(BaseEngineSpec, 'max_insert_params', 4):
+            BaseEngineSpec.insert_df(df, table, conn)
+        # two rows of two columns per statement
+        self.assertEquals(3, conn.execute.call_count)
+        insert = conn.execute.call_args_list[0][0][0]
+        params = insert.compile(dialect=sqlite.dialect()).params
+        self.assertEquals(4, len(params))
+        self.assertIn(None, params.values())
+
+    def test_insert_records(self):
+        columns = ['c{}'.format(i) for i in range(8)]
+        table = sqla.Table(
+            'logs', sqla.MetaData(),
+            *[sqla.Column(c, sqla.Integer) for c in columns])
+        records = [{c: i for c in columns} for i in range(500)]
+        engine = sqla.create_engine('sqlite://')
+        table.create(engine)
+        statements = []
+        sqla.event.listen(
+            engine, 'before_cursor_execute',
+            lambda conn, cursor, statement, parameters, context, many:
+                statements.append(len(parameters)))
+        with engine.begin() as conn:
+            BaseEngineSpec.insert_records(records, table, conn)
+            BaseEngineSpec.insert_records([], table, conn)
+        # 124 rows of 8 columns stay under the 999 parameters of sqlite
+        self.assertEquals([992, 992, 992, 992, 32], statements)
+        self.assertEquals(
+            500, engine.execute(sqla.select([sqla.func.count()]).select_from(
+                table)).scalar())
+
+    def test_insert_df_without_multivalues_insert(self):
+        table = sqla.Table('csv', sqla.MetaData(), sqla.Column('a'))
+        df = pd.DataFrame({'a': [1, 2, 3]})
+        conn = Mock()
+        conn.dialect.supports_multivalues_insert = False
+        BaseEngineSpec.insert_df(df, table, conn)
+        conn.execute.assert_called_once_with(
+            ANY, [{'a': 1}, {'a': 2}, {'a': 3}])
+
+    def test_insert_chunks(self):
+        engine = MagicMock()
+        chunks = [pd.DataFrame({'a': [i]}) for i in range(5)]
+        with patch.object(BaseEngineSpec, 'insert_df') as insert_df:
+            BaseEngineSpec.insert_chunks(engine, Mock(), iter(chunks))
+        self.assertEquals(5, insert_df.call_count)
+        self.assertEquals(5, engine.begin.call_count)
+
+        error = ValueError('bad chunk')
+        with patch.object(BaseEngineSpec, 'insert_df', side_effect=error):
+            with self.assertRaises(ValueError):
+                BaseEngineSpec.insert_chunks(engine, Mock(), iter(chunks))
+
+    def test_conform_chunk(self):
+        first = pd.DataFrame({'a': [1, 2], 'b': ['x', 'y']})
+        # a missing value turned the integers into floats
+        chunk = pd.DataFrame({'a': [3, np.nan], 'b': ['z', None]})
+        chunk = BaseEngineSpec.conform_chunk(chunk, first.dtypes)
+        self.assertEquals([3, None], chunk['a'].tolist())
+        # as written for a COPY by PostgresEngineSpec.insert_df
+        self.assertEquals('3,z\n,\n', chunk.to_csv(index=False, header=False))
+
+        with self.assertRaises(ValueError):
+            BaseEngineSpec.conform_chunk(
+                pd.DataFrame({'a': [1.5, np.nan], 'b': ['x', 'y']}),
+                first.dtypes)
+
+    def upload_csv(self, folder, engine, lines, if_exists):
+        with open(os.path.join(folder, 'upload.csv'), 'w') as f:
+            f.write('\n'.join(lines))
+        params = {
+            'csv': {'filepath_or_buffer': 'upload.csv', 'chunksize': 2},
+            'name': 'csv_upload',
+            'schema': None,
+            'if_exists': if_exists,
+            'index': False,
+            'index_label': None,
+        }
+        with patch.dict(
+                db_engine_specs.config, {'UPLOAD_FOLDER': folder + os.sep}):
+            return SqliteEngineSpec.csv_to_table(engine, params)
+
+    def test_csv_to_table_swaps_the_table_once_uploaded(self):
+        folder = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, folder)
+        engine = sqla.create_engine(
+            'sqlite:///' + os.path.join(folder, 'upload.db'))
+        engine.execute('CREATE TABLE csv_upload (a INTEGER)')
+        engine.execute('INSERT INTO csv_upload VALUES (0)')
+
+        lines = ['a', '1', '2', '3', '4', '5']
+        with patch.object(
+                SqliteEngineSpec, 'insert_df', side_effect=ValueError()):
+            with self.assertRaises(ValueError):
+                self.upload_csv(folder, engine, lines, 'replace')
+        # the table is left as it was, without staging table
+        self.assertEquals(
+            [(0,)], engine.execute('SELECT a FROM csv_upload').fetchall())
+        self.assertEquals(['csv_upload'], engine.table_names())
+
+        self.assertEquals(5, self.upload_csv(folder, engine, lines, 'append'))
+        self.assertEquals(
+            6, engine.execute('SELECT COUNT(*) FROM csv_upload').scalar())
+        self.assertEquals(5, self.upload_csv(folder, engine, lines, 'replace'))
+        self.assertEquals(
+            5, engine.execute('SELECT COUNT(*) FROM csv_upload').scalar())
+        self.assertEquals(['csv_upload'], engine.table_names())
+        with self.assertRaises(ValueError):
+            self.upload_csv(folder, engine, lines, 'fail')
+
+        # a missing value in a later chunk
+        inserted = []
+        with patch.object(
+                SqliteEngineSpec, 'insert_df',
+                side_effect=lambda df, table, conn: inserted.append(df)):
+            self.upload_csv(
+                folder, engine, ['a,b', '1,x', '2,y', '3,z', ',w'], 'replace')
+        self.assertEquals([3, None], inserted[1]['a'].tolist())
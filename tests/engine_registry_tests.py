@@ -0,0 +1,68 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from mock import patch
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import NullPool
+
+from superset.engine_registry import engine_key, EngineRegistry, pool_params
+
+
+class EngineRegistryTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = EngineRegistry()
+        self.url = make_url('sqlite://')
+        self.addCleanup(self.registry.dispose)
+
+    def test_engines_are_shared_per_key(self):
+        key = engine_key(1, 'alice', None, self.url, {})
+        engine = self.registry.get(key, self.url, {}, 1)
+        self.assertIs(engine, self.registry.get(key, self.url, {}, 1))
+
+        other_key = engine_key(1, 'bob', None, self.url, {})
+        self.assertNotEqual(key, other_key)
+        self.assertIsNot(engine, self.registry.get(other_key, self.url, {}, 1))
+
+    def test_engines_are_not_shared_across_forks(self):
+        key = engine_key(1, None, None, self.url, {})
+        engine = self.registry.get(key, self.url, {}, 1)
+        # as seen from a forked child
+        self.registry._pid = -1
+        with patch.object(engine, 'dispose') as dispose:
+            self.assertIsNot(engine, self.registry.get(key, self.url, {}, 1))
+            dispose.assert_not_called()
+        # still referenced, not to be garbage collected
+        self.assertEqual(len(self.registry._inherited[0]), 1)
+
+    def test_dispose(self):
+        key = engine_key(1, None, None, self.url, {})
+        engine = self.registry.get(key, self.url, {}, 1)
+        self.registry.dispose(database_id=2)
+        self.assertIs(engine, self.registry.get(key, self.url, {}, 1))
+        self.registry.dispose(database_id=1)
+        self.assertIsNot(engine, self.registry.get(key, self.url, {}, 1))
+
+    def test_evicted_engines_are_disposed(self):
+        registry = EngineRegistry(maxsize=1)
+        self.addCleanup(registry.dispose)
+        key = engine_key(1, None, None, self.url, {})
+        engine = registry.get(key, self.url, {}, 1)
+        with patch.object(engine, 'dispose') as dispose:
+            registry.get(engine_key(2, None, None, self.url, {}), self.url, {}, 2)
+            dispose.assert_called_once_with()
+
+    def test_pool_params(self):
+        url = make_url('postgresql://user@localhost/db')
+        params = pool_params(url, {'pool_size': 2})
+        self.assertEqual(params['pool_size'], 2)
+        self.assertIn('max_overflow', params)
+        self.assertIn('pool_recycle', params)
+
+        params = pool_params(url, {'poolclass': NullPool})
+        self.assertNotIn('pool_size', params)
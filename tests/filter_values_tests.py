@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime
+import unittest
+
+from mock import Mock, patch
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import filter_values
+
+
+class FilterValuesIndexTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SimpleCache()
+        patcher = patch.object(filter_values, 'results_backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        config_patcher = patch.dict(filter_values.config, {
+            'FILTER_VALUES_INDEX_ENABLED': True,
+            'FILTER_VALUES_INDEX_MAX_VALUES': 3,
+        })
+        config_patcher.start()
+        self.addCleanup(config_patcher.stop)
+
+        self.datasource = Mock()
+        self.datasource.uid = '1__table'
+        self.datasource.values_cache_params.return_value = {}
+
+    def test_build_and_incremental_refresh(self):
+        counts = self.datasource.value_counts_for_column
+        counts.side_effect = [
+            ([('b', 3), ('a', 1)], datetime(2018, 1, 1, 12)),
+            # the rows of the latest day
+            ([('b', 1)], datetime(2018, 1, 1, 12)),
+        ]
+        index = filter_values.refresh_index(self.datasource, 'col')
+        self.assertEqual(index['values'], ['a', 'b'])
+        self.assertEqual(index['counts'], [1, 3])
+        counts.assert_any_call('col', since=None, limit=4)
+        counts.assert_called_with('col', since=datetime(2018, 1, 1), limit=4)
+        self.assertEqual(index['tail_since'], datetime(2018, 1, 1))
+
+        # the rows of the latest day are counted anew, a row having landed
+        # at the latest time already indexed
+        counts.side_effect = None
+        counts.reset_mock()
+        counts.return_value = ([('b', 2), ('c', 5)], datetime(2018, 1, 1, 12))
+        index = filter_values.refresh_index(self.datasource, 'col')
+        counts.assert_called_once_with(
+            'col', since=datetime(2018, 1, 1), limit=4)
+        self.assertEqual(index['values'], ['a', 'b', 'c'])
+        self.assertEqual(index['counts'], [1, 4, 5])
+        self.assertEqual(index['max_dttm'], datetime(2018, 1, 1, 12))
+
+        # on to the next day, whose rows become the ones counted anew
+        counts.reset_mock()
+        counts.side_effect = [
+            ([('b', 2), ('c', 6)], datetime(2018, 1, 2, 1)),
+            ([('c', 1)], datetime(2018, 1, 2, 1)),
+        ]
+        index = filter_values.refresh_index(self.datasource, 'col')
+        self.assertEqual(index['values'], ['a', 'b', 'c'])
+        self.assertEqual(index['counts'], [1, 4, 6])
+        self.assertEqual(index['tail_since'], datetime(2018, 1, 2))
+        self.assertEqual(index['tail_values'], ['c'])
+
+    def test_truncated_index_is_not_served(self):
+        self.datasource.value_counts_for_column.return_value = (
+            [('a', 1), ('b', 1), ('c', 1), ('d', 1)], None)
+        index = filter_values.refresh_index(self.datasource, 'col')
+        self.assertTrue(index['truncated'])
+        self.assertIsNone(
+            filter_values.get_fresh_index(self.datasource, 'col'))
+
+    def test_get_values_from_index(self):
+        self.datasource.value_counts_for_column.return_value = (
+            [('Apple', 1), ('apricot', 1), ('banana', 1)], None)
+        filter_values.refresh_index(self.datasource, 'col')
+        self.assertEqual(
+            filter_values.get_values(self.datasource, 'col', prefix='ap'),
+            ['Apple', 'apricot'])
+        self.datasource.values_for_column.assert_not_called()
+
+        # the index doesn't apply once the templated params differ
+        self.datasource.values_cache_params.return_value = {'sql': 'x'}
+        self.assertIsNone(
+            filter_values.get_fresh_index(self.datasource, 'col'))
@@ -6,9 +6,11 @@ from __future__ import unicode_literals
 
 import textwrap
 
+import pandas as pd
 from sqlalchemy.engine.url import make_url
 
 from superset import db
+from superset.connectors.sqla.models import SqlaTable, TableColumn
 from superset.models.core import Database
 from .base_tests import SupersetTestCase
 
@@ -186,3 +188,32 @@ class SqlaTableModelTestCase(SupersetTestCase):
         compiled = '{}'.format(sqla_literal.compile())
         if tbl.database.backend == 'mysql':
             self.assertEquals(compiled, 'ds')
+
+    def test_get_top_groups(self):
+        # only engines without inner joins filter on the prequery results
+        tbl = SqlaTable(
+            table_name='druid_table',
+            database=Database(sqlalchemy_uri='druid://localhost:8082/druid/v2/sql/'),
+            columns=[
+                TableColumn(column_name='gender'),
+                TableColumn(column_name='state'),
+            ],
+        )
+        self.assertFalse(tbl.database.db_engine_spec.inner_joins)
+        df = pd.DataFrame({
+            'gender': ['boy', 'girl', None],
+            'state': ['CA', 'NY', 'TX'],
+        })
+
+        top_groups = tbl._get_top_groups(df, ['gender'])
+        compiled = '{}'.format(
+            top_groups.compile(compile_kwargs={'literal_binds': True}))
+        self.assertIn("gender IN ('boy', 'girl')", compiled)
+        self.assertIn('gender IS NULL', compiled)
+
+        top_groups = tbl._get_top_groups(df, ['gender', 'state'])
+        compiled = '{}'.format(
+            top_groups.compile(compile_kwargs={'literal_binds': True}))
+        self.assertNotIn(' IN ', compiled)
+        self.assertIn("gender = 'boy' AND state = 'CA'", compiled)
+        self.assertIn("gender IS NULL AND state = 'TX'", compiled)
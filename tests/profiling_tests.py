@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import threading
+import time
+import unittest
+
+from mock import patch
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import profiling
+
+
+def busy_loop(seconds):
+    end = time.time() + seconds
+    while time.time() < end:
+        pass
+
+
+class ProfilingTestCase(unittest.TestCase):
+
+    def test_sampling_profiler(self):
+        profiler = profiling.SamplingProfiler(
+            threading.current_thread().ident, interval=0.001)
+        profiler.start()
+        busy_loop(0.1)
+        profiler.stop()
+        self.assertTrue(profiler.samples)
+        lines = profiler.collapsed().splitlines()
+        self.assertTrue(any(
+            'busy_loop (profiling_tests.py' in line for line in lines))
+        for line in lines:
+            stack, count = line.rsplit(' ', 1)
+            self.assertGreater(int(count), 0)
+
+    def test_profiled(self):
+        with patch.object(profiling, 'results_backend', SimpleCache()), \
+                patch.dict(profiling.config, {
+                    'SQLLAB_PROFILING_INTERVAL': 0.001,
+                    'CACHE_DEFAULT_TIMEOUT': 60,
+                }):
+            with profiling.profiled(1, enabled=False):
+                busy_loop(0.01)
+            self.assertIsNone(profiling.load(1))
+
+            with profiling.profiled(1):
+                busy_loop(0.1)
+            self.assertIn('busy_loop', profiling.load(1))
+
+    def test_should_profile(self):
+        with patch.dict(
+                profiling.config, {'SQLLAB_PROFILING_SAMPLE_RATE': 0}):
+            self.assertTrue(profiling.should_profile(True))
+            self.assertFalse(profiling.should_profile())
+        with patch.dict(
+                profiling.config, {'SQLLAB_PROFILING_SAMPLE_RATE': 1}):
+            self.assertTrue(profiling.should_profile())
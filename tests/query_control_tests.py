@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from mock import Mock, patch
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import query_control
+from superset.models.sql_lab import Query
+from superset.utils import QueryStatus
+
+
+class QueryMonitorTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.query = Query(id=1, status=QueryStatus.RUNNING, progress=0)
+        self.session = Mock()
+        self.patches = [
+            patch.object(query_control, 'results_backend', SimpleCache()),
+            patch.dict(query_control.config, {
+                'SQLLAB_PROGRESS_UPDATE_INTERVAL': 5,
+                'SQLLAB_STATUS_CHECK_INTERVAL': 30,
+            }),
+            patch.object(query_control.time, 'time', return_value=100),
+        ]
+        for p in self.patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.monitor = query_control.QueryMonitor(self.query, self.session)
+
+    def test_stop_is_signaled_through_the_results_backend(self):
+        self.assertFalse(self.monitor.should_stop())
+        query_control.request_stop(Mock(id=1, status=QueryStatus.STOPPED))
+        self.assertTrue(self.monitor.should_stop())
+        self.assertEquals(QueryStatus.STOPPED, self.query.status)
+        # the metadata database wasn't queried
+        self.session.query.assert_not_called()
+
+    def test_status_is_checked_in_the_database_periodically(self):
+        status = self.session.query.return_value.filter.return_value.scalar
+        status.return_value = QueryStatus.TIMED_OUT
+        self.assertFalse(self.monitor.should_stop())
+        query_control.time.time.return_value = 130
+        self.assertTrue(self.monitor.should_stop())
+        self.assertEquals(QueryStatus.TIMED_OUT, self.query.status)
+
+    def test_progress_updates_are_coalesced(self):
+        self.monitor.set_progress(10)
+        self.monitor.flush()
+        self.monitor.set_progress(20)
+        self.monitor.flush()
+        self.session.commit.assert_not_called()
+        self.assertEquals(20, self.query.progress)
+
+        query_control.time.time.return_value = 105
+        self.monitor.flush()
+        self.assertEquals(1, self.session.commit.call_count)
+
+        # nothing new to write
+        self.monitor.flush(force=True)
+        self.assertEquals(1, self.session.commit.call_count)
+
+        self.monitor.update(tracking_url='http://tracking')
+        self.monitor.flush(force=True)
+        self.assertEquals(2, self.session.commit.call_count)
+
+
+class QueryChangesTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.redis = Mock()
+        patcher = patch.object(
+            query_control, 'get_redis', return_value=self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_changes_are_published_on_commit(self):
+        session = Mock(info={})
+        with patch.object(
+                query_control, 'object_session', return_value=session):
+            query_control.collect_change(None, None, Query(user_id=1))
+            query_control.collect_change(None, None, Query(user_id=1))
+            query_control.collect_change(None, None, Query(user_id=2))
+        self.redis.publish.assert_not_called()
+
+        query_control.notify_changes(session)
+        self.assertEquals(2, self.redis.publish.call_count)
+        self.redis.publish.assert_any_call(query_control.changes_channel(1), 1)
+        self.redis.publish.assert_any_call(query_control.changes_channel(2), 1)
+
+        self.redis.publish.reset_mock()
+        query_control.notify_changes(session)
+        self.redis.publish.assert_not_called()
+
+    def test_changes_rolled_back_are_not_published(self):
+        session = Mock(info={})
+        with patch.object(
+                query_control, 'object_session', return_value=session):
+            query_control.collect_change(None, None, Query(user_id=1))
+        query_control.discard_changes(session)
+        query_control.notify_changes(session)
+        self.redis.publish.assert_not_called()
+
+    def test_changes_recorded_explicitly_are_published(self):
+        session = Mock(info={})
+        query_control.record_change(session, 1)
+        query_control.record_change(session, None)
+        query_control.notify_changes(session)
+        self.redis.publish.assert_called_once_with(
+            query_control.changes_channel(1), 1)
+
+    def test_listener_waits_for_a_change(self):
+        pubsub = self.redis.pubsub.return_value
+        pubsub.get_message.return_value = {'data': 1}
+        with query_control.listen_changes(1) as listener:
+            pubsub.subscribe.assert_called_with(query_control.changes_channel(1))
+            self.assertTrue(listener.wait(1))
+        pubsub.close.assert_called_once_with()
+
+        with query_control.listen_changes(1, enabled=False) as listener:
+            self.assertIsNone(listener)
@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+import unittest
+
+from mock import patch
+import pandas as pd
+from werkzeug.contrib.cache import SimpleCache
+
+from superset import results_store, utils
+
+
+class ResultsStoreTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SimpleCache()
+        patcher = patch.object(results_store, 'results_backend', self.backend)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        config_patcher = patch.dict(
+            results_store.config, {'RESULTS_BACKEND_CHUNK_SIZE': 2})
+        config_patcher.start()
+        self.addCleanup(config_patcher.stop)
+
+        self.df = pd.DataFrame({
+            'a': [1, 2, 3, 4, 5],
+            'b': ['v', 'w', 'x', 'y', None],
+        }, columns=['a', 'b'])
+        results_store.store('key', {'status': 'success'}, self.df, 60)
+        self.header = results_store.load_header(self.backend.get('key'))
+
+    def test_header(self):
+        self.assertEqual(self.header['status'], 'success')
+        self.assertEqual(self.header['rows'], 5)
+        self.assertEqual(self.header['chunks'], 3)
+        self.assertNotIn('data', self.header)
+
+    def test_read_rows_pages_across_chunks(self):
+        self.assertEqual(
+            results_store.read_rows('key', self.header, offset=1, limit=2),
+            [{'a': 2, 'b': 'w'}, {'a': 3, 'b': 'x'}],
+        )
+        self.assertEqual(
+            results_store.read_rows(
+                'key', self.header, offset=3, columnar=True),
+            {'a': [4, 5], 'b': ['y', None]},
+        )
+        self.assertEqual(
+            results_store.read_rows('key', self.header, offset=10), [])
+
+    def test_read_rows_only_fetches_needed_chunks(self):
+        self.backend.delete(results_store.chunk_key('key', 0))
+        self.assertEqual(
+            results_store.read_rows('key', self.header, offset=4),
+            [{'a': 5, 'b': None}],
+        )
+        with self.assertRaises(KeyError):
+            results_store.read_rows('key', self.header)
+
+    def test_chunks_available(self):
+        self.assertTrue(results_store.chunks_available('key', self.header))
+        self.backend.delete(results_store.chunk_key('key', 2))
+        self.assertFalse(results_store.chunks_available('key', self.header))
+
+    def test_iter_csv(self):
+        csv = ''.join(results_store.iter_csv('key', self.header))
+        self.assertEqual(csv, 'a,b\n1,v\n2,w\n3,x\n4,y\n5,\n')
+
+    def test_legacy_blob(self):
+        payload = {
+            'status': 'success',
+            'columns': [{'name': 'a'}],
+            'data': [{'a': 1}, {'a': 2}],
+        }
+        blob = utils.zlib_compress(json.dumps(payload))
+        header = results_store.load_header(blob)
+        self.assertEqual(
+            results_store.read_rows('legacy', header, offset=1), [{'a': 2}])
+        self.assertEqual(
+            ''.join(results_store.iter_csv('legacy', header)), 'a\n1\n2\n')
+
+    def test_chunk_writer(self):
+        writer = results_store.ChunkWriter('stream', 60)
+        writer.write(self.df.iloc[:3])
+        # rows short of a full chunk are held until the next batch
+        self.assertEqual(writer.chunks, 1)
+        writer.write(self.df.iloc[3:])
+        writer.close({'status': 'success'})
+        header = results_store.load_header(self.backend.get('stream'))
+        self.assertEqual(header['rows'], 5)
+        self.assertEqual(header['chunks'], 3)
+        self.assertEqual(
+            results_store.read_rows('stream', header),
+            results_store.read_rows('key', self.header),
+        )
+
+    def test_iter_csv_without_rows(self):
+        results_store.store('empty', {'status': 'success'}, self.df.iloc[:0], 60)
+        header = results_store.load_header(self.backend.get('empty'))
+        self.assertEqual(
+            ''.join(results_store.iter_csv('empty', header)), 'a,b\n')
+
+    def test_chunk_writer_abort(self):
+        writer = results_store.ChunkWriter('stream', 60)
+        writer.write(self.df)
+        self.assertEqual(writer.chunks, 2)
+        writer.abort()
+        self.assertEqual(writer.chunks, 0)
+        self.assertIsNone(self.backend.get(results_store.chunk_key('stream', 0)))
+        self.assertIsNone(self.backend.get(results_store.chunk_key('stream', 1)))
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime, timedelta
+import unittest
+
+from mock import patch
+import sqlalchemy as sa
+
+from superset import db, retention
+
+
+class RetentionTestCase(unittest.TestCase):
+
+    def setUp(self):
+        # a table of its own, pruning logs would delete the rows of the
+        # other tests
+        self.table = sa.Table(
+            'retention_test', sa.MetaData(),
+            sa.Column('id', sa.Integer, primary_key=True),
+            sa.Column('dttm', sa.DateTime),
+        )
+        self.table.create(db.engine)
+        self.addCleanup(self.table.drop, db.engine)
+        patcher = patch.dict(
+            retention.TIME_COLUMNS, {'retention_test': self.table.c.dttm})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        now = datetime.utcnow()
+        db.engine.execute(
+            self.table.insert(),
+            [{'dttm': now - timedelta(days=days)} for days in (100, 90, 80, 1)])
+
+    def count_remaining(self):
+        return db.session.execute(
+            sa.select([sa.func.count()]).select_from(self.table)).scalar()
+
+    def test_prune_archives_and_deletes_in_batches(self):
+        with patch.object(retention, 'write_archive') as write_archive:
+            deleted = retention.prune_table(
+                db.session, 'retention_test', 30, batch_size=2, archive=True)
+        self.assertEquals(deleted, 3)
+        archived = [call[0][0] for call in write_archive.call_args_list]
+        self.assertTrue(all(len(df.index) <= 2 for df in archived))
+        self.assertEquals(deleted, sum(len(df.index) for df in archived))
+        self.assertEquals(1, self.count_remaining())
+
+    def test_prune_without_archive(self):
+        with patch.object(retention, 'write_archive') as write_archive:
+            retention.prune_table(
+                db.session, 'retention_test', 85, archive=False)
+        write_archive.assert_not_called()
+        self.assertEquals(2, self.count_remaining())
+
+    def test_no_archive_by_default(self):
+        with patch.object(retention, 'write_archive') as write_archive:
+            retention.prune_table(db.session, 'retention_test', 85)
+        write_archive.assert_not_called()
+
+    def test_month_start(self):
+        dttm = datetime(2018, 11, 15, 12, 30)
+        self.assertEquals(datetime(2018, 11, 1), retention.month_start(dttm))
+        self.assertEquals(
+            datetime(2019, 2, 1), retention.month_start(dttm, 3))
+        self.assertEquals('logs_p201902', retention.partition_name(
+            retention.month_start(dttm, 3)))
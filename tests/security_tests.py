@@ -67,6 +67,7 @@ class RolePermissionTests(SupersetTestCase):
         self.assertIn(('can_slice', 'Superset'), perm_set)
         self.assertIn(('can_explore', 'Superset'), perm_set)
         self.assertIn(('can_explore_json', 'Superset'), perm_set)
+        self.assertIn(('can_profile', 'Superset'), perm_set)
 
     def assert_can_alpha(self, perm_set):
         self.assert_can_all('SqlMetricInlineView', perm_set)
@@ -100,6 +101,7 @@ class RolePermissionTests(SupersetTestCase):
         self.assertIn(('can_sync_druid_source', 'Superset'), perm_set)
         self.assertIn(('can_override_role_permissions', 'Superset'), perm_set)
         self.assertIn(('can_approve', 'Superset'), perm_set)
+        self.assertIn(('can_query_profile', 'Superset'), perm_set)
 
     def test_is_admin_only(self):
         self.assertFalse(security_manager.is_admin_only(
@@ -120,6 +122,9 @@ class RolePermissionTests(SupersetTestCase):
         self.assertTrue(security_manager.is_admin_only(
             security_manager.find_permission_view_menu(
                 'can_approve', 'Superset')))
+        self.assertTrue(security_manager.is_admin_only(
+            security_manager.find_permission_view_menu(
+                'can_query_profile', 'Superset')))
         self.assertTrue(security_manager.is_admin_only(
             security_manager.find_permission_view_menu(
                 'all_database_access', 'all_database_access')))
@@ -175,3 +180,71 @@ class RolePermissionTests(SupersetTestCase):
 
         self.assert_cannot_gamma(granter_set)
         self.assert_cannot_alpha(granter_set)
+
+    def test_perms_snapshot(self):
+        user = security_manager.find_user('gamma')
+        expected = set()
+        for role in user.roles:
+            for perm in role.permissions:
+                expected.add((perm.permission.name, perm.view_menu.name))
+        self.assertEqual(security_manager.get_perms_snapshot(user), expected)
+
+    def test_perms_snapshot_invalidated_on_role_change(self):
+        user = security_manager.find_user('gamma')
+        role = security_manager.find_role('Gamma')
+        pvm = security_manager.find_permission_view_menu(
+            'can_show', 'TableModelView')
+        self.assertTrue(security_manager.can_access(
+            'can_show', 'TableModelView', user=user))
+
+        role.permissions.remove(pvm)
+        self.assertFalse(security_manager.can_access(
+            'can_show', 'TableModelView', user=user))
+
+        role.permissions.append(pvm)
+        security_manager.get_session.commit()
+        self.assertTrue(security_manager.can_access(
+            'can_show', 'TableModelView', user=user))
+
+    def test_set_role_only_syncs_differences(self):
+        role_name = 'set_role_test'
+        security_manager.set_role(role_name, security_manager.is_gamma_pvm)
+        expected = get_perm_tuples(role_name)
+        self.assertEqual(expected, get_perm_tuples('Gamma'))
+
+        role = security_manager.find_role(role_name)
+        role.permissions.append(security_manager.find_permission_view_menu(
+            'all_database_access', 'all_database_access'))
+        role.permissions.remove(security_manager.find_permission_view_menu(
+            'can_show', 'TableModelView'))
+        security_manager.get_session.commit()
+
+        security_manager.set_role(role_name, security_manager.is_gamma_pvm)
+        self.assertEqual(expected, get_perm_tuples(role_name))
+
+        security_manager.get_session.delete(security_manager.find_role(role_name))
+        security_manager.get_session.commit()
+
+    def test_create_missing_perms(self):
+        table = self.get_table_by_name('birth_names')
+        pvm = security_manager.find_permission_view_menu(
+            'datasource_access', table.get_perm())
+        security_manager.get_session.delete(pvm)
+        security_manager.get_session.commit()
+        self.assertIsNone(security_manager.find_permission_view_menu(
+            'datasource_access', table.get_perm()))
+
+        security_manager.create_missing_perms()
+        self.assertIsNotNone(security_manager.find_permission_view_menu(
+            'datasource_access', table.get_perm()))
+        self.assertIn(
+            ('datasource_access', table.get_perm()),
+            set(security_manager._query_pv_names()))
+
+    def test_query_view_menu_ids(self):
+        names = {'Superset', 'SQL Lab', 'no such view menu'}
+        view_menu_ids = security_manager._query_view_menu_ids(names, batch_size=2)
+        self.assertEqual(set(view_menu_ids), {'Superset', 'SQL Lab'})
+        self.assertEqual(
+            view_menu_ids['Superset'],
+            security_manager.find_view_menu('Superset').id)
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Timing benchmarks for SupersetQuery, see viz_benchmark_tests"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import time
+import unittest
+
+from superset import sql_parse
+from .utils import BENCHMARK_MAX_SECONDS, RUN_BENCHMARKS
+
+
+def generated_sql(size=50 * 1024):
+    """A multi statement script of about ``size`` characters"""
+    statements = []
+    length = 0
+    i = 0
+    while length < size:
+        statement = (
+            'SELECT a.col_{i}, b.col_{i}, SUM(c.metric) AS total_{i}\n'
+            'FROM schema_{i}.table_a AS a\n'
+            'JOIN table_b_{i} AS b ON a.id = b.a_id\n'
+            'LEFT JOIN (SELECT id, metric FROM table_c WHERE x > {i}) AS c\n'
+            '  ON c.id = b.c_id\n'
+            "WHERE a.ds > '2018-01-01' AND b.flag IN (1, 2, 3)\n"
+            'GROUP BY 1, 2;\n'
+        ).format(i=i)
+        statements.append(statement)
+        length += len(statement)
+        i += 1
+    return ''.join(statements)
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'SUPERSET_RUN_BENCHMARKS is not set')
+class SupersetQueryBenchmark(unittest.TestCase):
+
+    def test_parse(self):
+        sql = generated_sql()
+        sql_parse.parse_cache.remove()
+
+        start = time.time()
+        query = sql_parse.SupersetQuery(sql)
+        query.is_select()
+        parse_duration = time.time() - start
+
+        start = time.time()
+        query = sql_parse.SupersetQuery(sql)
+        query.tables
+        query.is_select()
+        query.statements
+        cached_duration = time.time() - start
+
+        logging.info(
+            'Parsing {} characters of SQL took {:.3f}s, {:.6f}s cached'.format(
+                len(sql), parse_duration, cached_duration))
+        self.assertLess(parse_duration, BENCHMARK_MAX_SECONDS)
+        self.assertLess(cached_duration, parse_duration / 10)
@@ -298,3 +298,25 @@ class SupersetTestCase(unittest.TestCase):
 
         query = 'SELECT * FROM t1; SELECT * FROM t2;'
         self.assertEquals({'t1', 't2'}, self.extract_tables(query))
+
+    def test_statements(self):
+        query = sql_parse.SupersetQuery('SELECT * FROM t1;\nSELECT * FROM t2;\n')
+        self.assertEquals(
+            ['SELECT * FROM t1', 'SELECT * FROM t2'], query.statements)
+        self.assertTrue(query.is_select())
+
+    def test_is_select_multistatement(self):
+        query = sql_parse.SupersetQuery('SELECT * FROM t1; DELETE FROM t2')
+        self.assertFalse(query.is_select())
+        self.assertEquals({'t1', 't2'}, query.tables)
+
+    def test_parse_cache(self):
+        sql_parse.parse_cache.remove()
+        query = 'SELECT * FROM t1 JOIN t2 ON t1.a = t2.a'
+        self.assertEquals({'t1', 't2'}, self.extract_tables(query))
+        hits = sql_parse.parse_cache.hits
+        self.assertEquals({'t1', 't2'}, self.extract_tables(query))
+        self.assertEquals(hits + 1, sql_parse.parse_cache.hits)
+        self.assertEquals(1, len(sql_parse.parse_cache))
+        self.assertNotEqual(
+            sql_parse.parse_key(query), sql_parse.parse_key(query + ' '))
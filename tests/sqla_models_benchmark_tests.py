@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Timing benchmarks for the SQL generation of SqlaTable, see
+viz_benchmark_tests"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import time
+import unittest
+
+import pandas as pd
+
+from superset.connectors.sqla.models import SqlaTable, TableColumn
+from superset.models.core import Database
+from .utils import BENCHMARK_MAX_SECONDS, RUN_BENCHMARKS
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'SUPERSET_RUN_BENCHMARKS is not set')
+class TopGroupsBenchmark(unittest.TestCase):
+
+    groups = 1000
+
+    def setUp(self):
+        self.table = SqlaTable(
+            table_name='benchmark',
+            database=Database(
+                sqlalchemy_uri='druid://localhost:8082/druid/v2/sql/'),
+            columns=[
+                TableColumn(column_name='dim_a'),
+                TableColumn(column_name='dim_b'),
+            ],
+        )
+        self.df = pd.DataFrame({
+            'dim_a': ['value_{}'.format(i) for i in range(self.groups)],
+            'dim_b': list(range(self.groups)),
+        })
+
+    def benchmark(self, dimensions):
+        # the prequery only runs for engines without inner joins, Druid SQL
+        self.assertFalse(self.table.database.db_engine_spec.inner_joins)
+        start = time.time()
+        top_groups = self.table._get_top_groups(self.df, dimensions)
+        sql = '{}'.format(
+            top_groups.compile(compile_kwargs={'literal_binds': True}))
+        duration = time.time() - start
+        logging.info(
+            'Top groups filter on {} for {} groups: {:.3f}s, {} chars'.format(
+                ', '.join(dimensions), self.groups, duration, len(sql)))
+        self.assertLess(duration, BENCHMARK_MAX_SECONDS)
+        return sql
+
+    def test_in(self):
+        sql = self.benchmark(['dim_a'])
+        self.assertIn('IN', sql)
+
+    def test_or_of_ands(self):
+        sql = self.benchmark(['dim_a', 'dim_b'])
+        self.assertNotIn(' IN ', sql)
@@ -10,8 +10,9 @@ import json
 import unittest
 
 from flask_appbuilder.security.sqla import models as ab_models
+from mock import Mock, patch
 
-from superset import db, security_manager, utils
+from superset import app, db, query_control, security_manager, utils
 from superset.dataframe import SupersetDataFrame
 from superset.db_engine_specs import BaseEngineSpec
 from superset.models.sql_lab import Query
@@ -122,6 +123,62 @@ class SqlLabTests(SupersetTestCase):
         # Redirects to the login page
         self.assertEquals(403, resp.status_code)
 
+    def test_queries_endpoint_times_out_stale_queries(self):
+        self.run_some_queries()
+        query = db.session.query(Query).filter_by(client_id='client_id_1').one()
+        query.status = utils.QueryStatus.RUNNING
+        query.start_time = utils.now_as_float() - 1000 * (
+            app.config.get('SQLLAB_ASYNC_TIME_LIMIT_SEC') + 60)
+        db.session.commit()
+
+        self.login('admin')
+        redis = Mock()
+        with patch.object(query_control, 'get_redis', return_value=redis):
+            data = self.get_json_resp('/superset/queries/0')
+        self.assertEquals(
+            utils.QueryStatus.TIMED_OUT, data['client_id_1']['state'])
+        # the bulk update is notified all the same
+        redis.publish.assert_any_call(
+            query_control.changes_channel(query.user_id), 1)
+        status = (
+            db.session.query(Query.status)
+            .filter_by(client_id='client_id_1')
+            .scalar()
+        )
+        self.assertEquals(utils.QueryStatus.TIMED_OUT, status)
+
+    def test_poll_queries_endpoint(self):
+        self.run_some_queries()
+        resp = self.client.get('/superset/poll_queries/?cursor=0')
+        self.assertEquals(403, resp.status_code)
+
+        self.login('admin')
+        data = self.get_json_resp('/superset/poll_queries/?cursor=0')
+        self.assertEquals(2, len(data['queries']))
+
+        changed_on = datetime(2100, 1, 1, 12, 0, 0, 250)
+        query = db.session.query(Query).filter_by(client_id='client_id_1').one()
+        query.changed_on = changed_on
+        db.session.commit()
+        data = self.get_json_resp('/superset/poll_queries/?cursor=0')
+        cursor = data['cursor']
+        self.assertEquals(
+            changed_on, utils.EPOCH + timedelta(microseconds=cursor))
+
+        # the queries changed at the cursor time are returned again
+        url = '/superset/poll_queries/?cursor={}&timeout=1'.format(cursor)
+        data = self.get_json_resp(url)
+        self.assertEquals(['client_id_1'], list(data['queries']))
+        self.assertEquals(cursor, data['cursor'])
+
+        query = db.session.query(Query).filter_by(client_id='client_id_3').one()
+        query.changed_on = changed_on + timedelta(seconds=1)
+        db.session.commit()
+        data = self.get_json_resp(url)
+        self.assertEquals(
+            {'client_id_1', 'client_id_3'}, set(data['queries']))
+        self.assertLess(cursor, data['cursor'])
+
     def test_search_query_on_db_id(self):
         self.run_some_queries()
         self.login('admin')
@@ -196,6 +253,25 @@ class SqlLabTests(SupersetTestCase):
         data = json.loads(resp)
         self.assertEquals(2, len(data))
 
+    def test_search_query_pagination(self):
+        self.run_some_queries()
+        self.login('admin')
+        resp = self.client.get('/superset/search_queries?limit=2')
+        page = json.loads(resp.data.decode('utf-8'))
+        self.assertEquals(2, len(page))
+        cursor = resp.headers['X-Next-Cursor']
+
+        resp = self.client.get(
+            '/superset/search_queries?limit=2&after={}'.format(cursor))
+        next_page = json.loads(resp.data.decode('utf-8'))
+        self.assertEquals(1, len(next_page))
+        self.assertNotIn('X-Next-Cursor', resp.headers)
+        self.assertEquals(
+            3, len({q['serverId'] for q in page + next_page}))
+
+        resp = self.client.get('/superset/search_queries?after=oops')
+        self.assertEquals(400, resp.status_code)
+
     def test_alias_duplicate(self):
         self.run_sql(
             'SELECT username as col, id as col, username FROM ab_user',
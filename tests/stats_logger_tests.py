@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from mock import Mock, patch
+
+from superset.stats_logger import Histogram, HistogramStatsLogger
+
+
+class HistogramTestCase(unittest.TestCase):
+
+    def test_percentiles(self):
+        histogram = Histogram(sub_buckets=32)
+        for value in range(1, 1001):
+            histogram.record(value)
+        data = histogram.data()
+        self.assertEquals(1000, data['count'])
+        self.assertEquals(500.5, data['mean'])
+        self.assertEquals(1, data['min'])
+        self.assertEquals(1000, data['max'])
+        for percent, expected in ((50, 500), (90, 900), (99, 990)):
+            self.assertAlmostEqual(
+                expected, histogram.percentile(percent),
+                delta=expected / 32)
+        self.assertEquals(1000, histogram.percentile(100))
+
+    def test_buckets_grow_with_values(self):
+        histogram = Histogram(sub_buckets=32)
+        self.assertEquals(5, histogram.bucket(5.5))
+        self.assertEquals(1, histogram.width(31))
+        self.assertEquals(2, histogram.width(64))
+        self.assertEquals(992, histogram.bucket(1000))
+        self.assertIsNone(histogram.percentile(50))
+
+
+class HistogramStatsLoggerTestCase(unittest.TestCase):
+
+    @patch('superset.stats_logger.timeit.default_timer')
+    def test_timer(self, timer):
+        delegate = Mock()
+        stats_logger = HistogramStatsLogger(delegate)
+        timer.side_effect = [10, 10.25]
+        with stats_logger.timer('query'):
+            pass
+        stats_logger.incr('hit')
+        stats_logger.gauge('size', 3)
+
+        delegate.timing.assert_called_once_with('query', 250)
+        delegate.incr.assert_called_once_with('hit')
+        data = stats_logger.data()
+        self.assertEquals({'hit': 1}, data['counters'])
+        self.assertEquals({'size': 3}, data['gauges'])
+        self.assertEquals(1, data['timings']['query']['count'])
+        self.assertEquals(250, data['timings']['query']['max'])
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import unittest
+
+from mock import patch
+
+from superset import tracing
+from superset.models.sql_lab import Query
+
+
+class TracingTestCase(unittest.TestCase):
+
+    def test_disabled(self):
+        with patch.dict(tracing.config, {'TRACING_ENABLED': False}):
+            with tracing.trace() as trace:
+                self.assertIsNone(trace)
+                self.assertIs(tracing.NULL_SPAN, tracing.span('execute'))
+                self.assertIsNone(tracing.pop_spans())
+
+    def test_spans(self):
+        with patch.dict(tracing.config, {'TRACING_ENABLED': True}):
+            with tracing.trace() as trace:
+                with tracing.span('query'):
+                    with tracing.span('execute'):
+                        pass
+                    # a nested trace joins the active one
+                    with tracing.trace() as nested:
+                        self.assertIs(trace, nested)
+                spans = tracing.pop_spans()
+                self.assertEquals([], trace.spans)
+            self.assertIsNone(tracing.current_trace())
+        self.assertEquals(
+            [('execute', 1), ('query', 0)],
+            [(span['name'], span['depth']) for span in spans])
+        self.assertTrue(all(span['duration_ms'] >= 0 for span in spans))
+
+    def test_traced(self):
+        @tracing.traced
+        def execute():
+            with tracing.span('execute'):
+                pass
+            return tracing.pop_spans()
+
+        with patch.dict(tracing.config, {'TRACING_ENABLED': True}):
+            self.assertEquals(['execute'], [s['name'] for s in execute()])
+
+    def test_query_timings(self):
+        query = Query()
+        self.assertEquals([], query.get_timings())
+        query.add_timings(None)
+        self.assertIsNone(query.timings)
+        query.add_timings([{'name': 'render_template', 'duration_ms': 1}])
+        query.add_timings([{'name': 'execute', 'duration_ms': 2}])
+        self.assertEquals(
+            ['render_template', 'execute'],
+            [span['name'] for span in query.get_timings()])
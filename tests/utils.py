@@ -5,10 +5,17 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import json
+import os
 from os import path
 
 FIXTURES_DIR = 'tests/fixtures'
 
+# Benchmarks are slow by design and only run when explicitly asked for
+RUN_BENCHMARKS = bool(os.environ.get('SUPERSET_RUN_BENCHMARKS'))
+BENCHMARK_ROWS = int(os.environ.get('SUPERSET_BENCHMARK_ROWS', 1000000))
+BENCHMARK_MAX_SECONDS = float(
+    os.environ.get('SUPERSET_BENCHMARK_MAX_SECONDS', 60))
+
 
 def load_fixture(fixture_file_name):
     with open(path.join(FIXTURES_DIR, fixture_file_name)) as fixture_file:
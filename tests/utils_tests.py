@@ -6,16 +6,20 @@ from __future__ import unicode_literals
 
 from datetime import date, datetime, time, timedelta
 from decimal import Decimal
+import json
+import threading
 import unittest
 import uuid
 
 from mock import patch
 import numpy
+import pandas as pd
 
 from superset.exceptions import SupersetException
 from superset.utils import (
-    base_json_conv, datetime_f, json_int_dttm_ser, json_iso_dttm_ser,
-    JSONEncodedDict, memoized, merge_extra_filters, merge_request_params,
+    AsyncBatcher, base_json_conv, datetime_f, df_to_columnar, json_dumps_columnar,
+    json_int_dttm_ser, json_iso_dttm_ser, JSONEncodedDict, LRUCache, memoized,
+    merge_extra_filters, merge_request_params,
     parse_human_timedelta, validate_json, zlib_compress, zlib_decompress_to_string,
 )
 
@@ -51,6 +55,38 @@ class UtilsTestCase(unittest.TestCase):
         assert isinstance(base_json_conv(Decimal('1.0')), float) is True
         assert isinstance(base_json_conv(uuid.uuid4()), str) is True
 
+    def test_df_to_columnar(self):
+        df = pd.DataFrame({
+            'ints': [1, 2, 9007199254740993],
+            'floats': [1.5, numpy.nan, numpy.inf],
+            'dttm': [datetime(2020, 1, 1), pd.NaT, datetime(1970, 1, 1)],
+            'strings': ['a', None, 'c'],
+        }, columns=['ints', 'floats', 'dttm', 'strings'])
+        self.assertEquals(df_to_columnar(df), {
+            'columns': ['ints', 'floats', 'dttm', 'strings'],
+            'data': {
+                'ints': [1, 2, '9007199254740993'],
+                'floats': [1.5, None, None],
+                'dttm': [1577836800000.0, None, 0.0],
+                'strings': ['a', None, 'c'],
+            },
+        })
+        self.assertEquals(
+            df_to_columnar(df, iso_dates=True)['data']['dttm'],
+            ['2020-01-01T00:00:00', None, '1970-01-01T00:00:00'])
+
+    def test_json_dumps_columnar(self):
+        payload = {
+            'data': {'a': [1, None]},
+            'dttm': datetime(2020, 1, 1),
+            'nan': numpy.nan,
+        }
+        self.assertEquals(json.loads(json_dumps_columnar(payload)), {
+            'data': {'a': [1, None]},
+            'dttm': 1577836800000.0,
+            'nan': None,
+        })
+
     @patch('superset.utils.datetime')
     def test_parse_human_timedelta(self, mock_now):
         mock_now.return_value = datetime(2016, 12, 1)
@@ -331,3 +367,67 @@ class UtilsTestCase(unittest.TestCase):
         result8 = instance.test_method(1, 2, 3)
         self.assertEqual(instance.watcher, 4)
         self.assertEqual(result1, result8)
+
+    def test_lru_cache(self):
+        evicted = []
+        cache = LRUCache(maxsize=2, on_evict=evicted.append)
+        self.assertEqual(cache.get_or_create('a', lambda: 1), 1)
+        self.assertEqual(cache.get_or_create('b', lambda: 2), 2)
+        self.assertEqual(cache.get_or_create('a', lambda: 10), 1)
+        self.assertEqual(cache.get_or_create('c', lambda: 3), 3)
+        self.assertEqual(evicted, [2])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (1, 3))
+
+        cache.remove(lambda key: key == 'a')
+        self.assertEqual(evicted, [2, 1])
+        cache.remove()
+        self.assertEqual(evicted, [2, 1, 3])
+        self.assertEqual(len(cache), 0)
+
+    @patch('superset.utils.timeit.default_timer')
+    def test_lru_cache_ttl(self, timer):
+        evicted = []
+        cache = LRUCache(ttl=10, on_evict=evicted.append)
+        timer.return_value = 0
+        cache.get_or_create('a', lambda: 1)
+        timer.return_value = 5
+        self.assertEqual(cache.get_or_create('a', lambda: 2), 1)
+        timer.return_value = 11
+        self.assertEqual(cache.get_or_create('a', lambda: 2), 2)
+        self.assertEqual(evicted, [1])
+
+    def test_async_batcher(self):
+        batches = []
+        batcher = AsyncBatcher(batches.append, batch_size=2, interval=0.1)
+        batcher.put([1, 2, 3])
+        batcher.join()
+        self.assertEqual([1, 2, 3], [item for batch in batches for item in batch])
+        self.assertTrue(all(len(batch) <= 2 for batch in batches))
+        self.assertEqual(0, batcher.dropped)
+
+    def test_async_batcher_drops_when_full(self):
+        release = threading.Event()
+        batcher = AsyncBatcher(
+            lambda batch: release.wait(), maxsize=1, batch_size=1,
+            put_timeout=0)
+        # at most one item is being flushed and one is queued
+        batcher.put([1, 2, 3, 4])
+        self.assertGreaterEqual(batcher.dropped, 2)
+        release.set()
+        batcher.join()
+
+    def test_async_batcher_close(self):
+        batches = []
+        batcher = AsyncBatcher(batches.append, batch_size=10, interval=0.2)
+        batcher.put([1, 2])
+        batcher.close()
+        self.assertEqual([[1, 2]], batches)
+
+        # gives up past exit_timeout
+        release = threading.Event()
+        batcher = AsyncBatcher(
+            lambda batch: release.wait(), batch_size=1, exit_timeout=0.1)
+        batcher.put([1])
+        batcher.close()
+        release.set()
@@ -0,0 +1,165 @@
+# -*- coding: utf-8 -*-
+"""Timing benchmarks for the ``get_data`` hot paths of the viz classes
+
+These are slow by design and only run when ``SUPERSET_RUN_BENCHMARKS``
+is set. The row count and the per viz time budget can be tuned through
+``SUPERSET_BENCHMARK_ROWS`` and ``SUPERSET_BENCHMARK_MAX_SECONDS``.
+"""
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import logging
+import time
+import unittest
+
+from mock import Mock
+import numpy as np
+import pandas as pd
+
+from superset.utils import DTTM_ALIAS
+import superset.viz as viz
+from .utils import BENCHMARK_MAX_SECONDS, BENCHMARK_ROWS, RUN_BENCHMARKS
+
+
+def synthetic_frame(rows=BENCHMARK_ROWS, groups=100):
+    """A frame with a time column, categorical and numerical columns"""
+    rs = np.random.RandomState(0)
+    codes = rs.randint(0, groups, rows)
+    return pd.DataFrame({
+        DTTM_ALIAS: pd.date_range('2000-01-01', periods=rows, freq='min'),
+        'source': pd.Series(codes).map('src_{}'.format),
+        'target': pd.Series(rs.randint(0, groups, rows)).map('tgt_{}'.format),
+        'metric1': rs.randint(0, 1000, rows),
+        'metric2': rs.random_sample(rows),
+        'metric3': rs.random_sample(rows),
+        'lonlat': pd.Series(codes).map('{0}.5, {0}.25'.format),
+        'geohash': pd.Series(codes).map(
+            lambda i: ('9q8yy', 'u4pru', 'dr5re', 'gcpvj')[i % 4]),
+    })
+
+
+@unittest.skipUnless(RUN_BENCHMARKS, 'SUPERSET_RUN_BENCHMARKS is not set')
+class VizGetDataBenchmark(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.df = synthetic_frame()
+
+    def benchmark(self, viz_type, form_data, columns, prepare=None):
+        df = self.df[columns].copy()
+        datasource = Mock()
+        datasource.type = 'table'
+        test_viz = viz.viz_types[viz_type](datasource, form_data)
+        if prepare:
+            prepare(test_viz)
+        start = time.time()
+        test_viz.get_data(df)
+        duration = time.time() - start
+        logging.info('get_data for {} on {} rows took {:.3f}s'.format(
+            viz_type, len(df.index), duration))
+        self.assertLess(duration, BENCHMARK_MAX_SECONDS)
+
+    def test_table(self):
+        self.benchmark(
+            'table',
+            {'metrics': ['metric1'], 'groupby': ['source']},
+            ['source', 'metric1'])
+
+    def test_bubble(self):
+        def prepare(test_viz):
+            test_viz.x_metric = 'metric1'
+            test_viz.y_metric = 'metric2'
+            test_viz.z_metric = 'metric3'
+            test_viz.series = 'source'
+        self.benchmark(
+            'bubble',
+            {'x': 'metric1', 'y': 'metric2', 'size': 'metric3'},
+            ['source', 'metric1', 'metric2', 'metric3'],
+            prepare)
+
+    def test_line(self):
+        self.benchmark(
+            'line',
+            {'metrics': ['metric1'], 'groupby': ['source']},
+            [DTTM_ALIAS, 'source', 'metric1'])
+
+    def test_dual_line(self):
+        self.benchmark(
+            'dual_line',
+            {'metric': 'metric1', 'metric_2': 'metric2'},
+            [DTTM_ALIAS, 'metric1', 'metric2'])
+
+    def test_paired_ttest(self):
+        self.benchmark(
+            'paired_ttest',
+            {'metrics': ['metric1'], 'groupby': ['source']},
+            [DTTM_ALIAS, 'source', 'metric1'])
+
+    def test_sankey(self):
+        self.benchmark(
+            'sankey',
+            {'metric': 'metric1', 'groupby': ['source', 'target']},
+            ['source', 'target', 'metric1'])
+
+    def test_directed_force(self):
+        self.benchmark(
+            'directed_force',
+            {'metric': 'metric1', 'groupby': ['source', 'target']},
+            ['source', 'target', 'metric1'])
+
+    def test_chord(self):
+        self.benchmark(
+            'chord',
+            {'metric': 'metric1', 'groupby': 'source', 'columns': 'target'},
+            ['source', 'target', 'metric1'])
+
+    def test_filter_box(self):
+        def prepare(test_viz):
+            test_viz.dataframes = {'source': self.df[['source', 'metric1']]}
+        self.benchmark(
+            'filter_box',
+            {'metric': 'metric1', 'groupby': ['source']},
+            ['source', 'metric1'],
+            prepare)
+
+    def test_word_cloud(self):
+        self.benchmark(
+            'word_cloud',
+            {'metric': 'metric1', 'series': 'source'},
+            ['source', 'metric1'])
+
+    def test_pie(self):
+        self.benchmark(
+            'pie',
+            {'metrics': ['metric1'], 'groupby': ['source']},
+            ['source', 'metric1'])
+
+    def test_deck_scatter_latlong(self):
+        self.benchmark(
+            'deck_scatter',
+            {
+                'spatial': {
+                    'type': 'latlong', 'lonCol': 'metric2', 'latCol': 'metric3'},
+                'point_radius_fixed': {'type': 'fix', 'value': 500},
+            },
+            ['metric2', 'metric3'])
+
+    def test_deck_scatter_delimited(self):
+        self.benchmark(
+            'deck_scatter',
+            {
+                'spatial': {'type': 'delimited', 'lonlatCol': 'lonlat'},
+                'point_radius_fixed': {'type': 'fix', 'value': 500},
+            },
+            ['lonlat'])
+
+    def test_deck_scatter_geohash(self):
+        self.benchmark(
+            'deck_scatter',
+            {
+                'spatial': {'type': 'geohash', 'geohashCol': 'geohash'},
+                'point_radius_fixed': {'type': 'fix', 'value': 500},
+            },
+            ['geohash'])
@@ -501,6 +501,24 @@ class PairedTTestTestCase(unittest.TestCase):
         self.assertEqual(data, expected)
 
 
+class BubbleVizTestCase(unittest.TestCase):
+    def test_get_data_keeps_null_groups(self):
+        test_viz = viz.BubbleViz(Mock(), {})
+        test_viz.x_metric = 'x_metric'
+        test_viz.y_metric = 'y_metric'
+        test_viz.z_metric = 'size_metric'
+        test_viz.series = 'name'
+        df = pd.DataFrame({
+            'name': ['a', None, 'b', 'a'],
+            'x_metric': [1, 2, 3, 4],
+            'y_metric': [1, 2, 3, 4],
+            'size_metric': [1, 2, 3, 4],
+        })
+        data = test_viz.get_data(df)
+        self.assertEquals(['a', None, 'b'], [s['key'] for s in data])
+        self.assertEquals([2, 1, 1], [len(s['values']) for s in data])
+
+
 class PartitionVizTestCase(unittest.TestCase):
 
     @patch('superset.viz.BaseViz.query_obj')